@@ -1,88 +1,295 @@
+import os
+import argparse
+import time
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import data_loader
+from impact_simulator import IMPACT_STORES_FILE, load_impact, format_dollars
+from instrumentation import stage, traced
+
+TARGET_STORE = 3000  # Store whose impact chart the interactive dashboard shows
+RECOMMENDATIONS_FILE = 'recommendations.csv'
+CHARTS_DIR = 'charts'
 
 # ==========================================
-# 1. SETUP: SIMULATE THE "BEFORE & AFTER" DATA
+# 1. SETUP: THE AGGREGATION CUBE
 # ==========================================
-# In a real dashboard, this comes from the Phase 2 Output. 
-# We manually create the dataframe here for the visual demo.
+# Every chart reads one precomputed cube at store x format x traffic x
+# category grain (sales, margin, shelf inches, SPLI), built once from the
+# regional data. The "before & after" numbers come from the logic engine's
+# recommendations, priced with the cube's category averages.
+
+@traced('dashboard.cube', rows=len)
+def build_cube(df_sales, df_plano, df_products, df_stores):
+    store_sku = df_sales.groupby(['store_id', 'sku_id'], observed=True)[['revenue', 'margin', 'units_sold']].sum().reset_index()
+    shelf = df_plano.merge(store_sku, on=['store_id', 'sku_id'], how='left').fillna({'revenue': 0, 'margin': 0, 'units_sold': 0})
+    shelf = shelf.merge(df_products[['sku_id', 'category', 'width_inches']], on='sku_id')
+    shelf['linear_inches'] = shelf['width_inches'] * shelf['facings']
+
+    cube = shelf.groupby(['store_id', 'category'], observed=True).agg(
+        revenue=('revenue', 'sum'), margin=('margin', 'sum'), units_sold=('units_sold', 'sum'),
+        linear_inches=('linear_inches', 'sum'), skus=('sku_id', 'size')).reset_index()
+    cube = cube.merge(df_stores[['store_id', 'format', 'traffic_profile']], on='store_id')
+    cube['spli'] = cube['revenue'] / cube['linear_inches']
+
+    # Weeks of history, to turn totals into weekly figures
+    cube.attrs['weeks'] = max(int(df_sales['day'].max()) - int(df_sales['day'].min()) + 1, 1) / 7
+    return cube[['store_id', 'format', 'traffic_profile', 'category',
+                 'revenue', 'margin', 'units_sold', 'linear_inches', 'skus', 'spli']]
+
+
+def load_cube():
+    df_sales, df_plano, df_products, df_stores = data_loader.load_all()
+    return build_cube(df_sales, df_plano, df_products, df_stores)
+
+
+def load_recommendations(path=RECOMMENDATIONS_FILE):
+    """The batch recommendations table, running the logic engine if it hasn't been written yet."""
+    if os.path.exists(path):
+        return pd.read_csv(path)
+    import logic_engine
+    df_sales, df_plano, df_products, _ = logic_engine.load_regional_data()
+    recs = logic_engine.run_batch(logic_engine.aggregate_store_sales(df_sales), df_plano, df_products)
+    recs['spli_days'] = logic_engine.sales_days(df_sales)
+    return recs
+
+
+@traced('dashboard.impact_frame')
+def impact_frame(recs, cube, df_products, store_id=None, category=None):
+    """
+    Before/after weekly revenue, margin and SPLI for a set of swaps.
+    Old: the deleted items' actual SPLI over the gap, per week of the period
+    it was scored on (spli_days), at each SKU's own unit margin. New: the
+    added items projected at their store x category average SPLI and margin
+    rate, per week of the cube's history.
+    """
+    recs = recs.dropna(subset=['add_sku_id'])
+    if store_id is not None:
+        recs = recs[recs['store_id'] == store_id]
+    if category is not None:
+        recs = recs[recs['category'] == category]
+
+    rates = cube.assign(margin_rate=cube['margin'] / cube['revenue'].where(cube['revenue'] > 0))
+    recs = recs.merge(rates[['store_id', 'category', 'spli', 'margin_rate']].astype({'category': str}),
+                      on=['store_id', 'category'], how='left')
+    margin_rate = recs['margin_rate'].fillna(0)
+    weeks = cube.attrs.get('weeks', 1)
+    # Recommendations written before spli_days existed were scored on the whole history
+    spli_days = recs['spli_days'] if 'spli_days' in recs.columns else pd.Series(np.nan, index=recs.index)
+    old_weeks = (spli_days.where(spli_days > 0) / 7).fillna(weeks)
+    prices = df_products.set_index('sku_id')
+    sku_margin_rate = (prices['unit_price'] - prices['unit_cost']) / prices['unit_price'].where(prices['unit_price'] > 0)
+    delete_margin_rate = recs['delete_sku_id'].map(sku_margin_rate).fillna(0)
 
-impact_data = {
-    'Metric': ['Weekly Revenue', 'Weekly Margin', 'Sales Per Linear Inch'],
-    'Old Assortment (Item 34)': [125.00, 35.00, 0.85], # The "Dog" we deleted
-    'New Assortment (Item 89)': [210.00, 95.00, 1.45]  # The "Star" we added
-}
+    old_revenue = recs['delete_spli'] * recs['gap_width'] / old_weeks
+    new_revenue = recs['spli'].fillna(0) * recs['add_linear_width'] / weeks
+    old_inches, new_inches = recs['gap_width'].sum(), recs['add_linear_width'].sum()
 
-df_impact = pd.DataFrame(impact_data)
+    return pd.DataFrame({
+        'Metric': ['Weekly Revenue', 'Weekly Margin', 'Weekly Sales Per Linear Inch'],
+        f'Old Assortment ({len(recs)} deletes)': [old_revenue.sum(), (old_revenue * delete_margin_rate).sum(),
+                                                  old_revenue.sum() / old_inches if old_inches else 0.0],
+        f'New Assortment ({len(recs)} adds)': [new_revenue.sum(), (new_revenue * margin_rate).sum(),
+                                               new_revenue.sum() / new_inches if new_inches else 0.0],
+    })
+
+
+def impact_caption(impact, store_id=None):
+    """One line of simulated margin lift (impact_simulator.py) for a store, or chain-wide."""
+    if impact is None:
+        return None
+    stores, chain = impact
+    if store_id is None:
+        stats = chain
+    else:
+        matches = stores[stores['store_id'] == store_id]
+        if matches.empty:
+            return None
+        stats = matches.iloc[0]
+    return (f"Simulated margin lift per {int(stats['days'])} days: {format_dollars(stats['margin_lift_mean'])} "
+            f"(P5 {format_dollars(stats['margin_lift_p5'])}, P95 {format_dollars(stats['margin_lift_p95'])})")
+
+
+def heatmap_frame(cube, index='category', columns='format'):
+    """SPLI pivot (total revenue / total shelf inches) over two cube dimensions."""
+    totals = cube.groupby([index, columns], observed=True)[['revenue', 'linear_inches']].sum()
+    return (totals['revenue'] / totals['linear_inches']).unstack(columns)
 
 # ==========================================
 # 2. VISUALIZATION 1: THE IMPACT ASSESSMENT (Bar Chart)
 # ==========================================
-def plot_impact_chart():
+def plot_impact_chart(df_impact, title='Projected Impact: Modular Optimization', ax=None, caption=None):
     # Set the style
     sns.set_theme(style="whitegrid")
-    
+
     # Reshape for plotting
     df_melted = df_impact.melt(id_vars="Metric", var_name="Scenario", value_name="Value")
-    
-    plt.figure(figsize=(10, 6))
-    
+
+    if ax is None:
+        plt.figure(figsize=(10, 6))
+        ax = plt.gca()
+
     # Create Bar Chart
     chart = sns.barplot(
-        data=df_melted, 
-        x="Metric", 
-        y="Value", 
-        hue="Scenario", 
-        palette=["#e74c3c", "#27ae60"] # Red for Old, Green for New
+        data=df_melted,
+        x="Metric",
+        y="Value",
+        hue="Scenario",
+        palette=["#e74c3c", "#27ae60"], # Red for Old, Green for New
+        ax=ax
     )
-    
+
     # Add Title and Labels
-    plt.title('Projected Impact: Modular Optimization (Store 3000)', fontsize=16, fontweight='bold')
-    plt.ylabel('Value ($)', fontsize=12)
-    plt.xlabel('')
-    
+    ax.set_title(title, fontsize=16, fontweight='bold')
+    ax.set_ylabel('Value ($)', fontsize=12)
+    ax.set_xlabel('')
+
     # Add value labels on bars
     for container in chart.containers:
         chart.bar_label(container, fmt='$%.2f', padding=3)
-        
-    plt.tight_layout()
-    plt.show()
+
+    # Monte Carlo range behind the projection, when the simulator has run
+    if caption:
+        ax.set_xlabel(caption, fontsize=11)
+    return ax
 
 # ==========================================
 # 3. VISUALIZATION 2: THE OPPORTUNITY HEATMAP
 # ==========================================
-def plot_market_heatmap():
+def plot_market_heatmap(heatmap_data, title='Efficiency Audit: Sales Per Linear Inch ($) by Format',
+                        xlabel='Store Format', ax=None):
     # This visual answers: "Which stores have the biggest 'Space Efficiency' problem?"
-    
-    # Mock aggregated data: Category Efficiency (Sales per Inch) by Store Format
-    heatmap_data = pd.DataFrame({
-        'Supercenter': [1.8, 2.1, 1.2, 0.9],
-        'Neighborhood Mkt': [1.4, 1.5, 0.8, 0.6],
-        'Express': [2.5, 1.9, 0.5, 0.4]
-    }, index=['Electronics', 'Personal Care', 'Home', 'Toys']) # Categories
-    
-    plt.figure(figsize=(8, 6))
-    
+
+    if ax is None:
+        plt.figure(figsize=(8, 6))
+        ax = plt.gca()
+
     # Create Heatmap
     sns.heatmap(
-        heatmap_data, 
-        annot=True, 
+        heatmap_data,
+        annot=True,
         cmap="RdYlGn", # Red (Bad) to Green (Good)
-        fmt=".1f", 
-        linewidths=.5
+        fmt=".1f",
+        linewidths=.5,
+        ax=ax
     )
-    
-    plt.title('Efficiency Audit: Sales Per Linear Inch ($) by Format', fontsize=14, fontweight='bold')
-    plt.ylabel('Category')
-    plt.xlabel('Store Format')
-    
-    plt.tight_layout()
-    plt.show()
-
-# Run the functions
-print("Generating Impact Charts...")
-plot_impact_chart()
-print("Generating Market Heatmap...")
-plot_market_heatmap()
\ No newline at end of file
+
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.set_ylabel('Category')
+    ax.set_xlabel(xlabel)
+    return ax
+
+# ==========================================
+# 4. HEADLESS BATCH RENDERING
+# ==========================================
+# One PNG per store (its impact + category SPLI against its format) or per
+# category (its impact + SPLI by format x traffic), rendered with the Agg
+# backend across a process pool. Workers receive the cube and recommendations
+# once, through the pool initializer.
+
+_WORKER = {}
+
+
+def _init_worker(cube, recs, df_products, out_dir, impact=None):
+    plt.switch_backend('Agg')
+    sns.set_theme(style="whitegrid")
+    _WORKER.update(cube=cube, recs=recs, products=df_products, out_dir=out_dir, impact=impact)
+
+
+def render_store(store_id):
+    cube, recs = _WORKER['cube'], _WORKER['recs']
+    store = cube[cube['store_id'] == store_id]
+    store_format = store['format'].iloc[0]
+    peers = heatmap_frame(cube[cube['format'] == store_format], index='category', columns='format')
+
+    fig, (left, right) = plt.subplots(1, 2, figsize=(16, 6))
+    plot_impact_chart(impact_frame(recs, cube, _WORKER['products'], store_id=store_id),
+                      f'Projected Impact: Store {store_id}', ax=left, caption=impact_caption(_WORKER['impact'], store_id))
+    comparison = pd.DataFrame({
+        f'Store {store_id}': store.set_index('category')['spli'],
+        f'{store_format} average': peers.iloc[:, 0]
+    }).dropna(subset=[f'Store {store_id}'])
+    comparison.plot.barh(ax=right, color=['#2980b9', '#95a5a6'])
+    right.set_title('Sales Per Linear Inch ($) by Category', fontsize=14, fontweight='bold')
+    right.set_ylabel('')
+
+    path = os.path.join(_WORKER['out_dir'], f"store_{store_id}.png")
+    fig.tight_layout()
+    fig.savefig(path, dpi=80)
+    plt.close(fig)
+    return path
+
+
+def render_category(category):
+    cube, recs = _WORKER['cube'], _WORKER['recs']
+    subset = cube[cube['category'] == category]
+
+    fig, (left, right) = plt.subplots(1, 2, figsize=(16, 6))
+    plot_impact_chart(impact_frame(recs, cube, _WORKER['products'], category=category),
+                      f'Projected Impact: {category}', ax=left)
+    plot_market_heatmap(heatmap_frame(subset, index='traffic_profile', columns='format'),
+                        title=f'{category}: Sales Per Linear Inch ($)', ax=right)
+    right.set_ylabel('Traffic Profile')
+
+    path = os.path.join(_WORKER['out_dir'], f"category_{category.replace(' ', '_')}.png")
+    fig.tight_layout()
+    fig.savefig(path, dpi=80)
+    plt.close(fig)
+    return path
+
+
+@traced('dashboard.render_batch', rows=len)
+def render_batch(cube, recs, df_products, out_dir=CHARTS_DIR, by='store', workers=None, impact=None):
+    """Writes one PNG per store (or category) into out_dir; returns the paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    if by == 'store':
+        render, keys = render_store, [int(s) for s in cube['store_id'].unique()]
+    else:
+        render, keys = render_category, [str(c) for c in cube['category'].unique()]
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cube, recs, df_products, out_dir, impact)) as pool:
+        return list(pool.map(render, keys, chunksize=max(len(keys) // (workers * 4), 1)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot the assortment impact and efficiency charts.")
+    parser.add_argument('--store', type=int, default=TARGET_STORE, help="Store for the interactive impact chart")
+    parser.add_argument('--recommendations', default=RECOMMENDATIONS_FILE)
+    parser.add_argument('--batch-dir', help="Headless mode: write one PNG per store/category into this directory")
+    parser.add_argument('--by', choices=['store', 'category'], default='store', help="What --batch-dir renders one PNG for")
+    parser.add_argument('--workers', type=int, help="Render processes for --batch-dir (default: all cores)")
+    parser.add_argument('--impact', nargs='?', const=IMPACT_STORES_FILE,
+                        help="Caption impact charts with impact_simulator.py lifts (default impact_stores.csv)")
+    args = parser.parse_args()
+
+    cube = load_cube()
+    df_products = data_loader.load_products()
+    recs = load_recommendations(args.recommendations)
+    impact = load_impact(args.impact) if args.impact else None
+
+    if args.batch_dir:
+        plt.switch_backend('Agg')
+        start = time.perf_counter()
+        paths = render_batch(cube, recs, df_products, args.batch_dir, args.by, args.workers, impact)
+        elapsed = time.perf_counter() - start
+        print(f"{len(paths):,} charts -> {args.batch_dir}/ in {elapsed:.1f}s ({len(paths) / max(elapsed, 1e-9):.1f} charts/sec)")
+    else:
+        # Run the functions
+        print("Generating Impact Charts...")
+        with stage('dashboard.render', chart='impact'):
+            plot_impact_chart(impact_frame(recs, cube, df_products, store_id=args.store),
+                              f'Projected Impact: Modular Optimization (Store {args.store})',
+                              caption=impact_caption(impact, args.store))
+            plt.tight_layout()
+        plt.show()
+        print("Generating Market Heatmap...")
+        with stage('dashboard.render', chart='heatmap'):
+            plot_market_heatmap(heatmap_frame(cube))
+            plt.tight_layout()
+        plt.show()
@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import resource
+import asyncio
+import subprocess
+from datetime import datetime
+import pandas as pd
+
+import data_generation
+import data_loader
+import data_warehouse
+import logic_engine
+import communication_agent
+
+# ==========================================
+# SCALE-TIERED PIPELINE BENCHMARK
+# ==========================================
+# Runs each MOE stage at a fixed-seed scale tier inside a scratch directory and
+# records wall time, peak memory and rows/sec per stage to a JSON file.
+# Every stage runs in its own Python process, so its peak RSS (including
+# native SQLite/Arrow allocations) is measured in isolation.
+# Results from two commits can be compared with --compare.
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+WORK_DIR = 'bench_data'
+RESULTS_DIR = 'bench_results'
+SEED = 42
+REGRESSION_THRESHOLD = 1.10  # Flag stages >10% slower (or hungrier) than the baseline
+MIN_REGRESSION_SECONDS = 0.5  # ...but ignore wall-time noise smaller than this
+
+TIERS = {
+    #          stores, products, days
+    'small':  (20, 1_000, 90),
+    'medium': (500, 20_000, 365),
+    'large':  (5_000, 100_000, 365),
+}
+
+STAGES = ['generate', 'warehouse', 'optimize', 'regional_query', 'comms']
+
+# Caches left by an earlier run; cleared so every run starts equally cold
+CACHE_ARTIFACTS = ['.snapshots', 'candidate_index.npz', 'spli_aggregates.npz']
+
+# ==========================================
+# 1. STAGES (run inside the tier's work directory)
+# ==========================================
+# Each returns the number of rows it processed; only the work itself is timed,
+# not interpreter start-up or imports.
+
+def stage_generate(stores, products, days):
+    rng, df_stores, df_products, df_plano = data_generation.generate_master_data(stores, products, SEED)
+    df_stores.to_csv('stores_regional.csv', index=False)
+    df_products.to_csv('products_regional.csv', index=False)
+    df_plano.to_csv('plano_regional.csv', index=False)
+    sales_days = data_generation.iter_sales_days(df_stores, df_products, df_plano, days,
+                                                 data_generation.START_DATE, rng)
+    # Partitions only: the flat CSV is impractical at the large tier
+    return data_generation.stream_sales(sales_days, csv_path=None)
+
+
+def stage_warehouse(stores, products, days):
+    _, rows = data_warehouse.load_warehouse(full=True)
+    return rows
+
+
+def stage_optimize(stores, products, days):
+    df_plano, df_products, _ = logic_engine.load_master_data()
+    store_sales = logic_engine.aggregate_store_sales(data_loader.load_sales())
+    recommendations = logic_engine.run_batch(store_sales, df_plano, df_products)
+    recommendations.to_csv(logic_engine.RECOMMENDATIONS_FILE, index=False)
+    return len(df_plano)  # Store x SKU rows scored
+
+
+def stage_regional_query(stores, products, days):
+    with open(os.path.join(CODE_DIR, 'regional_performance.txt')) as f:
+        sql = f.read()
+    conn = sqlite3.connect(data_warehouse.DB_PATH)
+    rows = conn.execute(sql).fetchall()
+    conn.close()
+    return len(rows)
+
+
+def stage_comms(stores, products, days):
+    df_recs = pd.read_csv(communication_agent.RECOMMENDATIONS_FILE)
+    _, written = asyncio.run(communication_agent.generate_comms(
+        df_recs, communication_agent.MockBackend(), cache_path=None))
+    return written
+
+
+def run_stage(name, tier):
+    """Runs one stage in this process and returns its measurements."""
+    stores, products, days = TIERS[tier]
+    stage = globals()[f"stage_{name}"]
+    start = time.perf_counter()
+    rows = stage(stores, products, days)
+    wall = time.perf_counter() - start
+    return {
+        'wall_s': round(wall, 4),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # KB on Linux
+        'rows': int(rows),
+        'rows_per_sec': round(rows / max(wall, 1e-9), 1),
+    }
+
+# ==========================================
+# 2. DRIVER
+# ==========================================
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=CODE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmark(tier, stages=STAGES, work_dir=WORK_DIR, trace=False):
+    stores, products, days = TIERS[tier]
+    tier_dir = os.path.abspath(os.path.join(work_dir, tier))
+    os.makedirs(tier_dir, exist_ok=True)
+    for artifact in CACHE_ARTIFACTS:
+        path = os.path.join(tier_dir, artifact)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    env = {**os.environ, 'PYTHONPATH': CODE_DIR + os.pathsep + os.environ.get('PYTHONPATH', '')}
+
+    results = {
+        'tier': tier, 'stores': stores, 'products': products, 'days': days, 'seed': SEED,
+        'commit': git_commit(), 'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        'stages': {}
+    }
+    for name in stages:
+        print(f"[{tier}] {name}...", flush=True)
+        # With trace=True every stage also writes an instrumentation trace next to the data
+        stage_env = {**env, 'MOE_TRACE': os.path.join(tier_dir, f"{name}.trace.json")} if trace else env
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-stage', name, '--tier', tier],
+                              cwd=tier_dir, env=stage_env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            raise RuntimeError(f"Stage '{name}' failed at tier '{tier}'")
+        # The stage's own prints come first; its measurements are the last line
+        stats = json.loads(proc.stdout.strip().splitlines()[-1])
+        results['stages'][name] = stats
+        print(f"    {stats['wall_s']:.2f}s, peak {stats['peak_rss_mb']:,.0f} MB, "
+              f"{stats['rows']:,} rows ({stats['rows_per_sec']:,.0f} rows/sec)")
+    return results
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Prints per-stage ratios against a baseline run; returns the regressed stages."""
+    regressions = []
+    print(f"\n{'stage':<16} {'wall (base -> now)':>24} {'ratio':>7} {'peak MB (base -> now)':>26} {'ratio':>7}")
+    for name, now in current['stages'].items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            continue
+        wall_ratio = now['wall_s'] / max(base['wall_s'], 1e-9)
+        mem_ratio = now['peak_rss_mb'] / max(base['peak_rss_mb'], 1e-9)
+        slower = wall_ratio > threshold and now['wall_s'] - base['wall_s'] > MIN_REGRESSION_SECONDS
+        flag = '  << REGRESSION' if slower or mem_ratio > threshold else ''
+        if flag:
+            regressions.append(name)
+        print(f"{name:<16} {base['wall_s']:>10.2f}s -> {now['wall_s']:>9.2f}s {wall_ratio:>6.2f}x "
+              f"{base['peak_rss_mb']:>11,.0f} -> {now['peak_rss_mb']:>10,.0f} {mem_ratio:>6.2f}x{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the MOE pipeline at fixed-seed scale tiers.")
+    parser.add_argument('--tier', choices=list(TIERS), default='small')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--work-dir', default=WORK_DIR, help="Scratch directory for the generated data")
+    parser.add_argument('--output', help="Results JSON (default bench_results/<tier>-<commit>.json)")
+    parser.add_argument('--trace', action='store_true', help="Write a <stage>.trace.json per stage into the work dir")
+    parser.add_argument('--compare', help="Baseline results JSON to compare against (exit 1 on regression)")
+    parser.add_argument('--run-stage', choices=STAGES, help=argparse.SUPPRESS)  # Internal: one stage, in-process
+    args = parser.parse_args()
+
+    if args.run_stage:
+        print(json.dumps(run_stage(args.run_stage, args.tier)))
+        sys.exit(0)
+
+    results = run_benchmark(args.tier, args.stages, args.work_dir, args.trace)
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.tier}-{results['commit']}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results -> {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results):
+            sys.exit(1)
@@ -0,0 +1,181 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# CANDIDATE INDEX
+# ==========================================
+# A prebuilt, persistable view of the catalog for replacement searches:
+#   * Each category's SKUs are kept sorted by width, with height/price/cost/score
+#     arrays alongside, so "fits in the gap" is a binary search.
+#   * For every distinct width boundary we keep the TOP_K best-scoring SKUs that
+#     fit, so a typical lookup only tests K SKUs against the store.
+#   * Store assortments are a packed bit matrix (store x SKU), so "not already
+#     in this store" is a single vectorized bit test.
+
+INDEX_FILE = 'candidate_index.npz'
+TOP_K = 8
+
+
+def frame_signature(*frames, extra=''):
+    """Content hash of the DataFrames an index (or cache) was built from."""
+    h = hashlib.sha1(extra.encode())
+    for df in frames:
+        h.update(','.join(map(str, df.columns)).encode())
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class CandidateIndex:
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        for name, arr in arrays.items():
+            setattr(self, name, arr)
+        self.categories = [str(c) for c in arrays['categories']]
+        self._category_pos = {c: i for i, c in enumerate(self.categories)}
+
+    # ------------------------------------------
+    # Build / persist
+    # ------------------------------------------
+    @classmethod
+    def build(cls, df_products, df_plano, score_column='unit_price', top_k=TOP_K):
+        sku_universe = np.sort(df_products['sku_id'].to_numpy().astype(np.int64))
+
+        # Catalog sorted by category, then width; ties ordered best score first
+        catalog = df_products.assign(_score=df_products[score_column]).sort_values(
+            ['category', 'width_inches', '_score', 'sku_id'], ascending=[True, True, False, True])
+        categories = catalog['category'].astype(str).to_numpy()
+        cat_names, cat_start = np.unique(categories, return_index=True)
+        cat_ptr = np.append(cat_start, len(catalog)).astype(np.int64)
+
+        sku_id = catalog['sku_id'].to_numpy().astype(np.int64)
+        width = catalog['width_inches'].to_numpy().astype(np.float64)
+        score = catalog['_score'].to_numpy().astype(np.float64)
+
+        # Width boundaries and the top-K fitting SKUs at each boundary
+        bound_ptr, bound_width, bound_end, topk = [0], [], [], []
+        for c in range(len(cat_names)):
+            lo, hi = cat_ptr[c], cat_ptr[c + 1]
+            widths, run_start = np.unique(width[lo:hi], return_index=True)
+            run_ends = np.append(run_start[1:], hi - lo)
+            best = np.empty(0, dtype=np.int64)
+            for w, start, end in zip(widths, run_start, run_ends):
+                pool = np.concatenate([best, np.arange(lo + start, lo + end)])
+                best = pool[np.lexsort((sku_id[pool], -score[pool]))][:top_k]
+                bound_width.append(w)
+                bound_end.append(lo + end)
+                topk.append(np.pad(best, (0, top_k - len(best)), constant_values=-1))
+            bound_ptr.append(len(bound_width))
+
+        # Packed store x SKU assortment bitmap
+        store_ids = np.unique(df_plano['store_id'].to_numpy().astype(np.int64))
+        rows = np.searchsorted(store_ids, df_plano['store_id'].to_numpy())
+        cols = np.searchsorted(sku_universe, df_plano['sku_id'].to_numpy())
+        bitmap = np.zeros((len(store_ids), (len(sku_universe) + 7) // 8), dtype=np.uint8)
+        np.bitwise_or.at(bitmap, (rows, cols >> 3), (0x80 >> (cols & 7)).astype(np.uint8))
+
+        return cls({
+            'categories': cat_names.astype(str),
+            'cat_ptr': cat_ptr,
+            'sku_id': sku_id,
+            'sku_col': np.searchsorted(sku_universe, sku_id),
+            'width': width,
+            'height': catalog['height_inches'].to_numpy().astype(np.float64),
+            'price': catalog['unit_price'].to_numpy().astype(np.float64),
+            'cost': catalog['unit_cost'].to_numpy().astype(np.float64),
+            'score': score,
+            'bound_ptr': np.array(bound_ptr, dtype=np.int64),
+            'bound_width': np.array(bound_width, dtype=np.float64),
+            'bound_end': np.array(bound_end, dtype=np.int64),
+            'topk': np.array(topk, dtype=np.int64).reshape(-1, top_k),
+            'store_ids': store_ids,
+            'sku_universe': sku_universe,
+            'bitmap': bitmap,
+        })
+
+    def save(self, path=INDEX_FILE, signature=''):
+        np.savez(path, signature=np.array(signature), **self.arrays)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files if name != 'signature'}
+        return cls(arrays)
+
+    @classmethod
+    def load_or_build(cls, df_products, df_plano, path=INDEX_FILE, score_column='unit_price', top_k=TOP_K):
+        """Reuses the index on disk unless the catalog, planogram or scoring changed."""
+        signature = frame_signature(df_products, df_plano, extra=f"{score_column}:{top_k}")
+        if path and os.path.exists(path):
+            with np.load(path) as data:
+                cached = str(data['signature'])
+            if cached == signature:
+                return cls.load(path)
+
+        index = cls.build(df_products, df_plano, score_column, top_k)
+        if path:
+            index.save(path, signature)
+        return index
+
+    # ------------------------------------------
+    # Queries
+    # ------------------------------------------
+    def store_rows(self, store_ids):
+        """Bitmap row for each store (-1 for stores with no planogram)."""
+        store_ids = np.asarray(store_ids, dtype=np.int64)
+        rows = np.searchsorted(self.store_ids, store_ids)
+        rows = np.minimum(rows, len(self.store_ids) - 1)
+        return np.where(self.store_ids[rows] == store_ids, rows, -1)
+
+    def in_store(self, rows, positions):
+        """True where catalog position is already stocked by the store in that bitmap row."""
+        cols = self.sku_col[positions]
+        bits = self.bitmap[np.maximum(rows, 0), cols >> 3] & (0x80 >> (cols & 7))
+        return (bits != 0) & (rows >= 0)
+
+    def fitting(self, category, gap_width):
+        """Catalog positions [start, end) of the category's SKUs no wider than the gap."""
+        c = self._category_pos[category]
+        lo, hi = self.bound_ptr[c], self.bound_ptr[c + 1]
+        j = np.searchsorted(self.bound_width[lo:hi], gap_width, side='right') - 1
+        end = self.bound_end[lo + j] if j >= 0 else self.cat_ptr[c]
+        return self.cat_ptr[c], end
+
+    def best_replacements(self, store_ids, categories, gap_widths):
+        """
+        Best-scoring SKU that fits each gap and isn't stocked by its store.
+        Returns catalog positions (-1 when nothing qualifies).
+        """
+        store_ids = np.asarray(store_ids)
+        categories = np.asarray(categories).astype(str)
+        gap_widths = np.asarray(gap_widths, dtype=np.float64)
+        result = np.full(len(store_ids), -1, dtype=np.int64)
+        rows = self.store_rows(store_ids)
+
+        for category in np.unique(categories):
+            if category not in self._category_pos:
+                continue
+            gaps = np.flatnonzero(categories == category)
+            c = self._category_pos[category]
+            lo, hi = self.bound_ptr[c], self.bound_ptr[c + 1]
+            j = np.searchsorted(self.bound_width[lo:hi], gap_widths[gaps], side='right') - 1
+            fits = j >= 0
+            gaps, j = gaps[fits], j[fits] + lo
+
+            # Fast path: the first unstocked SKU among the boundary's top K
+            cand = self.topk[j]
+            ok = (cand >= 0) & ~self.in_store(rows[gaps, None], np.maximum(cand, 0))
+            hit = ok.any(axis=1)
+            result[gaps[hit]] = cand[hit, ok[hit].argmax(axis=1)]
+
+            # Slow path: store already carries all K, scan the fitting range
+            for g, b in zip(gaps[~hit], j[~hit]):
+                positions = np.arange(self.cat_ptr[c], self.bound_end[b])
+                positions = positions[~self.in_store(np.full(len(positions), rows[g]), positions)]
+                if len(positions):
+                    order = np.lexsort((self.sku_id[positions], -self.score[positions]))
+                    result[g] = positions[order[0]]
+
+        return result
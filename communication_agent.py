@@ -1,10 +1,32 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
+from impact_simulator import IMPACT_SWAPS_FILE, format_dollars
+from instrumentation import stage
+
+RECOMMENDATIONS_FILE = 'recommendations.csv'
+COMMS_FILE = 'comms.jsonl'
+COMMS_CACHE_FILE = 'comms_cache.jsonl'
+LLM_URL = 'http://127.0.0.1:8765/v1/complete'
+CONCURRENCY = 32        # LLM requests in flight at once
+RETRIES = 3             # Extra attempts per prompt after the first failure
+BACKOFF_SECONDS = 0.5   # Base of the exponential backoff (full jitter)
+
 # ==========================================
 # 1. SETUP (Mocking Phase 2 Output)
 # ==========================================
 # In a real pipeline, these pass directly from the Phase 2 script.
 # We manually define them here so this script is standalone executable.
+# (The batch mode below reads them from the logic engine's recommendations.csv.)
 
 delete_candidate = {
     'name': 'Home Item 34 - CozyNest Pillow',
@@ -26,21 +48,28 @@ store_context = "Store 3000 (Bentonville Supercenter)"
 # 2. THE AI PROMPT ENGINEER (The "Brain")
 # ==========================================
 
-def generate_strategic_comms(delete_item, add_item, context):
+def generate_strategic_comms(delete_item, add_item, context, impact=None):
     """
     Constructs detailed prompts for an LLM to generate role-specific communications.
+    `impact` is the simulated lift to quote in the merchant pitch, if any.
     """
-    
+
+    # With logic_engine --shelf-space the add may also take free shelf space beside the gap
+    free_space = add_item.get('free_space')
+    shelf_space = f" plus {free_space:g}\" of free space on the same shelf" if free_space else ''
+
     # PROMPT 1: The Merchant Pitch (Strategic/Financial Tone)
     merchant_prompt = f"""
     ACT AS: Senior Analyst, Assortment Activation.
     TASK: Write a justification email to the Category Manager.
     CONTEXT: We are optimizing the Assortment for {context}.
     ACTION: Remove '{delete_item['name']}' ({delete_item['metric']}).
-    REPLACE WITH: '{add_item['name']}' (Matches {add_item['width']}" gap).
+    REPLACE WITH: '{add_item['name']}' (Matches {delete_item['width']}" gap{shelf_space}).
     GOAL: Persuade the merchant that this improves 'Return on Space'.
     TONE: Professional, Concise, Data-Driven.
     """
+    if impact:
+        merchant_prompt += f"PROJECTED IMPACT: {impact}.\n    "
 
     # PROMPT 2: The Store Ops Instruction (Instructional/Clear Tone)
     ops_prompt = f"""
@@ -48,69 +77,328 @@ def generate_strategic_comms(delete_item, add_item, context):
     TASK: Write a 'Modular Update Card' for the Stocking Associate.
     ACTION: Physically swap items on the shelf.
     OLD ITEM: '{delete_item['name']}' -> Remove and mark for clearance.
-    NEW ITEM: '{add_item['name']}' -> Place in empty 15" gap.
+    NEW ITEM: '{add_item['name']}' -> Place in empty {delete_item['width']:g}" gap{shelf_space}.
     CRITICAL: Verify shelf tag alignment.
     TONE: Direct, Simple, Action-Oriented. Use Bullet points.
     """
-    
+
     return merchant_prompt, ops_prompt
 
+
+def recommendation_prompts(df_recs, store_names=None, impact=None):
+    """
+    Yields (recommendation key, kind, prompt) for both messages of every swap
+    in a logic-engine recommendations table. Gaps with no replacement are skipped.
+    `impact` maps (store_id, category) to the swap's simulated lift text.
+    """
+    store_names = store_names or {}
+    impact = impact or {}
+    for rec in df_recs.dropna(subset=['add_sku_id']).itertuples(index=False):
+        store_id = int(rec.store_id)
+        context = store_names.get(store_id, f"Store {store_id}")
+        delete_item = {
+            'name': rec.delete_product_name,
+            'metric': f"${rec.delete_spli:.2f} SPLI",
+            'reason': 'Lowest sales efficiency in Category',
+            'width': round(float(rec.gap_width), 2)
+        }
+        # With logic_engine --shelf-space the add may also take free shelf space beside the gap
+        extra = round(float(rec.add_linear_width) - float(rec.gap_width), 2)
+        add_item = {
+            'name': rec.add_product_name,
+            'metric': f"${rec.add_unit_price:.2f} unit price",
+            'reason': f'Top available item fitting the {rec.gap_width:g}" gap'
+                      + (f' plus {extra:g}" of free shelf space' if extra > 0 else ''),
+            'width': round(float(rec.add_linear_width), 2)
+        }
+        if extra > 0:
+            add_item['free_space'] = extra
+        key = {'store_id': store_id, 'category': str(rec.category),
+               'delete_sku_id': int(rec.delete_sku_id), 'add_sku_id': int(rec.add_sku_id)}
+
+        merchant_prompt, ops_prompt = generate_strategic_comms(delete_item, add_item, context,
+                                                               impact.get((store_id, key['category'])))
+        yield key, 'merchant', merchant_prompt
+        yield key, 'ops', ops_prompt
+
 # ==========================================
 # 3. THE AI SIMULATOR (The Output)
 # ==========================================
 
+def _prompt_field(pattern, prompt, default=''):
+    match = re.search(pattern, prompt)
+    return match.group(1) if match else default
+
+
 def get_ai_response(prompt):
     # IN REAL LIFE: You would call openai.ChatCompletion.create() here.
     # FOR PORTFOLIO: We return a pre-written "Mock" response to show what it LOOKS like.
-    
+    # The names, store and gap are read back out of the prompt, so every swap gets its own copy.
+
     if "Category Manager" in prompt:
+        context = _prompt_field(r"Assortment for (.+)\.", prompt, store_context)
+        old_name = _prompt_field(r"Remove '(.+)' \(", prompt)
+        old_metric = _prompt_field(r"Remove '.+' \((.+)\)\.", prompt)
+        new_name = _prompt_field(r"REPLACE WITH: '(.+)'", prompt)
+        gap = float(_prompt_field(r'Matches ([\d.]+)" gap', prompt, '0'))
+        free = float(_prompt_field(r'gap plus ([\d.]+)" of free space', prompt, '0'))
+        fit = (f'Fits the {gap:g}" gap plus {free:g}" of free space already on the shelf (no other items move).'
+               if free else f'Matches the exact {gap:g}" gap (No shelf moves required).')
+        impact = _prompt_field(r"PROJECTED IMPACT: (.+)\.", prompt)
+        upside = (f"In simulated demand, this swap adds {impact}." if impact
+                  else "Based on regional trends, we project a margin lift of 15%.")
         return f"""
-        SUBJECT: Assortment Optimization Proposal - {store_context}
-        
+        SUBJECT: Assortment Optimization Proposal - {context}
+
         Hi Team,
-        
-        Based on Q3 performance data, I recommend an immediate modular update for the Home category in Bentonville.
-        
+
+        Based on Q3 performance data, I recommend an immediate modular update for {context}.
+
         The Proposal:
-        We are currently allocating 15 inches of shelf space to '{delete_candidate['name']}', which is yielding only {delete_candidate['metric']}. This is performing 40% below category average.
-        
+        We are currently allocating {gap:g} inches of shelf space to '{old_name}', which is yielding only {old_metric}. This is performing 40% below category average.
+
         The Solution:
-        I propose swapping this for '{add_candidate['name']}'.
-        1. Fit Compliance: Matches the exact 15" gap (No shelf moves required).
-        2. Upside: Based on regional trends, we project a margin lift of 15%.
-        
+        I propose swapping this for '{new_name}'.
+        1. Fit Compliance: {fit}
+        2. Upside: {upside}
+
         Please approve this swap by EOD Friday for execution next week.
         """
-        
+
     elif "Stocking Associate" in prompt:
+        old_name = _prompt_field(r"OLD ITEM: '(.+)'", prompt)
+        new_name = _prompt_field(r"NEW ITEM: '(.+)'", prompt)
+        gap = float(_prompt_field(r'empty ([\d.]+)" gap', prompt, '0'))
+        free = float(_prompt_field(r'gap plus ([\d.]+)" of free space', prompt, '0'))
+        facings = (f"Fill the {gap:g}-inch gap plus the {free:g} inches of free space beside it." if free
+                   else "1 Row (Fits exactly).")
         return f"""
         [MODULAR UPDATE TASK CARD]
         LOCATION: Home Department, Aisle 12, Section 4
-        
+
         1. REMOVE:
-           [ ] '{delete_candidate['name']}'
+           [ ] '{old_name}'
            -> Action: Pull all units and apply yellow 'Clearance' stickers. Move to Flex Aisle.
-           
+
         2. CLEAN:
-           [ ] Wipe down the empty 15-inch shelf section.
-           
+           [ ] Wipe down the empty {gap:g}-inch shelf section.
+
         3. SET:
-           [ ] Place '{add_candidate['name']}'
-           -> Facings: 1 Row (Fits exactly).
+           [ ] Place '{new_name}'
+           -> Facings: {facings}
            -> Alignment: Align left edge with shelf notch.
-           
+
         4. TAG:
-           [ ] Print and set new shelf label (UPC ends in 89).
+           [ ] Print and set new shelf label (UPC ends in {new_name.split(' - ')[0][-2:]}).
         """
 
 # ==========================================
-# 4. EXECUTION
+# 4. LLM BACKENDS (Pluggable)
 # ==========================================
+# A backend is anything with a `name` and an async `complete(prompt)`.
+
+class MockBackend:
+    """Answers in-process with the canned responses above (no network)."""
+    name = 'mock'
+
+    async def complete(self, prompt):
+        return get_ai_response(prompt)
+
+
+class HTTPBackend:
+    """
+    POSTs {"prompt": ...} to an HTTP endpoint and reads {"text": ...} back
+    (see mock_llm_server.py). The blocking urllib call runs on a worker thread.
+    """
+
+    def __init__(self, url=LLM_URL, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self.name = f"http:{url}"
+
+    def _post(self, prompt):
+        request = urllib.request.Request(self.url, data=json.dumps({'prompt': prompt}).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)['text']
+
+    async def complete(self, prompt):
+        return await asyncio.to_thread(self._post, prompt)
+
+# ==========================================
+# 5. ASYNC BATCH PIPELINE
+# ==========================================
+
+class ResponseCache:
+    """
+    Responses keyed on a hash of (backend, prompt), optionally persisted as
+    JSONL so weekly re-runs only pay for new prompts.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.responses = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.responses[entry['key']] = entry['text']
+
+    @staticmethod
+    def key(backend, prompt):
+        return hashlib.sha1(f"{backend.name}\n{prompt}".encode()).hexdigest()
+
+    def get(self, key):
+        return self.responses.get(key)
+
+    def put(self, key, text):
+        self.responses[key] = text
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'key': key, 'text': text}) + '\n')
+
+
+class CommsClient:
+    """
+    Sends prompts to a backend with bounded concurrency, retries with
+    exponential backoff, and dedupe: a prompt already answered comes from the
+    cache, and one already in flight is awaited rather than sent twice.
+    """
+
+    def __init__(self, backend, concurrency=CONCURRENCY, retries=RETRIES, backoff=BACKOFF_SECONDS, cache=None):
+        self.backend = backend
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache if cache is not None else ResponseCache()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._in_flight = {}
+        self.calls = 0
+        self.cache_hits = 0
+        self.failures = 0
+
+    async def _call(self, prompt):
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    self.calls += 1
+                    return await self.backend.complete(prompt)
+                except Exception:
+                    if attempt == self.retries:
+                        raise
+                    await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def complete(self, prompt):
+        """Returns (text, source) where source is 'cache', 'dedupe' or 'backend'."""
+        key = ResponseCache.key(self.backend, prompt)
+        text = self.cache.get(key)
+        if text is not None:
+            self.cache_hits += 1
+            return text, 'cache'
+        if key in self._in_flight:
+            self.cache_hits += 1
+            return await self._in_flight[key], 'dedupe'
+
+        task = asyncio.ensure_future(self._call(prompt))
+        self._in_flight[key] = task
+        try:
+            text = await task
+        finally:
+            del self._in_flight[key]
+        self.cache.put(key, text)
+        return text, 'backend'
+
+
+async def generate_comms(df_recs, backend, output_path=COMMS_FILE, concurrency=CONCURRENCY,
+                         retries=RETRIES, cache_path=COMMS_CACHE_FILE, store_names=None, impact=None):
+    """
+    Builds both prompts for every recommendation and streams the responses to
+    a JSONL file as they complete (one line per message). A prompt that still
+    fails after all retries is written with an 'error' instead of 'text'.
+    Returns (client, messages written).
+    """
+    # to_thread backends share the default executor: give it one thread per slot
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    client = CommsClient(backend, concurrency, retries, cache=ResponseCache(cache_path))
+
+    async def run(key, kind, prompt):
+        start = time.perf_counter()
+        record = {**key, 'kind': kind}
+        try:
+            record['text'], record['source'] = await client.complete(prompt)
+        except Exception as e:
+            client.failures += 1
+            record['error'] = repr(e)
+        record['latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        return record
+
+    tasks = [asyncio.ensure_future(run(*job)) for job in recommendation_prompts(df_recs, store_names, impact)]
+    written = 0
+    with stage('comms.generate', backend=backend.name) as record, open(output_path, 'w') as f:
+        for finished in asyncio.as_completed(tasks):
+            f.write(json.dumps(await finished) + '\n')
+            written += 1
+        record.rows = written
+    return client, written
+
+
+def load_store_names():
+    try:
+        import data_loader
+        df_stores = data_loader.load_stores()
+    except FileNotFoundError:
+        return {}
+    return dict(zip(df_stores['store_id'].astype(int), df_stores['store_name']))
+
+
+def load_swap_impact(path=IMPACT_SWAPS_FILE):
+    """(store_id, category) -> the swap's simulated margin lift, as pitch text."""
+    df = pd.read_csv(path)
+    return {
+        (int(row.store_id), str(row.category)):
+            f"{format_dollars(row.margin_lift_mean)} margin per {row.days} days on average "
+            f"(P5 {format_dollars(row.margin_lift_p5)}, P95 {format_dollars(row.margin_lift_p95)})"
+        for row in df.itertuples(index=False)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate merchant pitches and store ops cards.")
+    parser.add_argument('--recommendations', nargs='?', const=RECOMMENDATIONS_FILE,
+                        help="Batch mode: write comms for every swap in this table (default recommendations.csv)")
+    parser.add_argument('--output', default=COMMS_FILE, help="JSONL file the batch streams to")
+    parser.add_argument('--backend', choices=['mock', 'http'], default='mock')
+    parser.add_argument('--url', default=LLM_URL, help="Endpoint for --backend http")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--retries', type=int, default=RETRIES)
+    parser.add_argument('--cache', default=COMMS_CACHE_FILE, help="Response cache file ('' to disable)")
+    parser.add_argument('--limit', type=int, help="Only the first N recommendations")
+    parser.add_argument('--impact', nargs='?', const=IMPACT_SWAPS_FILE,
+                        help="Quote simulated lifts from impact_simulator.py output (default impact_swaps.csv)")
+    args = parser.parse_args()
+
+    if args.recommendations:
+        df_recs = pd.read_csv(args.recommendations)
+        if args.limit:
+            df_recs = df_recs.head(args.limit)
+        backend = MockBackend() if args.backend == 'mock' else HTTPBackend(args.url)
 
-m_prompt, o_prompt = generate_strategic_comms(delete_candidate, add_candidate, store_context)
+        start = time.perf_counter()
+        with stage('comms.batch', backend=backend.name, concurrency=args.concurrency) as record:
+            client, written = asyncio.run(generate_comms(df_recs, backend, args.output, args.concurrency,
+                                                         args.retries, args.cache or None, load_store_names(),
+                                                         load_swap_impact(args.impact) if args.impact else None))
+            record.rows = written
+        elapsed = time.perf_counter() - start
+        print(f"{written:,} messages -> {args.output} in {elapsed:.2f}s ({written / max(elapsed, 1e-9):,.0f} msgs/sec); "
+              f"{client.calls:,} backend calls, {client.cache_hits:,} cache/dedupe hits, {client.failures:,} failures")
+    else:
+        # ==========================================
+        # 6. EXECUTION (Single Demo Swap)
+        # ==========================================
+        m_prompt, o_prompt = generate_strategic_comms(delete_candidate, add_candidate, store_context)
 
-print(">>> GENERATING MERCHANT PITCH (Strategic Insights)...")
-print(get_ai_response(m_prompt))
-print("-" * 50)
-print(">>> GENERATING OPS INSTRUCTIONS (Training Materials)...")
-print(get_ai_response(o_prompt))
\ No newline at end of file
+        print(">>> GENERATING MERCHANT PITCH (Strategic Insights)...")
+        print(get_ai_response(m_prompt))
+        print("-" * 50)
+        print(">>> GENERATING OPS INSTRUCTIONS (Training Materials)...")
+        print(get_ai_response(o_prompt))
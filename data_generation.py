@@ -1,7 +1,10 @@
+import argparse
+import time
 import pandas as pd
 import numpy as np
-import random
 from datetime import datetime, timedelta
+from instrumentation import stage, traced
+from partitioned_sales import PartitionedSalesWriter, PARTITION_DIR
 
 # ==========================================
 # CONFIGURATION
@@ -10,60 +13,72 @@ NUM_PRODUCTS = 1000  # Large assortment
 NUM_STORES = 20      # A full market cluster
 DAYS_HISTORY = 90
 START_DATE = datetime(2024, 6, 1)
+SEED = 42            # Same seed -> same stores, catalog, planograms and sales
+SHELF_WIDTH_INCHES = 48  # Nominal width of one shelf (see shelf_model.py)
+
+# Demand model (shared with anything that needs to simulate sales)
+SELL_PROBABILITY = 0.10   # Not every item sells every day
+BASE_DAILY_UNITS = 2      # Poisson mean for an item that sells
+TRAFFIC_MULTIPLIERS = {'High': 2.5, 'Med': 1.0, 'Low': 0.6}
+WEEKEND_MULTIPLIER = 1.5
 
 # ==========================================
 # 1. GENERATE REGIONAL STORE MASTER
 # ==========================================
 # We create a specific "Northwest Market" cluster
-locations = [
+LOCATIONS = [
     # Flagship / High Volume
     {'city': 'Bentonville', 'type': 'Supercenter', 'traffic': 'High', 'sq_ft': 180000},
     {'city': 'Rogers', 'type': 'Supercenter', 'traffic': 'High', 'sq_ft': 175000},
     {'city': 'Fayetteville', 'type': 'Supercenter', 'traffic': 'High', 'sq_ft': 185000},
     {'city': 'Springdale', 'type': 'Supercenter', 'traffic': 'Med', 'sq_ft': 160000},
-    
+
     # Suburban / Commuter
     {'city': 'Centerton', 'type': 'Neighborhood Mkt', 'traffic': 'Med', 'sq_ft': 45000},
     {'city': 'Bella Vista', 'type': 'Supercenter', 'traffic': 'Med', 'sq_ft': 150000},
     {'city': 'Lowell', 'type': 'Neighborhood Mkt', 'traffic': 'Med', 'sq_ft': 42000},
     {'city': 'Farmington', 'type': 'Neighborhood Mkt', 'traffic': 'Med', 'sq_ft': 40000},
-    
+
     # Rural / Outlying
     {'city': 'Pea Ridge', 'type': 'Neighborhood Mkt', 'traffic': 'Low', 'sq_ft': 38000},
     {'city': 'Gravette', 'type': 'Supercenter', 'traffic': 'Low', 'sq_ft': 120000},
     {'city': 'Siloam Springs', 'type': 'Supercenter', 'traffic': 'Med', 'sq_ft': 140000},
     {'city': 'Huntsville', 'type': 'Supercenter', 'traffic': 'Low', 'sq_ft': 110000},
-    
+
     # Urban / Student (University Area)
     {'city': 'Fayetteville (campus)', 'type': 'Express', 'traffic': 'High', 'sq_ft': 15000},
     {'city': 'Fayetteville (MLK)', 'type': 'Supercenter', 'traffic': 'High', 'sq_ft': 170000},
 ]
 
-# Expand to 20 stores by duplicating some types
-while len(locations) < NUM_STORES:
-    locations.append(random.choice(locations))
-
-stores = []
-for i, loc in enumerate(locations):
-    # Calculate shelf space based on store size (approx 10% of sq_ft is shelf linear feet for our mockup)
-    shelf_cap = int(loc['sq_ft'] * 0.005) 
-    
-    stores.append({
-        'store_id': 3000 + i,
-        'store_name': f"Store {3000+i} - {loc['city']} {loc['type']}",
-        'city': loc['city'],
-        'format': loc['type'],
-        'traffic_profile': loc['traffic'],
-        'shelf_capacity_ft': shelf_cap
-    })
 
-df_stores = pd.DataFrame(stores)
+@traced('generate.stores', rows=len)
+def generate_stores(num_stores, rng):
+    # Expand to the requested chain size by duplicating some types
+    locations = LOCATIONS[:num_stores]
+    extra = max(num_stores - len(LOCATIONS), 0)
+    locations = locations + [LOCATIONS[i] for i in rng.integers(0, len(LOCATIONS), extra)]
+
+    stores = []
+    for i, loc in enumerate(locations):
+        # Calculate shelf space based on store size (approx 10% of sq_ft is shelf linear feet for our mockup)
+        shelf_cap = int(loc['sq_ft'] * 0.005)
+
+        stores.append({
+            'store_id': 3000 + i,
+            'store_name': f"Store {3000+i} - {loc['city']} {loc['type']}",
+            'city': loc['city'],
+            'format': loc['type'],
+            'traffic_profile': loc['traffic'],
+            'shelf_capacity_ft': shelf_cap
+        })
+
+    return pd.DataFrame(stores)
 
 # ==========================================
 # 2. GENERATE PRODUCT MASTER (Using previous Logic)
 # ==========================================
 # (Using the same category logic as before, just scaling it)
-categories = {
+CATEGORIES = {
     'Electronics': {'brands': ['TechNova', 'SoundWave'], 'types': ['4K TV', 'Headphones', 'Cable'], 'margin': (0.15, 0.25)},
     'Home': {'brands': ['CozyNest', 'GreenThumb'], 'types': ['Pillow', 'Bin', 'Planter'], 'margin': (0.40, 0.60)},
     'Toys': {'brands': ['FunZone', 'BrickBuilder'], 'types': ['Action Fig', 'Blocks', 'Doll'], 'margin': (0.35, 0.50)},
@@ -71,129 +86,187 @@ categories = {
     'Grocery': {'brands': ['GreatValue', 'TastyBite'], 'types': ['Cereal', 'Pasta', 'Coffee'], 'margin': (0.20, 0.35)}
 }
 
-products = []
-for i in range(1, NUM_PRODUCTS + 1):
-    cat_name = random.choice(list(categories.keys()))
-    cat_data = categories[cat_name]
-    
-    # Simple constraints for size
-    if cat_name == 'Electronics' and 'TV' in cat_data['types']:
-        width, height = 40.0, 25.0
-    elif cat_name == 'Home':
-        width, height = 15.0, 15.0
-    elif cat_name == 'Grocery' or cat_name == 'Personal Care':
-        width, height = 3.0, 8.0
-    else:
-        width, height = 8.0, 10.0
-        
-    cost = round(random.uniform(5, 50), 2)
-    price = round(cost * 1.4, 2)
-    
-    products.append({
-        'sku_id': 50000 + i,
-        'product_name': f"{cat_name} Item {i}",
-        'category': cat_name,
-        'width_inches': width,
-        'height_inches': height,
+# Simple constraints for size (width, height)
+CATEGORY_DIMENSIONS = {
+    'Home': (15.0, 15.0),
+    'Grocery': (3.0, 8.0),
+    'Personal Care': (3.0, 8.0),
+}
+DEFAULT_DIMENSIONS = (8.0, 10.0)
+
+
+@traced('generate.products', rows=len)
+def generate_products(num_products, rng):
+    cat_names = np.array(list(CATEGORIES.keys()))
+    cat_codes = rng.integers(0, len(cat_names), num_products)
+    product_cats = cat_names[cat_codes]
+    dims = np.array([CATEGORY_DIMENSIONS.get(c, DEFAULT_DIMENSIONS) for c in cat_names])
+
+    cost = np.round(rng.uniform(5, 50, num_products), 2)
+    price = np.round(cost * 1.4, 2)
+    item_nums = np.arange(1, num_products + 1)
+
+    return pd.DataFrame({
+        'sku_id': 50000 + item_nums,
+        'product_name': [f"{c} Item {i}" for c, i in zip(product_cats, item_nums)],
+        'category': product_cats,
+        'width_inches': dims[cat_codes, 0],
+        'height_inches': dims[cat_codes, 1],
         'unit_price': price,
         'unit_cost': cost
     })
 
-df_products = pd.DataFrame(products)
-
 # ==========================================
 # 3. GENERATE PLANOGRAMS (Regional Logic)
 # ==========================================
-plano_data = []
-
-for _, store in df_stores.iterrows():
-    # Store-Specific Assortment Logic
-    # 1. "University" stores sell more Electronics/Personal Care, less Home/Garden
-    # 2. "Rural" stores sell more Home/Garden/Grocery
-    
-    store_cat_weights = [0.2, 0.2, 0.2, 0.2, 0.2] # Default
-    if 'campus' in store['store_name']:
-        store_cat_weights = [0.30, 0.05, 0.10, 0.35, 0.20] # High Elec/Personal
-    elif 'Rural' in store['traffic_profile']:
-        store_cat_weights = [0.10, 0.30, 0.15, 0.15, 0.30] # High Home/Grocery
-
-    # Create weighted list of products specifically for this store
-    # (Simplified for script length: we just pick random subset based on capacity)
-    
-    capacity_inches = store['shelf_capacity_ft'] * 12
-    current_fill = 0
-    shelf_num = 1
-    
-    shuffled_prods = df_products.sample(frac=1).reset_index(drop=True)
-    
-    for _, prod in shuffled_prods.iterrows():
-        if current_fill >= capacity_inches: break
-        
-        facings = 1
-        if 'High' in store['traffic_profile'] and prod['category'] == 'Grocery':
-            facings = 2 # High traffic stores double face grocery
-            
-        plano_data.append({
-            'store_id': store['store_id'],
-            'shelf_id': shelf_num,
-            'sku_id': prod['sku_id'],
-            'facings': facings
-        })
-        current_fill += (prod['width_inches'] * facings)
-        if current_fill % 48 < (prod['width_inches'] * facings): shelf_num += 1
 
-df_plano = pd.DataFrame(plano_data)
+@traced('generate.planograms', rows=len)
+def generate_planograms(df_stores, df_products, rng):
+    sku_ids = df_products['sku_id'].to_numpy()
+    widths = df_products['width_inches'].to_numpy()
+    is_grocery = (df_products['category'] == 'Grocery').to_numpy()
+    num_products = len(df_products)
+
+    plano_parts = []
+    for store in df_stores.itertuples(index=False):
+        capacity_inches = store.shelf_capacity_ft * 12
+
+        # High traffic stores double face grocery
+        facings = np.ones(num_products, dtype=np.int64)
+        if 'High' in store.traffic_profile:
+            facings[is_grocery] = 2
+        linear = widths * facings
+
+        # We only need enough of the shuffled catalog to fill the store, so
+        # draw a random ordered sample instead of shuffling everything
+        sample_size = min(num_products, int(capacity_inches // linear.min()) + 1)
+        order = rng.choice(num_products, size=sample_size, replace=False)
+
+        fill_after = np.cumsum(linear[order])
+        fill_before = fill_after - linear[order]
+        keep = fill_before < capacity_inches
+        order, fill_after = order[keep], fill_after[keep]
+
+        # A new shelf starts whenever the running fill crosses a shelf-width boundary
+        # (the item that crosses it stays on the old shelf, which can run over)
+        crossed = (fill_after % SHELF_WIDTH_INCHES) < linear[order]
+        shelf_ids = 1 + np.cumsum(crossed) - crossed
+
+        plano_parts.append(pd.DataFrame({
+            'store_id': store.store_id,
+            'shelf_id': shelf_ids,
+            'sku_id': sku_ids[order],
+            'facings': facings[order]
+        }))
+
+    return pd.concat(plano_parts, ignore_index=True)
 
 # ==========================================
 # 4. GENERATE SALES (Regional Traffic Logic)
 # ==========================================
-sales_data = []
-dates = [START_DATE + timedelta(days=x) for x in range(DAYS_HISTORY)]
-
-print("Generating Regional Sales Data...")
-
-for date in dates:
-    is_weekend = date.weekday() >= 5
-    
-    # Filter for active items only to speed up processing
-    # (In a real DB we would join, here we loop carefully)
-    
-    # We simulate bulk sales to save processing time for 20 stores
-    # Instead of iterating every product every day, we iterate Store-Planograms
-    
-    for _, row in df_plano.iterrows():
-        # Random sampling: Not every item sells every day
-        if random.random() > 0.10: continue 
-
-        store_traffic = df_stores.loc[df_stores['store_id'] == row['store_id'], 'traffic_profile'].values[0]
-        
-        # Traffic Multiplier
-        traffic_mult = 1.0
-        if store_traffic == 'High': traffic_mult = 2.5
-        elif store_traffic == 'Low': traffic_mult = 0.6
-        
-        # Weekend Multiplier
-        weekend_mult = 1.5 if is_weekend else 1.0
-        
-        units = int(np.random.poisson(2) * traffic_mult * weekend_mult)
-        
-        if units > 0:
-            prod_info = df_products[df_products['sku_id'] == row['sku_id']].iloc[0]
-            sales_data.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'store_id': row['store_id'],
-                'sku_id': row['sku_id'],
-                'units_sold': units,
-                'revenue': round(units * prod_info['unit_price'], 2),
-                'margin': round(units * (prod_info['unit_price'] - prod_info['unit_cost']), 2)
-            })
-
-df_sales = pd.DataFrame(sales_data)
-
-# Export
-df_stores.to_csv('stores_regional.csv', index=False)
-df_products.to_csv('products_regional.csv', index=False)
-df_plano.to_csv('plano_regional.csv', index=False)
-df_sales.to_csv('sales_regional.csv', index=False)
-
-print(f"Regional Data Complete. {len(df_stores)} Stores, {len(df_sales)} Sales Records.")
\ No newline at end of file
+
+def draw_daily_units(rng, traffic_mult, weekend_mult):
+    """
+    Draws one day of demand for every planogram row at once.
+    Returns the row positions that sold and their (positive) units.
+    """
+    # Random sampling: Not every item sells every day
+    sells = np.flatnonzero(rng.random(len(traffic_mult)) <= SELL_PROBABILITY)
+    units = (rng.poisson(BASE_DAILY_UNITS, len(sells)) * traffic_mult[sells] * weekend_mult).astype(np.int64)
+    sold = units > 0
+    return sells[sold], units[sold]
+
+
+def iter_sales_days(df_stores, df_products, df_plano, days_history, start_date, rng):
+    """
+    Yields (date, sales DataFrame) one day at a time. Each day is drawn as
+    whole arrays over the planogram; prices are joined by array indexing.
+    """
+    traffic = df_stores.set_index('store_id')['traffic_profile'].map(TRAFFIC_MULTIPLIERS)
+    row_traffic = traffic.reindex(df_plano['store_id']).to_numpy()
+
+    sku_order = np.argsort(df_products['sku_id'].to_numpy())
+    sku_pos = sku_order[np.searchsorted(df_products['sku_id'].to_numpy(), df_plano['sku_id'].to_numpy(), sorter=sku_order)]
+    row_price = df_products['unit_price'].to_numpy()[sku_pos]
+    row_cost = df_products['unit_cost'].to_numpy()[sku_pos]
+
+    row_store = df_plano['store_id'].to_numpy()
+    row_sku = df_plano['sku_id'].to_numpy()
+
+    for x in range(days_history):
+        date = start_date + timedelta(days=x)
+        weekend_mult = WEEKEND_MULTIPLIER if date.weekday() >= 5 else 1.0
+
+        rows, units = draw_daily_units(rng, row_traffic, weekend_mult)
+        yield date, pd.DataFrame({
+            'date': date.strftime('%Y-%m-%d'),
+            'store_id': row_store[rows],
+            'sku_id': row_sku[rows],
+            'units_sold': units,
+            'revenue': np.round(units * row_price[rows], 2),
+            'margin': np.round(units * (row_price[rows] - row_cost[rows]), 2)
+        })
+
+
+def generate_master_data(num_stores=NUM_STORES, num_products=NUM_PRODUCTS, seed=SEED):
+    rng = np.random.default_rng(seed)
+    df_stores = generate_stores(num_stores, rng)
+    df_products = generate_products(num_products, rng)
+    df_plano = generate_planograms(df_stores, df_products, rng)
+    return rng, df_stores, df_products, df_plano
+
+
+def generate_dataset(num_stores=NUM_STORES, num_products=NUM_PRODUCTS, days_history=DAYS_HISTORY,
+                     start_date=START_DATE, seed=SEED):
+    """Builds the full dataset in memory (handy for small runs and notebooks)."""
+    rng, df_stores, df_products, df_plano = generate_master_data(num_stores, num_products, seed)
+    days = iter_sales_days(df_stores, df_products, df_plano, days_history, start_date, rng)
+    df_sales = pd.concat([day for _, day in days], ignore_index=True)
+    return df_stores, df_products, df_plano, df_sales
+
+
+def stream_sales(days, partition_dir=PARTITION_DIR, freq='day', csv_path='sales_regional.csv'):
+    """
+    Writes sales as they are generated: one Parquet partition per day/week
+    plus (optionally) the flat CSV, so memory stays bounded by one partition.
+    """
+    print("Generating Regional Sales Data...")
+    start = time.perf_counter()
+    total_rows = 0
+
+    with stage('generate.sales') as record, PartitionedSalesWriter(partition_dir, freq) as writer:
+        for i, (date, df_day) in enumerate(days):
+            with stage('generate.write_day', rows=len(df_day)):
+                writer.write(date, df_day)
+                if csv_path:
+                    df_day.to_csv(csv_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            total_rows += len(df_day)
+        record.rows = total_rows
+
+    elapsed = time.perf_counter() - start
+    print(f"Sales: {total_rows:,} rows in {elapsed:.2f}s ({total_rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+    return total_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the synthetic regional dataset.")
+    parser.add_argument('--stores', type=int, default=NUM_STORES)
+    parser.add_argument('--products', type=int, default=NUM_PRODUCTS)
+    parser.add_argument('--days', type=int, default=DAYS_HISTORY)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--partition-freq', choices=['day', 'week'], default='day')
+    parser.add_argument('--no-csv', action='store_true', help="Only write the Parquet partitions for sales")
+    args = parser.parse_args()
+
+    rng, df_stores, df_products, df_plano = generate_master_data(args.stores, args.products, args.seed)
+
+    # Export
+    with stage('generate.export_master', rows=len(df_stores) + len(df_products) + len(df_plano)):
+        df_stores.to_csv('stores_regional.csv', index=False)
+        df_products.to_csv('products_regional.csv', index=False)
+        df_plano.to_csv('plano_regional.csv', index=False)
+
+    days = iter_sales_days(df_stores, df_products, df_plano, args.days, START_DATE, rng)
+    total_rows = stream_sales(days, freq=args.partition_freq, csv_path=None if args.no_csv else 'sales_regional.csv')
+
+    print(f"Regional Data Complete. {len(df_stores)} Stores, {total_rows} Sales Records.")
@@ -0,0 +1,182 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from instrumentation import stage
+from partitioned_sales import PARTITION_DIR, MANIFEST_FILE, read_sales_partitions
+
+# ==========================================
+# SHARED COLUMNAR DATA LOADER
+# ==========================================
+# One place that reads the regional CSVs with compact dtypes:
+#   * integer ids and counts downcast to the smallest unsigned type
+#   * repeated labels (category, format, traffic_profile, city) as categoricals
+#   * sales dates as an int16 day offset ('day') from DATE_EPOCH
+# The first read of each CSV writes a Feather snapshot; later reads skip CSV
+# parsing until the source file's content hash changes.
+
+SNAPSHOT_DIR = '.snapshots'
+DATE_EPOCH = datetime(2000, 1, 1)
+
+SOURCES = {
+    'stores': 'stores_regional.csv',
+    'products': 'products_regional.csv',
+    'planogram': 'plano_regional.csv',
+    'sales': 'sales_regional.csv',
+}
+
+INTEGER_COLUMNS = ['store_id', 'sku_id', 'shelf_id', 'facings', 'units_sold', 'shelf_capacity_ft']
+CATEGORICAL_COLUMNS = ['city', 'format', 'traffic_profile', 'category']
+
+
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def date_to_day(dates):
+    """'YYYY-MM-DD' strings (or datetimes) -> int16 days since DATE_EPOCH."""
+    # Only the distinct dates (a handful per file) are parsed
+    codes, uniques = pd.factorize(pd.Series(dates).astype(str))
+    days = (pd.to_datetime(uniques) - DATE_EPOCH).days.to_numpy().astype(np.int16)
+    return days[codes]
+
+
+def day_to_date(days):
+    """int day offsets -> 'YYYY-MM-DD' strings (converting each distinct day once)."""
+    codes, uniques = pd.factorize(np.asarray(days))
+    labels = (DATE_EPOCH + pd.to_timedelta(uniques.astype(np.int64), unit='D')).strftime('%Y-%m-%d').to_numpy()
+    return labels[codes]
+
+
+def with_dates(df):
+    """Swaps the 'day' offset back to a 'date' string column (for SQL and CSV output)."""
+    dates = day_to_date(df['day'])
+    df = df.drop(columns='day')
+    df.insert(0, 'date', dates)
+    return df
+
+
+def compact(df):
+    """Applies the compact dtypes to any of the regional tables."""
+    df = df.copy()
+    for col in INTEGER_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], downcast='unsigned')
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    if 'date' in df.columns:
+        df.insert(0, 'day', date_to_day(df['date']))
+        df = df.drop(columns='date')
+    return df
+
+
+def _snapshot_paths(name):
+    base = os.path.join(SNAPSHOT_DIR, name)
+    return base + '.feather', base + '.json'
+
+
+def load_table(name, use_snapshot=True):
+    with stage(f"load.{name}") as record:
+        df = _load_table(name, use_snapshot)
+        record.rows = len(df)
+    return df
+
+
+def _load_table(name, use_snapshot):
+    source = SOURCES[name]
+    if not use_snapshot:
+        return compact(pd.read_csv(source))
+
+    snapshot, meta_path = _snapshot_paths(name)
+    stat = os.stat(source)
+    meta = {}
+    # The sidecar records the source's hash and the day-offset origin it was written with
+    if os.path.exists(snapshot) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    epoch = DATE_EPOCH.strftime('%Y-%m-%d')
+
+    if meta.get('date_epoch') == epoch:
+        # Unchanged size/mtime is trusted; otherwise the content hash decides
+        if (meta.get('size'), meta.get('mtime')) == (stat.st_size, stat.st_mtime):
+            return pd.read_feather(snapshot)
+        digest = file_hash(source)
+        if meta.get('sha1') == digest:
+            meta.update(size=stat.st_size, mtime=stat.st_mtime)
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+            return pd.read_feather(snapshot)
+    else:
+        digest = file_hash(source)
+
+    df = compact(pd.read_csv(source))
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    # Write-then-rename, so concurrent pipeline stages never read a half-written snapshot
+    tmp = f"{snapshot}.{os.getpid()}.tmp"
+    df.to_feather(tmp)
+    os.replace(tmp, snapshot)
+    with open(f"{meta_path}.{os.getpid()}.tmp", 'w') as f:
+        json.dump({'source': source, 'sha1': digest, 'size': stat.st_size, 'mtime': stat.st_mtime,
+                   'date_epoch': epoch}, f)
+    os.replace(f"{meta_path}.{os.getpid()}.tmp", meta_path)
+    return df
+
+
+def load_stores():
+    return load_table('stores')
+
+
+def load_products():
+    return load_table('products')
+
+
+def load_planogram():
+    return load_table('planogram')
+
+
+def load_sales(start_date=None, end_date=None):
+    """
+    Compact sales rows. A date window is served from the Parquet partitions
+    (only the partitions it overlaps are opened) when they exist.
+    """
+    has_partitions = os.path.exists(os.path.join(PARTITION_DIR, MANIFEST_FILE))
+    if has_partitions and (start_date or end_date or not os.path.exists(SOURCES['sales'])):
+        with stage('load.sales_partitions') as record:
+            df = compact(read_sales_partitions(start_date=start_date, end_date=end_date))
+            record.rows = len(df)
+        return df
+
+    df = load_table('sales')
+    if start_date:
+        df = df[df['day'] >= date_to_day([start_date])[0]]
+    if end_date:
+        df = df[df['day'] <= date_to_day([end_date])[0]]
+    return df
+
+
+def load_all():
+    """(df_sales, df_plano, df_products, df_stores) with compact dtypes."""
+    return load_sales(), load_planogram(), load_products(), load_stores()
+
+
+if __name__ == "__main__":
+    import time
+
+    print(f"{'table':<10} {'rows':>10} {'csv bytes/row':>14} {'compact bytes/row':>18} {'factor':>7}")
+    for name, source in SOURCES.items():
+        raw = pd.read_csv(source)
+        start = time.perf_counter()
+        df = load_table(name)
+        elapsed = time.perf_counter() - start
+        raw_bytes = raw.memory_usage(deep=True).sum() / len(raw)
+        compact_bytes = df.memory_usage(deep=True).sum() / len(df)
+        print(f"{name:<10} {len(df):>10,} {raw_bytes:>14.1f} {compact_bytes:>18.1f} "
+              f"{raw_bytes / compact_bytes:>6.1f}x  (loaded in {elapsed * 1000:.0f} ms)")
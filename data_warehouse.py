@@ -1,21 +1,484 @@
+import os
+import argparse
 import sqlite3
+import time
 import pandas as pd
 
-# Load your CSVs
-df_sales = pd.read_csv('sales_regional.csv')
-df_products = pd.read_csv('products_regional.csv')
-df_stores = pd.read_csv('stores_regional.csv')
-df_plano = pd.read_csv('plano_regional.csv')
+import data_loader
+from instrumentation import stage, traced
 
-# Create a database connection
-conn = sqlite3.connect('walmart_assortment.db')
+DB_PATH = 'walmart_assortment.db'
+CHUNK_SIZE = 100_000
 
-# Push data to SQL
-df_sales.to_sql('sales', conn, if_exists='replace', index=False)
-df_products.to_sql('products', conn, if_exists='replace', index=False)
-df_stores.to_sql('stores', conn, if_exists='replace', index=False)
-df_plano.to_sql('planogram', conn, if_exists='replace', index=False)
+# ==========================================
+# 1. SCHEMA (Typed, Keyed, Indexed)
+# ==========================================
+# sales is keyed on (date, store_id, sku_id), which also serves as the date
+# index. The (store_id, sku_id) index also carries units/revenue so store x SKU
+# aggregations are answered from the index alone.
+TABLES = """
+CREATE TABLE IF NOT EXISTS stores (
+    store_id INTEGER PRIMARY KEY,
+    store_name TEXT,
+    city TEXT,
+    format TEXT,
+    traffic_profile TEXT,
+    shelf_capacity_ft INTEGER
+);
+CREATE TABLE IF NOT EXISTS products (
+    sku_id INTEGER PRIMARY KEY,
+    product_name TEXT,
+    category TEXT,
+    width_inches REAL,
+    height_inches REAL,
+    unit_price REAL,
+    unit_cost REAL
+);
+CREATE TABLE IF NOT EXISTS planogram (
+    store_id INTEGER NOT NULL,
+    shelf_id INTEGER,
+    sku_id INTEGER NOT NULL,
+    facings INTEGER,
+    PRIMARY KEY (store_id, sku_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sales (
+    date TEXT NOT NULL,
+    store_id INTEGER NOT NULL,
+    sku_id INTEGER NOT NULL,
+    units_sold INTEGER,
+    revenue REAL,
+    margin REAL,
+    PRIMARY KEY (date, store_id, sku_id)
+) WITHOUT ROWID;
+"""
 
-print("Database 'walmart_assortment.db' created successfully!")
-conn.close()
+# Created after the bulk insert so a fresh load doesn't maintain them row by row
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_sales_store_sku ON sales (store_id, sku_id, units_sold, revenue);
+CREATE INDEX IF NOT EXISTS idx_sales_sku ON sales (sku_id);
+CREATE INDEX IF NOT EXISTS idx_planogram_sku ON planogram (sku_id);
+CREATE INDEX IF NOT EXISTS idx_products_category ON products (category);
+"""
 
+PRAGMAS = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+PRAGMA cache_size = -200000;
+PRAGMA temp_store = MEMORY;
+"""
+
+# Join queries timed after every load. Sales are collapsed to store x SKU
+# first (an in-order scan of the covering index), so the joins touch one row
+# per pair instead of one per sale.
+QUERIES = {
+    'category x traffic': """
+        SELECT p.category, st.traffic_profile,
+               COUNT(DISTINCT s.store_id) AS store_count,
+               SUM(s.units_sold) AS total_units
+        FROM (SELECT store_id, sku_id, SUM(units_sold) AS units_sold
+              FROM sales GROUP BY store_id, sku_id) s
+        JOIN stores st ON s.store_id = st.store_id
+        JOIN products p ON s.sku_id = p.sku_id
+        GROUP BY p.category, st.traffic_profile
+    """,
+    'store x sku SPLI': """
+        SELECT pl.store_id, pl.sku_id,
+               ROUND(s.revenue / (p.width_inches * pl.facings), 2) AS revenue_per_inch
+        FROM (SELECT store_id, sku_id, SUM(revenue) AS revenue
+              FROM sales GROUP BY store_id, sku_id) s
+        JOIN planogram pl ON s.store_id = pl.store_id AND s.sku_id = pl.sku_id
+        JOIN products p ON p.sku_id = pl.sku_id
+    """,
+}
+
+# The same questions answered from the materialized rollups
+ROLLUP_QUERIES = {
+    'category x traffic (rollup)': """
+        SELECT category, traffic_profile, store_count, total_units
+        FROM rollup_category_traffic
+    """,
+    'store x sku SPLI (rollup)': """
+        SELECT store_id, sku_id, ROUND(spli, 2) AS revenue_per_inch
+        FROM rollup_spli
+    """,
+}
+
+# ==========================================
+# 2. MATERIALIZED ROLLUPS
+# ==========================================
+# Additive rollups (store x SKU, weekly store x category) are folded forward
+# with only the newly loaded sales dates. The rest are derived from them and
+# the planogram, so refreshing never rescans the sales table.
+ROLLUP_TABLES = """
+CREATE TABLE IF NOT EXISTS rollup_store_sku (
+    store_id INTEGER NOT NULL,
+    sku_id INTEGER NOT NULL,
+    units_sold INTEGER NOT NULL,
+    revenue REAL NOT NULL,
+    margin REAL NOT NULL,
+    PRIMARY KEY (store_id, sku_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_store_category_week (
+    week_start TEXT NOT NULL,
+    store_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    units_sold INTEGER NOT NULL,
+    revenue REAL NOT NULL,
+    margin REAL NOT NULL,
+    PRIMARY KEY (week_start, store_id, category)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_spli (
+    store_id INTEGER NOT NULL,
+    sku_id INTEGER NOT NULL,
+    category TEXT,
+    shelf_id INTEGER,
+    linear_inches REAL,
+    revenue REAL,
+    spli REAL,
+    PRIMARY KEY (store_id, sku_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rollup_spli_rank ON rollup_spli (store_id, category, spli, sku_id);
+CREATE TABLE IF NOT EXISTS rollup_store_category (
+    store_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    units_sold INTEGER,
+    revenue REAL,
+    margin REAL,
+    linear_inches REAL,
+    spli REAL,
+    PRIMARY KEY (store_id, category)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_category_format (
+    category TEXT NOT NULL,
+    format TEXT NOT NULL,
+    store_count INTEGER,
+    revenue REAL,
+    linear_inches REAL,
+    spli REAL,
+    PRIMARY KEY (category, format)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_category_traffic (
+    category TEXT NOT NULL,
+    traffic_profile TEXT NOT NULL,
+    store_count INTEGER,
+    total_units INTEGER,
+    PRIMARY KEY (category, traffic_profile)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    sales_min_date TEXT,
+    sales_max_date TEXT
+);
+"""
+
+ADDITIVE_ROLLUPS = """
+INSERT INTO rollup_store_sku (store_id, sku_id, units_sold, revenue, margin)
+SELECT store_id, sku_id, SUM(units_sold), SUM(revenue), SUM(margin)
+FROM sales WHERE date > :after
+GROUP BY store_id, sku_id
+ON CONFLICT (store_id, sku_id) DO UPDATE SET
+    units_sold = units_sold + excluded.units_sold,
+    revenue = revenue + excluded.revenue,
+    margin = margin + excluded.margin;
+
+INSERT INTO rollup_store_category_week (week_start, store_id, category, units_sold, revenue, margin)
+SELECT date(s.date, '-6 days', 'weekday 1'), s.store_id, p.category,
+       SUM(s.units_sold), SUM(s.revenue), SUM(s.margin)
+FROM sales s JOIN products p ON p.sku_id = s.sku_id
+WHERE s.date > :after
+GROUP BY 1, 2, 3
+ON CONFLICT (week_start, store_id, category) DO UPDATE SET
+    units_sold = units_sold + excluded.units_sold,
+    revenue = revenue + excluded.revenue,
+    margin = margin + excluded.margin;
+"""
+
+DERIVED_ROLLUPS = """
+DELETE FROM rollup_spli;
+INSERT INTO rollup_spli
+SELECT pl.store_id, pl.sku_id, p.category, pl.shelf_id,
+       p.width_inches * pl.facings,
+       COALESCE(r.revenue, 0),
+       COALESCE(r.revenue, 0) / (p.width_inches * pl.facings)
+FROM planogram pl
+JOIN products p ON p.sku_id = pl.sku_id
+LEFT JOIN rollup_store_sku r ON r.store_id = pl.store_id AND r.sku_id = pl.sku_id;
+
+DELETE FROM rollup_store_category;
+INSERT INTO rollup_store_category
+SELECT store_id, category, SUM(units_sold), SUM(revenue), SUM(margin), SUM(linear_inches),
+       SUM(revenue) / NULLIF(SUM(linear_inches), 0)
+FROM (
+    SELECT r.store_id, p.category, r.units_sold, r.revenue, r.margin, 0 AS linear_inches
+    FROM rollup_store_sku r JOIN products p ON p.sku_id = r.sku_id
+    UNION ALL
+    SELECT pl.store_id, p.category, 0, 0, 0, p.width_inches * pl.facings
+    FROM planogram pl JOIN products p ON p.sku_id = pl.sku_id
+)
+GROUP BY store_id, category;
+
+DELETE FROM rollup_category_format;
+INSERT INTO rollup_category_format
+SELECT sc.category, st.format, COUNT(*), SUM(sc.revenue), SUM(sc.linear_inches),
+       SUM(sc.revenue) / NULLIF(SUM(sc.linear_inches), 0)
+FROM rollup_store_category sc JOIN stores st ON st.store_id = sc.store_id
+GROUP BY sc.category, st.format;
+
+DELETE FROM rollup_category_traffic;
+INSERT INTO rollup_category_traffic
+SELECT sc.category, st.traffic_profile, SUM(sc.units_sold > 0), SUM(sc.units_sold)
+FROM rollup_store_category sc JOIN stores st ON st.store_id = sc.store_id
+GROUP BY sc.category, st.traffic_profile;
+"""
+
+
+def _rollups_missing(conn):
+    # Sales loaded but no (or empty) rollups, e.g. a warehouse built before they existed
+    if conn.execute("SELECT name FROM sqlite_master WHERE name = 'sales'").fetchone() is None:
+        return False
+    if conn.execute("SELECT 1 FROM sales LIMIT 1").fetchone() is None:
+        return False
+    if conn.execute("SELECT name FROM sqlite_master WHERE name = 'rollup_store_sku'").fetchone() is None:
+        return True
+    return conn.execute("SELECT 1 FROM rollup_store_sku LIMIT 1").fetchone() is None
+
+
+@traced('warehouse.rollups')
+def refresh_rollups(conn, after_date=None):
+    """
+    Folds sales dated after `after_date` into the rollups, or rebuilds them
+    from the whole sales table when after_date is None (or when the rollups
+    don't exist yet, so the earlier dates would never be folded in). Dates
+    after the last one the rollups were built through are always folded in.
+    """
+    if after_date is not None and _rollups_missing(conn):
+        after_date = None
+    conn.executescript(ROLLUP_TABLES)
+    built = conn.execute("SELECT sales_max_date FROM rollup_meta").fetchone()
+    if after_date is not None and built is not None and built[0] is not None:
+        after_date = min(after_date, built[0])
+    with conn:
+        if after_date is None:
+            conn.execute("DELETE FROM rollup_store_sku")
+            conn.execute("DELETE FROM rollup_store_category_week")
+        for statement in ADDITIVE_ROLLUPS.split(';'):
+            if statement.strip():
+                conn.execute(statement, {'after': after_date or ''})
+        for statement in DERIVED_ROLLUPS.split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        # The sales date range the rollups now cover, checked before they are ranked
+        conn.execute("INSERT OR REPLACE INTO rollup_meta SELECT 1, MIN(date), MAX(date) FROM sales")
+
+# ==========================================
+# 3. LOADER
+# ==========================================
+
+def connect(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(PRAGMAS)
+    return conn
+
+
+def _is_legacy_schema(conn):
+    # Tables written by the old to_sql() loader have no declared keys
+    columns = conn.execute("PRAGMA table_info(sales)").fetchall()
+    return bool(columns) and not any(col[5] for col in columns)
+
+
+def _insert_frame(conn, table, df, conflict_sql):
+    columns = ', '.join(df.columns)
+    placeholders = ', '.join('?' * len(df.columns))
+    conn.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) {conflict_sql}",
+                     df.itertuples(index=False, name=None))
+
+
+def _upsert_sql(keys, columns):
+    updates = ', '.join(f"{c} = excluded.{c}" for c in columns if c not in keys)
+    return f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+
+
+def iter_new_sales(since=None, chunk_size=CHUNK_SIZE):
+    """
+    Sales chunks with date > since. The shared loader serves them from the
+    partitions (only those past `since` are opened) or the cached snapshot;
+    day offsets go back to date strings for the TEXT date column.
+    """
+    start = None if since is None else (pd.Timestamp(since) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    df = data_loader.load_sales(start_date=start)
+    for i in range(0, len(df), chunk_size):
+        yield data_loader.with_dates(df.iloc[i:i + chunk_size])
+
+
+@traced('warehouse.load', rows=lambda result: result[1])
+def load_warehouse(db_path=DB_PATH, full=False, since=None):
+    """
+    Loads the CSVs into the typed schema inside a single transaction, then
+    refreshes the rollups with just the new dates.
+    By default only sales dates newer than the latest date already in the
+    warehouse are inserted; `since` re-upserts every date after it, and
+    `full` rebuilds the database from scratch.
+    Returns (previous latest date, rows loaded).
+    """
+    conn = connect(db_path)
+    if full or _is_legacy_schema(conn):
+        for table in ('sales', 'planogram', 'products', 'stores'):
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.executescript(TABLES)
+
+    previous_max = conn.execute("SELECT MAX(date) FROM sales").fetchone()[0]
+    load_after = previous_max if since is None else since
+
+    df_products = data_loader.load_products()
+    df_stores = data_loader.load_stores()
+    df_plano = data_loader.load_planogram()
+
+    rows = 0
+    with conn:  # One transaction for the whole load
+        with stage('warehouse.dimensions', rows=len(df_stores) + len(df_products) + len(df_plano)):
+            _insert_frame(conn, 'stores', df_stores, _upsert_sql(['store_id'], df_stores.columns))
+            _insert_frame(conn, 'products', df_products, _upsert_sql(['sku_id'], df_products.columns))
+            # The planogram is a full snapshot: replace it wholesale
+            conn.execute("DELETE FROM planogram")
+            _insert_frame(conn, 'planogram', df_plano, '')
+
+        with stage('warehouse.sales_insert') as record:
+            for chunk in iter_new_sales(load_after):
+                _insert_frame(conn, 'sales', chunk, _upsert_sql(['date', 'store_id', 'sku_id'], chunk.columns))
+                rows += len(chunk)
+            record.rows = rows
+
+    with stage('warehouse.indexes'):
+        conn.executescript(INDEXES)
+    # Re-upserted dates would be double counted by a delta refresh
+    refresh_rollups(conn, after_date=previous_max if since is None else None)
+    with stage('warehouse.analyze'):
+        conn.execute("ANALYZE")
+    conn.close()
+    return previous_max, rows
+
+
+def time_queries(db_path=DB_PATH):
+    conn = connect(db_path)
+    timings = {}
+    for name, sql in {**QUERIES, **ROLLUP_QUERIES}.items():
+        start = time.perf_counter()
+        with stage('warehouse.query', query=name) as record:
+            result = conn.execute(sql).fetchall()
+            record.rows = len(result)
+        timings[name] = (time.perf_counter() - start, len(result))
+    conn.close()
+    return timings
+
+# ==========================================
+# 4. PUSH-DOWN QUERIES (SPLI Inside the Warehouse)
+# ==========================================
+# logic_engine --sql ranks every (store, category) here instead of in pandas:
+# ROW_NUMBER() over the rollup_spli rank index picks the worst SPLI SKU (ties
+# by sku_id, like find_delete_candidates), and only those rows come back.
+# A trailing window can't use the rollups, so it aggregates the sales rows
+# after the cutoff date (a range scan of the date key) into store x SKU totals.
+# Rollups that don't cover the sales table's date range are refused rather
+# than ranked.
+
+DELETE_CANDIDATE_COLUMNS = ['store_id', 'category', 'sku_id', 'shelf_id', 'facings', 'SPLI',
+                            'total_linear_width', 'height_inches']
+
+WORST_PERFORMERS = """
+SELECT store_id, category, sku_id, shelf_id, facings, spli, linear_inches, height_inches
+FROM (
+    SELECT r.store_id, r.category, r.sku_id, r.shelf_id, pl.facings, r.spli, r.linear_inches, p.height_inches,
+           ROW_NUMBER() OVER (PARTITION BY r.store_id, r.category ORDER BY r.spli, r.sku_id) AS spli_rank
+    FROM rollup_spli r
+    JOIN planogram pl ON pl.store_id = r.store_id AND pl.sku_id = r.sku_id
+    JOIN products p ON p.sku_id = r.sku_id
+)
+WHERE spli_rank = 1
+ORDER BY store_id, category
+"""
+
+WORST_PERFORMERS_WINDOW = """
+WITH store_sku AS (
+    SELECT store_id, sku_id, SUM(revenue) AS revenue
+    FROM sales
+    WHERE date > date((SELECT MAX(date) FROM sales), :offset)
+    GROUP BY store_id, sku_id
+), spli AS (
+    SELECT pl.store_id, p.category, pl.sku_id, pl.shelf_id, pl.facings,
+           COALESCE(s.revenue, 0) / (p.width_inches * pl.facings) AS spli,
+           p.width_inches * pl.facings AS linear_inches, p.height_inches
+    FROM planogram pl
+    JOIN products p ON p.sku_id = pl.sku_id
+    LEFT JOIN store_sku s ON s.store_id = pl.store_id AND s.sku_id = pl.sku_id
+)
+SELECT store_id, category, sku_id, shelf_id, facings, spli, linear_inches, height_inches
+FROM (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY store_id, category ORDER BY spli, sku_id) AS spli_rank
+    FROM spli
+)
+WHERE spli_rank = 1
+ORDER BY store_id, category
+"""
+
+
+def _check_rollups(conn, db_path):
+    if conn.execute("SELECT name FROM sqlite_master WHERE name = 'rollup_meta'").fetchone() is None:
+        raise RuntimeError(f"No rollups in '{db_path}'. Run data_warehouse.py first.")
+    built = conn.execute("SELECT sales_min_date, sales_max_date FROM rollup_meta").fetchone() or (None, None)
+    current = conn.execute("SELECT MIN(date), MAX(date) FROM sales").fetchone()
+    if tuple(built) != tuple(current) or _rollups_missing(conn):
+        raise RuntimeError(f"The rollups in '{db_path}' cover sales {built[0]}..{built[1]}, the sales table "
+                           f"{current[0]}..{current[1]}. Run data_warehouse.py first.")
+
+
+def sales_days(db_path=DB_PATH, window_days=None):
+    """Days of loaded sales (first to last date, inclusive), capped at window_days."""
+    conn = connect(db_path)
+    try:
+        days = conn.execute("SELECT CAST(julianday(MAX(date)) - julianday(MIN(date)) + 1 AS INTEGER) "
+                            "FROM sales").fetchone()[0] or 0
+    finally:
+        conn.close()
+    return min(days, window_days) if window_days else days
+
+
+def iter_delete_candidates(db_path=DB_PATH, window_days=None, chunk_size=CHUNK_SIZE):
+    """
+    Worst-SPLI SKU per (store, category), computed in the warehouse and
+    fetched `chunk_size` rows at a time as find_delete_candidates frames.
+    window_days limits revenue to the trailing N days of loaded sales.
+    """
+    if not os.path.exists(db_path):
+        raise RuntimeError(f"No warehouse at '{db_path}'. Run data_warehouse.py first.")
+    conn = connect(db_path)
+    try:
+        if window_days:
+            cursor = conn.execute(WORST_PERFORMERS_WINDOW, {'offset': f'-{int(window_days)} days'})
+        else:
+            _check_rollups(conn, db_path)
+            cursor = conn.execute(WORST_PERFORMERS)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=DELETE_CANDIDATE_COLUMNS)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the regional CSVs into the SQLite warehouse.")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--full', action='store_true', help="Drop and rebuild every table")
+    parser.add_argument('--since', help="Re-upsert every sales date after YYYY-MM-DD")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    previous_max, rows = load_warehouse(args.db, full=args.full, since=args.since)
+    elapsed = time.perf_counter() - start
+
+    print(f"Database '{args.db}' loaded: {rows:,} sales rows "
+          f"{'after ' + previous_max if previous_max and not args.full else '(full load)'} "
+          f"in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+    for name, (seconds, result_rows) in time_queries(args.db).items():
+        print(f"  {name}: {result_rows:,} rows in {seconds * 1000:.1f} ms")
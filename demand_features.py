@@ -0,0 +1,159 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage, traced
+from spli_aggregates import AGGREGATES_FILE
+
+DEMAND_FEATURES_FILE = 'demand_features.parquet'
+FEATURE_WINDOWS = (7, 28)
+SEASONAL_WINDOW = 28  # Trailing days behind the seasonal SPLI
+
+# ==========================================
+# DEMAND FEATURES (Rolling, Day-of-Week, Trend)
+# ==========================================
+# Time-series features per (store, sku), read off SalesAggregates (the
+# compressed date x pair array) instead of raw sales:
+#   * Rolling totals: SalesAggregates.window_metric (checkpoints plus deltas).
+#   * Day-of-week index per store: each weekday's average day over the
+#     store's average day (1.0 = a typical day, 1.5 = the weekend uplift).
+#   * Trend: least-squares slope of the daily metric over the window, from
+#     sum(y) and sum(t * y) per pair (one bincount over the window's entries).
+#   * Seasonal total: each day's sales divided by its store's weekday index,
+#     so a window that happens to hold two weekends isn't read as growth.
+# Every feature is memoized per window, so the delete-candidate and ranking
+# steps share one computation.
+
+
+class DemandFeatures:
+
+    def __init__(self, aggregates, metric='revenue'):
+        if aggregates.n_days == 0:
+            raise ValueError("No sales days in the aggregates")
+        self.aggregates = aggregates
+        self.metric = metric
+        self.n_pairs = aggregates.n_pairs
+        self.weekday = (aggregates.start_date.weekday() + np.arange(aggregates.n_days)) % 7
+        self.stores, self.store_row = np.unique(aggregates.pair_store, return_inverse=True)
+        self._cache = {}
+
+    def _memo(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _bounds(self, window):
+        return self.aggregates.window_bounds(window)
+
+    # ------------------------------------------
+    # Features
+    # ------------------------------------------
+    def rolling_total(self, window):
+        """Per-pair total over the trailing `window` days."""
+        return self._memo(('rolling', window), lambda: self.aggregates.window_metric(self.metric, window))
+
+    def weekday_totals(self, window=None):
+        """(7, pairs) totals by calendar weekday (0 = Monday) over the trailing window."""
+        def compute():
+            day, pair, value = self.aggregates.entries(self.metric, window)
+            return np.bincount(self.weekday[day] * self.n_pairs + pair, weights=value,
+                               minlength=7 * self.n_pairs).reshape(7, self.n_pairs)
+        return self._memo(('weekday_totals', window), compute)
+
+    def weekday_index(self):
+        """(stores, 7) day-of-week index over the whole history; 1.0 where a store has no sales."""
+        def compute():
+            by_store = np.stack([np.bincount(self.store_row, weights=row, minlength=len(self.stores))
+                                 for row in self.weekday_totals()], axis=1)
+            days = np.bincount(self.weekday, minlength=7)
+            per_day = by_store / np.maximum(days, 1)
+            average = by_store.sum(axis=1, keepdims=True) / len(self.weekday)
+            return np.where((average > 0) & (days > 0), per_day / np.where(average > 0, average, 1.0), 1.0)
+        return self._memo(('weekday_index',), compute)
+
+    def trend(self, window):
+        """Per-pair least-squares slope of the daily metric over the trailing window (per day)."""
+        def compute():
+            start, end = self._bounds(window)
+            n = end - start
+            if n < 2:
+                return np.zeros(self.n_pairs)
+            day, pair, value = self.aggregates.entries(self.metric, window)
+            sum_ty = np.bincount(pair, weights=day * value, minlength=self.n_pairs)
+            sum_y = self.rolling_total(window)
+            mean_t = (start + end - 1) / 2
+            return (sum_ty - mean_t * sum_y) / (n * (n * n - 1) / 12)
+        return self._memo(('trend', window), compute)
+
+    def seasonal_total(self, window):
+        """Per-pair total over the trailing window with every day divided by its weekday index."""
+        def compute():
+            index = self.weekday_index()[self.store_row]  # (pairs, 7)
+            return (self.weekday_totals(window).T / np.where(index > 0, index, 1.0)).sum(axis=1)
+        return self._memo(('seasonal', window), compute)
+
+    # ------------------------------------------
+    # Tables
+    # ------------------------------------------
+    def seasonal_store_sales(self, window=SEASONAL_WINDOW):
+        """store_sales-shaped frame (store_id, sku_id, revenue) of seasonally adjusted window revenue."""
+        df = pd.DataFrame({'store_id': self.aggregates.pair_store, 'sku_id': self.aggregates.pair_sku,
+                           'revenue': self.seasonal_total(window)})
+        start, end = self._bounds(window)
+        df.attrs['days'] = end - start
+        return df
+
+    def table(self, windows=FEATURE_WINDOWS):
+        """One row per (store, sku): rolling totals, trend slopes and seasonal totals per window."""
+        data = {'store_id': self.aggregates.pair_store, 'sku_id': self.aggregates.pair_sku}
+        for w in windows:
+            data[f'{self.metric}_{w}d'] = self.rolling_total(w)
+            data[f'seasonal_{self.metric}_{w}d'] = self.seasonal_total(w)
+            data[f'trend_{w}d'] = self.trend(w)
+        return pd.DataFrame(data)
+
+    def weekday_table(self):
+        """One row per store: its day-of-week index, Monday first."""
+        df = pd.DataFrame(self.weekday_index().round(4), columns=['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'])
+        df.insert(0, 'store_id', self.stores)
+        return df
+
+
+@traced('features.spli', rows=len)
+def feature_spli(df_features, df_plano, df_products):
+    """Adds SPLI columns (revenue feature / linear inches) for every revenue feature, over planogram pairs."""
+    df = df_plano.merge(df_products[['sku_id', 'width_inches']], on='sku_id')
+    df['total_linear_width'] = df['width_inches'] * df['facings']
+    df = df[['store_id', 'sku_id', 'total_linear_width']].merge(df_features, on=['store_id', 'sku_id'], how='left')
+    for column in [c for c in df_features.columns if c.startswith(('revenue_', 'seasonal_revenue_'))]:
+        df[column] = df[column].fillna(0)
+        df[column.replace('revenue', 'spli')] = df[column] / df['total_linear_width']
+    return df
+
+
+if __name__ == "__main__":
+    import data_loader
+    from logic_engine import refreshed_aggregates
+
+    parser = argparse.ArgumentParser(description="Rolling, day-of-week and trend features from the sales aggregates.")
+    parser.add_argument('--windows', type=int, nargs='+', default=list(FEATURE_WINDOWS))
+    parser.add_argument('--aggregates', default=AGGREGATES_FILE)
+    parser.add_argument('--output', default=DEMAND_FEATURES_FILE)
+    args = parser.parse_args()
+
+    aggregates = refreshed_aggregates(args.aggregates)
+    start = time.perf_counter()
+    features = DemandFeatures(aggregates)
+    with stage('features.table', rows=aggregates.n_pairs):
+        df_features = features.table(args.windows)
+    df_features = feature_spli(df_features, data_loader.load_planogram(), data_loader.load_products())
+    elapsed = time.perf_counter() - start
+    with stage('features.write', rows=len(df_features)):
+        df_features.to_parquet(args.output, index=False)
+
+    print(f"Features for {len(df_features):,} store x SKU pairs over {aggregates.n_days} days "
+          f"({', '.join(f'{w}d' for w in args.windows)}) in {elapsed:.2f}s -> {args.output}")
+    index = features.weekday_table()
+    print("Chain day-of-week index (median over stores): "
+          + ", ".join(f"{day} {index[day].median():.2f}" for day in index.columns[1:]))
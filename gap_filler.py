@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# GAP FILLER (Bounded Knapsack over Shelf Inches)
+# ==========================================
+# Instead of one replacement repeated `gap // width` times, pack the void with
+# the mix of SKUs and facings that maximizes revenue (or margin):
+#   * Capacity: the gap width in whole inches (SKU widths are rounded up).
+#   * Height:   a SKU only qualifies if it fits under the deleted item's height.
+#   * Bound:    at most MAX_FACINGS facings of any one SKU.
+
+MAX_FACINGS = 3
+
+
+def _binary_split(count):
+    # 1, 2, 4, ..., remainder: any 0..count facings is a subset of these pieces
+    pieces, k = [], 1
+    while count > 0:
+        take = min(k, count)
+        pieces.append(take)
+        count -= take
+        k *= 2
+    return pieces
+
+
+def solve_bounded_knapsack(widths, values, limits, capacity):
+    """
+    Bounded knapsack over integer inches.
+    Returns (facings per item, best value, inches used).
+    """
+    pieces = [(i, k) for i, limit in enumerate(limits) for k in _binary_split(int(limit))]
+    dp = np.zeros(capacity + 1)
+    take = np.zeros((len(pieces), capacity + 1), dtype=bool)
+
+    for p, (i, k) in enumerate(pieces):
+        w, v = k * widths[i], k * values[i]
+        if w > capacity:
+            continue
+        candidate = np.full(capacity + 1, -np.inf)
+        candidate[w:] = dp[:-w] + v
+        take[p] = candidate > dp
+        dp = np.maximum(dp, candidate)
+
+    # Smallest footprint that reaches the best value
+    used = int(np.argmax(dp))
+    best, c = dp[used], used
+    facings = np.zeros(len(widths), dtype=np.int64)
+    for p in range(len(pieces) - 1, -1, -1):
+        if take[p, c]:
+            i, k = pieces[p]
+            facings[i] += k
+            c -= k * widths[i]
+    return facings, float(best), used
+
+
+class GapFiller:
+    """
+    Packs gaps using a CandidateIndex. Solutions are memoized per
+    (category, gap inches, candidate pool), so stores that share the same
+    available candidates for a gap size reuse one DP.
+    """
+
+    def __init__(self, index, objective='revenue', max_facings=MAX_FACINGS):
+        if objective not in ('revenue', 'margin'):
+            raise ValueError(f"Unknown objective: {objective}")
+        self.index = index
+        self.max_facings = max_facings
+        self.values = index.price if objective == 'revenue' else index.price - index.cost
+        self._memo = {}
+
+    def candidate_pool(self, store_id, category, gap_width, gap_height):
+        """Catalog positions worth considering for this gap, after pruning dominated SKUs."""
+        index = self.index
+        capacity = int(np.floor(gap_width + 1e-9))
+        if category not in index.categories or capacity <= 0:
+            return np.empty(0, dtype=np.int64), capacity
+
+        start, end = index.fitting(category, gap_width)
+        positions = np.arange(start, end)
+        positions = positions[(index.height[positions] <= gap_height) & (self.values[positions] > 0)]
+        row = index.store_rows([store_id])[0]
+        positions = positions[~index.in_store(np.full(len(positions), row), positions)]
+
+        # For each integer width only the best few SKUs can ever be used:
+        # at most capacity // w facings fit, MAX_FACINGS of them per SKU
+        int_widths = np.maximum(np.ceil(index.width[positions] - 1e-9).astype(np.int64), 1)
+        order = np.lexsort((index.sku_id[positions], -self.values[positions], int_widths))
+        positions, int_widths = positions[order], int_widths[order]
+        rank = np.arange(len(positions)) - np.searchsorted(int_widths, int_widths)
+        useful = -(-(capacity // int_widths) // self.max_facings)
+        return positions[rank < useful], capacity
+
+    def solve(self, store_id, category, gap_width, gap_height):
+        """Returns (list of (sku_id, facings), value, inches used)."""
+        pool, capacity = self.candidate_pool(store_id, category, gap_width, gap_height)
+        key = (category, capacity, pool.tobytes())
+        if key not in self._memo:
+            if len(pool) == 0:
+                self._memo[key] = ([], 0.0, 0)
+            else:
+                widths = np.maximum(np.ceil(self.index.width[pool] - 1e-9).astype(np.int64), 1)
+                limits = np.minimum(capacity // widths, self.max_facings)
+                facings, value, used = solve_bounded_knapsack(widths, self.values[pool], limits, capacity)
+                chosen = np.flatnonzero(facings)
+                plan = [(int(self.index.sku_id[pool[i]]), int(facings[i])) for i in chosen]
+                self._memo[key] = (plan, value, used)
+        return self._memo[key]
+
+    def solve_many(self, deletes):
+        """Packs every gap in a delete-candidates table (one row per store x category)."""
+        rows = []
+        for gap in deletes[['store_id', 'category', 'total_linear_width', 'height_inches']].itertuples(index=False):
+            plan, value, used = self.solve(gap.store_id, gap.category, gap.total_linear_width, gap.height_inches)
+            rows.append({
+                'store_id': gap.store_id,
+                'category': gap.category,
+                'fill_plan': '; '.join(f"{sku} x{facings}" for sku, facings in plan),
+                'fill_sku_count': len(plan),
+                'fill_facings': sum(facings for _, facings in plan),
+                'fill_inches': used,
+                'fill_value': round(value, 2)
+            })
+        return pd.DataFrame(rows, columns=['store_id', 'category', 'fill_plan', 'fill_sku_count',
+                                           'fill_facings', 'fill_inches', 'fill_value'])
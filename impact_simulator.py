@@ -0,0 +1,147 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+import data_loader
+from data_generation import draw_daily_units, TRAFFIC_MULTIPLIERS, WEEKEND_MULTIPLIER, SEED
+from instrumentation import stage, traced
+
+RECOMMENDATIONS_FILE = 'recommendations.csv'
+IMPACT_SWAPS_FILE = 'impact_swaps.csv'
+IMPACT_STORES_FILE = 'impact_stores.csv'
+SCENARIOS = 1000     # Simulated weeks per swap
+HORIZON_DAYS = 7     # One weekly reset
+WEEKEND_DAYS = (5, 6)  # Day offsets (from a Monday) that get the weekend multiplier
+
+# ==========================================
+# MONTE CARLO IMPACT SIMULATOR
+# ==========================================
+# Scores a set of proposed swaps with the same demand model that generated the
+# sales (data_generation.draw_daily_units: sell probability x Poisson units x
+# store traffic x weekend). For every swap, the deleted and the added SKU are
+# each drawn independently for SCENARIOS x HORIZON_DAYS days, all as one array
+# per store. Each store draws from its own RNG stream, derived from the seed
+# and its store_id, so results don't depend on which other stores are in the
+# batch. Lifts are (new - old) revenue and margin over the horizon.
+# Packed multi-SKU fills (fill_plan) are not simulated, only the single add.
+
+PERCENTILES = [5, 50, 95]
+
+
+def _lift_stats(lifts, prefix):
+    """mean / P5 / P50 / P95 over the scenario axis (axis 0)."""
+    p5, p50, p95 = np.percentile(lifts, PERCENTILES, axis=0)
+    return {f'{prefix}_mean': lifts.mean(axis=0), f'{prefix}_p5': p5, f'{prefix}_p50': p50, f'{prefix}_p95': p95}
+
+
+def format_dollars(value):
+    return f"{'-' if value < 0 else ''}${abs(value):,.2f}"
+
+
+def store_stream(store_id, seed=SEED):
+    """The store's own RNG stream: independent of every other store's, reproducible on its own."""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(int(store_id),)))
+
+
+@traced('impact.simulate', rows=lambda result: len(result[0]))
+def simulate_swaps(df_recs, df_products, df_stores, scenarios=SCENARIOS, days=HORIZON_DAYS, seed=SEED):
+    """
+    Returns (per-swap stats, per-store stats, chain stats) for the swaps in a
+    recommendations table. Stats are the mean, P5, P50 and P95 of the revenue
+    and margin lift over `days`, across `scenarios` simulated periods.
+    """
+    swaps = df_recs.dropna(subset=['add_sku_id']).sort_values('store_id', kind='stable')
+    prices = df_products.set_index('sku_id')[['unit_price', 'unit_cost']]
+    old = prices.reindex(swaps['delete_sku_id'].astype(np.int64)).to_numpy()
+    new = prices.reindex(swaps['add_sku_id'].astype(np.int64)).to_numpy()
+    # (swap, side) price and unit margin, side 0 = deleted SKU, 1 = added SKU
+    price = np.stack([old[:, 0], new[:, 0]], axis=1)
+    unit_margin = np.stack([old[:, 0] - old[:, 1], new[:, 0] - new[:, 1]], axis=1)
+
+    traffic = df_stores.set_index('store_id')['traffic_profile'].astype(str).map(TRAFFIC_MULTIPLIERS)
+    weekend = np.where(np.isin(np.arange(days) % 7, WEEKEND_DAYS), WEEKEND_MULTIPLIER, 1.0)
+
+    store_ids = swaps['store_id'].to_numpy().astype(np.int64)
+    stores, starts = np.unique(store_ids, return_index=True)
+    bounds = np.append(starts, len(store_ids))
+
+    swap_parts, store_revenue, store_margin = [], np.empty((scenarios, len(stores))), np.empty((scenarios, len(stores)))
+    for i, store_id in enumerate(stores):
+        lo, hi = bounds[i], bounds[i + 1]
+        n = hi - lo
+
+        # Demand multiplier for every (scenario, swap, side, day), drawn in one call
+        mult = np.broadcast_to(traffic.get(store_id, 1.0) * weekend, (scenarios, n, 2, days)).ravel()
+        rows, units = draw_daily_units(store_stream(store_id, seed), mult, 1.0)
+        units = np.bincount(rows // days, weights=units, minlength=scenarios * n * 2).reshape(scenarios, n, 2)
+
+        revenue = units * price[lo:hi]
+        margin = units * unit_margin[lo:hi]
+        revenue_lift = revenue[:, :, 1] - revenue[:, :, 0]
+        margin_lift = margin[:, :, 1] - margin[:, :, 0]
+        swap_parts.append({**_lift_stats(revenue_lift, 'revenue_lift'), **_lift_stats(margin_lift, 'margin_lift')})
+        store_revenue[:, i] = revenue_lift.sum(axis=1)
+        store_margin[:, i] = margin_lift.sum(axis=1)
+
+    key_columns = ['store_id', 'category', 'delete_sku_id', 'add_sku_id']
+    df_swaps = swaps[key_columns].astype({'delete_sku_id': np.int64, 'add_sku_id': np.int64}).reset_index(drop=True)
+    if swap_parts:
+        stats = {name: np.concatenate([part[name] for part in swap_parts]) for name in swap_parts[0]}
+        df_swaps = pd.concat([df_swaps, pd.DataFrame(stats).round(2)], axis=1)
+    df_swaps['days'] = days
+
+    df_stores_impact = pd.DataFrame({
+        'store_id': stores, 'swaps': np.diff(bounds),
+        **_lift_stats(store_revenue, 'revenue_lift'), **_lift_stats(store_margin, 'margin_lift')
+    }).round(2)
+    df_stores_impact['days'] = days
+
+    # Scenario k of every store is one simulated chain-wide period
+    chain = {'swaps': len(swaps), 'scenarios': scenarios, 'days': days,
+             **{name: round(float(value), 2) for name, value in {
+                 **_lift_stats(store_revenue.sum(axis=1), 'revenue_lift'),
+                 **_lift_stats(store_margin.sum(axis=1), 'margin_lift')}.items()}}
+    return df_swaps, df_stores_impact, chain
+
+
+def write_impact(df_swaps, df_stores_impact, chain, swaps_path=IMPACT_SWAPS_FILE, stores_path=IMPACT_STORES_FILE):
+    """Per-swap stats to one CSV; per-store stats plus a final 'chain' row to the other."""
+    df_swaps.to_csv(swaps_path, index=False)
+    chain_row = pd.DataFrame([{'store_id': None, **{k: v for k, v in chain.items() if k != 'scenarios'}}])
+    pd.concat([df_stores_impact.assign(scope='store'), chain_row.assign(scope='chain')],
+              ignore_index=True).to_csv(stores_path, index=False)
+
+
+def load_impact(path=IMPACT_STORES_FILE):
+    """(per-store stats, chain stats row) from a written impact file."""
+    df = pd.read_csv(path)
+    return df[df['scope'] == 'store'].astype({'store_id': np.int64}), df[df['scope'] == 'chain'].iloc[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo revenue/margin lift of the recommended swaps.")
+    parser.add_argument('--recommendations', default=RECOMMENDATIONS_FILE)
+    parser.add_argument('--scenarios', type=int, default=SCENARIOS)
+    parser.add_argument('--days', type=int, default=HORIZON_DAYS, help="Simulated period per scenario")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--swaps-output', default=IMPACT_SWAPS_FILE)
+    parser.add_argument('--stores-output', default=IMPACT_STORES_FILE)
+    args = parser.parse_args()
+
+    df_recs = pd.read_csv(args.recommendations)
+    df_products = data_loader.load_products()
+    df_stores = data_loader.load_stores()
+
+    start = time.perf_counter()
+    df_swaps, df_stores_impact, chain = simulate_swaps(df_recs, df_products, df_stores,
+                                                       args.scenarios, args.days, args.seed)
+    elapsed = time.perf_counter() - start
+    with stage('impact.write', rows=len(df_swaps)):
+        write_impact(df_swaps, df_stores_impact, chain, args.swaps_output, args.stores_output)
+
+    print(f"{chain['swaps']:,} swaps across {len(df_stores_impact):,} stores x {args.scenarios:,} scenarios "
+          f"of {args.days} days in {elapsed:.2f}s -> {args.swaps_output}, {args.stores_output}")
+    for metric in ('revenue', 'margin'):
+        print(f"Chain-wide {metric} lift: mean ${chain[f'{metric}_lift_mean']:,.2f} "
+              f"(P5 ${chain[f'{metric}_lift_p5']:,.2f}, P95 ${chain[f'{metric}_lift_p95']:,.2f})")
@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# ==========================================
+# STAGE INSTRUMENTATION
+# ==========================================
+# Wrap any pipeline step in `with stage('name'):` or decorate it with
+# `@traced('name')` to record wall time, CPU time, row counts and (optionally)
+# peak tracemalloc memory. Stages nest, and the run is written as a Chrome
+# trace-event JSON file, which opens as a flame chart in Perfetto
+# (ui.perfetto.dev), chrome://tracing or speedscope.
+#
+# Everything is off unless switched on through the environment:
+#   MOE_TRACE=trace.json     record stages and write them here at exit
+#   MOE_TRACE_MEMORY=1       also track peak Python memory per stage (slower)
+#   MOE_PROFILE=name[,name]  cProfile those stages into <trace>.<name>.prof
+# When disabled, `stage()` returns a shared no-op context manager.
+# Only the main process writes the trace (pool workers are not recorded).
+
+TRACE_ENV = 'MOE_TRACE'
+MEMORY_ENV = 'MOE_TRACE_MEMORY'
+PROFILE_ENV = 'MOE_PROFILE'
+
+
+class StageRecord:
+    """What a stage knows about itself; set `.rows` inside the block to report throughput."""
+    __slots__ = ('name', 'rows', 'args', 'peak', 'child_peak')
+
+    def __init__(self, name, rows=None, args=None):
+        self.name = name
+        self.rows = rows
+        self.args = args or {}
+        self.peak = 0
+        self.child_peak = 0
+
+
+class _NullStage:
+    """Stand-in used while tracing is off: accepts `.rows` and does nothing."""
+    rows = None
+    args = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Tracer:
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.memory = False
+        self.profile = set()
+        self.events = []
+        self.pid = os.getpid()
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+        self._profiling = False
+
+    def enable(self, path, memory=False, profile=()):
+        self.enabled = True
+        self.path = path
+        self.memory = memory
+        self.profile = set(profile)
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        atexit.register(self.write)
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def _record(self, name, rows, args):
+        record = StageRecord(name, rows, args)
+        stack = self._stack()
+
+        if self.memory:
+            # One global peak counter: bank the parent's peak so far, then reset it for this stage
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        profiler = None
+        if name in self.profile and not self._profiling:
+            profiler, self._profiling = cProfile.Profile(), True
+            profiler.enable()
+
+        stack.append(record)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            stack.pop()
+
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                profiler.dump_stats(f"{self.path}.{name}.prof")
+
+            event_args = {'cpu_ms': round(cpu * 1000, 3), **record.args}
+            if self.memory:
+                record.peak = max(record.child_peak, tracemalloc.get_traced_memory()[1])
+                event_args['peak_mb'] = round(record.peak / 2**20, 2)
+                if stack:
+                    stack[-1].child_peak = max(stack[-1].child_peak, record.peak)
+            if record.rows is not None:
+                event_args['rows'] = int(record.rows)
+                event_args['rows_per_sec'] = round(record.rows / max(wall, 1e-9), 1)
+
+            self.events.append({
+                'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'pid': self.pid,
+                'tid': threading.get_ident(),
+                'ts': round((wall_start - self._origin) * 1e6, 1), 'dur': round(wall * 1e6, 1),
+                'args': event_args,
+            })
+
+    def write(self, path=None):
+        path = path or self.path
+        if not path or not self.events or os.getpid() != self.pid:
+            return None
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms',
+                       'otherData': {'argv': sys.argv}}, f)
+        return path
+
+
+TRACER = Tracer()
+if os.environ.get(TRACE_ENV):
+    TRACER.enable(os.environ[TRACE_ENV], memory=os.environ.get(MEMORY_ENV) == '1',
+                  profile=[p for p in os.environ.get(PROFILE_ENV, '').split(',') if p])
+
+
+def stage(name, rows=None, **args):
+    """Context manager timing one stage; extra keyword args are stored on the trace event."""
+    if not TRACER.enabled:
+        return _NULL_STAGE
+    return TRACER._record(name, rows, args)
+
+
+def traced(name=None, rows=None):
+    """
+    Decorator form of stage(). `rows` may be a function of the return value
+    (e.g. rows=len) to report throughput.
+    """
+    def decorate(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            with TRACER._record(stage_name, None, {}) as record:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    record.rows = rows(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def summary(events=None):
+    """Per-stage totals (calls, wall, CPU, rows) from recorded or loaded trace events."""
+    totals = {}
+    for event in (TRACER.events if events is None else events):
+        t = totals.setdefault(event['name'], {'calls': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0, 'rows': 0, 'peak_mb': 0.0})
+        t['calls'] += 1
+        t['wall_ms'] += event['dur'] / 1000
+        t['cpu_ms'] += event['args'].get('cpu_ms', 0)
+        t['rows'] += event['args'].get('rows', 0)
+        t['peak_mb'] = max(t['peak_mb'], event['args'].get('peak_mb', 0))
+    return totals
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize a MOE trace-event file by stage.")
+    parser.add_argument('trace')
+    args = parser.parse_args()
+
+    with open(args.trace) as f:
+        events = json.load(f)['traceEvents']
+    print(f"{'stage':<36} {'calls':>6} {'wall ms':>10} {'cpu ms':>10} {'rows':>12} {'peak MB':>8}")
+    for name, t in sorted(summary(events).items(), key=lambda kv: -kv[1]['wall_ms']):
+        print(f"{name:<36} {t['calls']:>6} {t['wall_ms']:>10.1f} {t['cpu_ms']:>10.1f} {t['rows']:>12,} {t['peak_mb']:>8.1f}")
@@ -1,89 +1,507 @@
+import os
+import argparse
+import time
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import data_loader
+import data_warehouse
+from candidate_index import CandidateIndex
+from gap_filler import GapFiller
+from performance_matrix import peer_scores
+from shelf_model import ShelfModel
+from instrumentation import stage, traced
+from shared_arrays import SharedArrays
+from partitioned_sales import PARTITION_DIR, MANIFEST_FILE
+from spli_aggregates import SalesAggregates, AGGREGATES_FILE
+from demand_features import DemandFeatures, SEASONAL_WINDOW
+
+TARGET_STORE = 3000  # Store 3000 (Bentonville Supercenter) for the single-store report
+RECOMMENDATIONS_FILE = 'recommendations.csv'
+SHARDS_PER_WORKER = 4  # Store shards queued per worker, so slow shards don't leave cores idle
 
 # ==========================================
 # 1. LOAD THE REGIONAL DATA
 # ==========================================
-df_sales = pd.read_csv('sales_regional.csv')
-df_plano = pd.read_csv('plano_regional.csv')
-df_products = pd.read_csv('products_regional.csv')
-df_stores = pd.read_csv('stores_regional.csv')
+
+# All tables come through the shared loader: compact dtypes, cached snapshots
+
+def load_regional_data():
+    df_sales = data_loader.load_sales()
+    df_plano, df_products, df_stores = load_master_data()
+    return df_sales, df_plano, df_products, df_stores
+
+
+def load_master_data():
+    df_plano = data_loader.load_planogram()
+    df_products = data_loader.load_products()
+    df_stores = data_loader.load_stores()
+    return df_plano, df_products, df_stores
 
 # ==========================================
 # 2. CALCULATE "SALES PER LINEAR INCH" (The Metric)
 # ==========================================
 # We need to know how valuable each inch of shelf space is.
 
-# Aggregated Sales by Store/SKU
-store_sales = df_sales.groupby(['store_id', 'sku_id'])['revenue'].sum().reset_index()
+def sales_days(df_sales):
+    """Days of sales history in df_sales, first to last day inclusive (0 when empty)."""
+    if df_sales.empty:
+        return 0
+    return int(df_sales['day'].max()) - int(df_sales['day'].min()) + 1
+
+
+@traced('spli.groupby', rows=len)
+def aggregate_store_sales(df_sales):
+    # Aggregated Sales by Store/SKU; attrs['days'] is the period the revenue covers
+    store_sales = df_sales.groupby(['store_id', 'sku_id'])['revenue'].sum().reset_index()
+    store_sales.attrs['days'] = sales_days(df_sales)
+    return store_sales
+
+
+def refreshed_aggregates(aggregates_path=AGGREGATES_FILE):
+    """The persistent aggregates, with only the sales days added since the last run folded in."""
+    aggregates = SalesAggregates.load_or_create(aggregates_path)
+    if os.path.exists(os.path.join(PARTITION_DIR, MANIFEST_FILE)):
+        aggregates.append_partitions()
+    else:
+        aggregates.append_sales(data_loader.load_sales())
+    aggregates.save(aggregates_path)
+    return aggregates
 
-# Merge with Planogram to get Facings
-performance_data = pd.merge(df_plano, store_sales, on=['store_id', 'sku_id'], how='left')
-performance_data['revenue'] = performance_data['revenue'].fillna(0) # Handle 0 sales items
 
-# Merge with Products to get Dimensions
-performance_data = pd.merge(performance_data, df_products, on='sku_id', how='left')
+@traced('spli.window', rows=len)
+def windowed_store_sales(window_days, aggregates_path=AGGREGATES_FILE):
+    """Store/SKU revenue for the trailing window from the persistent aggregates."""
+    aggregates = refreshed_aggregates(aggregates_path)
+    store_sales = aggregates.window_totals(window_days)[['store_id', 'sku_id', 'revenue']]
+    start, end = aggregates.window_bounds(window_days)
+    store_sales.attrs['days'] = end - start
+    return store_sales
 
-# CALCULATE EFFICIENCY METRICS
-# Total Width Used = Product Width * Facings
-performance_data['total_linear_width'] = performance_data['width_inches'] * performance_data['facings']
-# Sales Per Linear Inch (SPLI)
-performance_data['SPLI'] = performance_data['revenue'] / performance_data['total_linear_width']
+
+@traced('spli.seasonal', rows=len)
+def seasonal_store_sales(window_days=SEASONAL_WINDOW, aggregates_path=AGGREGATES_FILE):
+    """
+    Store/SKU revenue for the trailing window with each day divided by its
+    store's day-of-week index (demand_features.py), so SPLI reflects recent,
+    seasonality-adjusted sales rather than the flat whole-history sum.
+    """
+    return DemandFeatures(refreshed_aggregates(aggregates_path)).seasonal_store_sales(window_days)
+
+
+@traced('spli.merge', rows=len)
+def compute_performance(store_sales, df_plano, df_products):
+    # Merge with Planogram to get Facings
+    performance_data = pd.merge(df_plano, store_sales, on=['store_id', 'sku_id'], how='left')
+    performance_data['revenue'] = performance_data['revenue'].fillna(0) # Handle 0 sales items
+
+    # Merge with Products to get Dimensions
+    performance_data = pd.merge(performance_data, df_products, on='sku_id', how='left')
+
+    # CALCULATE EFFICIENCY METRICS
+    # Total Width Used = Product Width * Facings
+    performance_data['total_linear_width'] = performance_data['width_inches'] * performance_data['facings']
+    # Sales Per Linear Inch (SPLI)
+    performance_data['SPLI'] = performance_data['revenue'] / performance_data['total_linear_width']
+    return performance_data
 
 # ==========================================
-# 3. IDENTIFY THE "DELETE CANDIDATE"
+# 3. IDENTIFY THE "DELETE CANDIDATES"
 # ==========================================
-# Let's focus on Store 3000 (Bentonville Supercenter) for this analysis
-target_store = 3000
-store_data = performance_data[performance_data['store_id'] == target_store].copy()
 
-# Sort by SPLI (Low to High) to find the worst performers
-worst_performer = store_data.sort_values(by='SPLI').iloc[0]
-
-print(f"--- DELETE RECOMMENDATION ---")
-print(f"Store: {target_store}")
-print(f"Delete Candidate: {worst_performer['product_name']}")
-print(f"Reason: Lowest Sales Per Linear Inch (${round(worst_performer['SPLI'], 2)})")
-print(f"Gap Created: {worst_performer['total_linear_width']} inches")
-print(f"Category: {worst_performer['category']}")
-print("-" * 30)
+@traced('optimize.delete_candidates', rows=len)
+def find_delete_candidates(performance_data):
+    """
+    Worst-SPLI SKU for every (store, category) in one grouped pass.
+    Ties are broken by sku_id so the result is deterministic.
+    """
+    ranked = performance_data.sort_values(['store_id', 'category', 'SPLI', 'sku_id'])
+    worst = ranked.drop_duplicates(['store_id', 'category'])
+    return worst[['store_id', 'category', 'sku_id', 'shelf_id', 'facings', 'SPLI',
+                  'total_linear_width', 'height_inches']].reset_index(drop=True)
 
 # ==========================================
-# 4. THE OPTIMIZATION ENGINE (Find the Replacement)
+# 4. THE OPTIMIZATION ENGINE (Find the Replacements)
 # ==========================================
-# LOGIC: 
+# LOGIC:
 # 1. Must be same Category.
 # 2. Must fit in the Gap (New_Width * Facings <= Gap_Width).
 # 3. Must NOT already be in this store.
+# By default, 'Unit Price' is the proxy for "Premium Up-sell Opportunity".
+# With rank='peers' or 'knn' candidates are instead ranked by their SPLI in
+# comparable stores (performance_matrix.py), the closest thing we have to
+# "Market Trend" data.
+
+@traced('optimize.candidate_search', rows=len)
+def find_replacements(deletes, index, ranker=None):
+    """
+    Resolves the best replacement for every gap at once through the prebuilt
+    CandidateIndex: a binary search finds what fits, the assortment bitmap
+    drops what the store already carries. A ranker (PeerScores) replaces the
+    index's price ranking.
+    """
+    positions = (ranker or index).best_replacements(deletes['store_id'], deletes['category'], deletes['total_linear_width'])
+    found = positions >= 0
+    return pd.DataFrame({
+        'store_id': deletes['store_id'].to_numpy()[found],
+        'category': deletes['category'].to_numpy()[found],
+        'sku_id': index.sku_id[positions[found]],
+        'width_inches': index.width[positions[found]]
+    })
+
+
+@traced('optimize.shelf_space', rows=len)
+def find_shelf_replacements(deletes, index, shelves, ranker=None):
+    """
+    find_replacements with every gap widened by its shelf's free inches
+    (ShelfModel). Gaps on the same shelf compete for that space, so all the
+    swaps are tried in one what-if transaction; those that don't fit fall
+    back to their plain gap. Returns (deletes plus the width each replacement
+    was searched in, as shelf_space_width, replacements).
+    """
+    free = np.nan_to_num(shelves.free_inches(deletes['store_id'], deletes['shelf_id'])).clip(min=0)
+    widened = deletes.assign(total_linear_width=deletes['total_linear_width'] + free)
+    replacements = find_replacements(widened, index, ranker)
+
+    swaps = widened.merge(replacements, on=['store_id', 'category'], suffixes=('', '_add'))
+    applied, _ = shelves.what_if(swaps['store_id'], swaps['sku_id'], swaps['sku_id_add'], swaps['width_inches'],
+                                 swaps['total_linear_width'] // swaps['width_inches'])
+    rejected = swaps.loc[~applied, ['store_id', 'category']].assign(_rejected=True)
+    rejected = widened.merge(rejected, on=['store_id', 'category'], how='left')['_rejected'].eq(True).to_numpy()
+    if rejected.any():
+        widened.loc[rejected, 'total_linear_width'] = deletes.loc[rejected, 'total_linear_width']
+        replacements = pd.concat([replacements.merge(widened.loc[~rejected, ['store_id', 'category']]),
+                                  find_replacements(widened[rejected], index, ranker)], ignore_index=True)
+    return deletes.assign(shelf_space_width=widened['total_linear_width'].to_numpy()), replacements
+
+
+@traced('optimize.build_recommendations', rows=len)
+def build_recommendations(deletes, replacements, df_products):
+    """
+    Assembles the single delete/add recommendations table. gap_width is the
+    deleted item's footprint; shelf-space gaps also carry the (wider) width
+    the replacement was fitted into as shelf_space_width.
+    """
+    names = df_products.set_index('sku_id')[['product_name', 'unit_price']]
+
+    recs = deletes.rename(columns={
+        'sku_id': 'delete_sku_id', 'SPLI': 'delete_spli', 'facings': 'delete_facings',
+        'total_linear_width': 'gap_width', 'height_inches': 'gap_height'
+    })
+    recs = recs.merge(replacements.rename(columns={'sku_id': 'add_sku_id', 'width_inches': 'add_width'}),
+                      on=['store_id', 'category'], how='left')
+
+    recs['delete_product_name'] = recs['delete_sku_id'].map(names['product_name'])
+    recs['add_product_name'] = recs['add_sku_id'].map(names['product_name'])
+    recs['add_unit_price'] = recs['add_sku_id'].map(names['unit_price'])
+    recs['add_facings'] = (recs.get('shelf_space_width', recs['gap_width']) // recs['add_width']).astype('Int64')
+    recs['add_linear_width'] = recs['add_width'] * recs['add_facings']
+    recs['add_sku_id'] = recs['add_sku_id'].astype('Int64')
+
+    shelf_space = ['shelf_space_width'] if 'shelf_space_width' in recs.columns else []
+    return recs[['store_id', 'category', 'shelf_id',
+                 'delete_sku_id', 'delete_product_name', 'delete_spli', 'delete_facings', 'gap_width', 'gap_height',
+                 *shelf_space,
+                 'add_sku_id', 'add_product_name', 'add_width', 'add_facings', 'add_linear_width', 'add_unit_price']]
+
+
+def searched_gaps(gaps):
+    """The gaps with total_linear_width set to the width actually searched (shelf_space_width, if any)."""
+    if 'shelf_space_width' in gaps.columns:
+        return gaps.assign(total_linear_width=gaps['shelf_space_width'])
+    return gaps
+
+
+def resolve_replacements(deletes, index, ranker=None, shelves=None):
+    """(deletes, with shelf_space_width for shelf-space gaps, replacements) for the batch."""
+    if shelves is not None:
+        return find_shelf_replacements(deletes, index, shelves, ranker)
+    return deletes, find_replacements(deletes, index, ranker)
+
+
+@traced('optimize.batch', rows=len)
+def run_batch(store_sales, df_plano, df_products, index=None, pack=False, objective='revenue', rank='price',
+              df_stores=None, shelves=None):
+    """
+    Delete/replace recommendations for every store and category in the chain.
+    With pack=True each gap is also filled by the knapsack GapFiller, which may
+    mix several SKUs and facings (fill_* columns). rank='peers'/'knn' ranks the
+    replacements by peer-store SPLI instead of unit price. With a ShelfModel,
+    replacements may also use the free inches on the deleted item's shelf.
+    """
+    if index is None:
+        with stage('optimize.candidate_index'):
+            index = CandidateIndex.load_or_build(df_products, df_plano)
+    performance_data = compute_performance(store_sales, df_plano, df_products)
+    deletes = find_delete_candidates(performance_data)
+    ranker = None
+    if rank != 'price':
+        ranker = peer_scores(rank, index, performance_data,
+                             df_stores if df_stores is not None else data_loader.load_stores())
+    gaps, replacements = resolve_replacements(deletes, index, ranker, shelves)
+    recommendations = build_recommendations(gaps, replacements, df_products)
+
+    if pack:
+        with stage('optimize.pack', rows=len(deletes)):
+            fills = GapFiller(index, objective).solve_many(searched_gaps(gaps))
+        recommendations = recommendations.merge(fills, on=['store_id', 'category'], how='left')
+    return recommendations
+
+
+# Column types of a delete-candidates table with no rows (an empty warehouse)
+EMPTY_DELETE_DTYPES = {'store_id': 'int64', 'category': 'object', 'sku_id': 'int64', 'shelf_id': 'int64',
+                       'facings': 'int64', 'SPLI': 'float64', 'total_linear_width': 'float64',
+                       'height_inches': 'float64'}
+
+
+@traced('optimize.sql_batch', rows=len)
+def run_sql_batch(df_plano, df_products, db_path=data_warehouse.DB_PATH, window_days=None, index=None, pack=False,
+                  objective='revenue', shelves=None):
+    """
+    run_batch with the SPLI and worst-performer ranking pushed down into the
+    SQLite warehouse: no sales are loaded here, only the delete candidates
+    come back (in chunks). Replacements are still resolved in memory.
+    """
+    if index is None:
+        with stage('optimize.candidate_index'):
+            index = CandidateIndex.load_or_build(df_products, df_plano)
+    with stage('optimize.sql_delete_candidates') as record:
+        chunks = list(data_warehouse.iter_delete_candidates(db_path, window_days))
+        if chunks:
+            deletes = pd.concat(chunks, ignore_index=True)
+        else:
+            deletes = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in EMPTY_DELETE_DTYPES.items()})
+        record.rows = len(deletes)
+    gaps, replacements = resolve_replacements(deletes, index, shelves=shelves)
+    recommendations = build_recommendations(gaps, replacements, df_products)
+
+    if pack:
+        with stage('optimize.pack', rows=len(deletes)):
+            fills = GapFiller(index, objective).solve_many(searched_gaps(gaps))
+        recommendations = recommendations.merge(fills, on=['store_id', 'category'], how='left')
+    return recommendations
+
+# ==========================================
+# 5. PARALLEL BATCH (Store Shards on a Process Pool)
+# ==========================================
+# Stores are independent, so the batch is sharded by store range. The SPLI
+# table (sorted by store) and the candidate index arrays are published once in
+# shared memory; each task only carries a (start, end) row range, and workers
+# send back the small per-gap tables, which are merged and named here.
+
+@traced('spli.arrays')
+def performance_arrays(store_sales, df_plano, df_products, index):
+    """compute_performance as flat arrays sorted by store, plus each store's first row."""
+    plano = df_plano.sort_values('store_id', kind='stable')
+    store_id = plano['store_id'].to_numpy().astype(np.int64)
+    sku_id = plano['sku_id'].to_numpy().astype(np.int64)
+    facings = plano['facings'].to_numpy().astype(np.int64)
+
+    # Revenue per planogram row (0 for unsold items)
+    sales_keys = (store_sales['store_id'].to_numpy().astype(np.int64) << 32) | store_sales['sku_id'].to_numpy().astype(np.int64)
+    order = np.argsort(sales_keys)
+    sales_keys, sales_revenue = sales_keys[order], store_sales['revenue'].to_numpy(dtype=np.float64)[order]
+    keys = (store_id << 32) | sku_id
+    found = np.minimum(np.searchsorted(sales_keys, keys), max(len(sales_keys) - 1, 0))
+    revenue = np.where(sales_keys[found] == keys, sales_revenue[found], 0.0) if len(sales_keys) else np.zeros(len(keys))
+
+    products = df_products.sort_values('sku_id')
+    row = np.searchsorted(products['sku_id'].to_numpy().astype(np.int64), sku_id)
+    width = products['width_inches'].to_numpy(dtype=np.float64)[row]
+    category = np.searchsorted(np.array(index.categories), products['category'].astype(str).to_numpy()[row])
+
+    total_linear_width = width * facings
+    stores, store_start = np.unique(store_id, return_index=True)
+    return {
+        'store_id': store_id,
+        'sku_id': sku_id,
+        'shelf_id': plano['shelf_id'].to_numpy().astype(np.int64),
+        'facings': facings,
+        'category': category.astype(np.int32),
+        'SPLI': revenue / total_linear_width,
+        'total_linear_width': total_linear_width,
+        'height_inches': products['height_inches'].to_numpy(dtype=np.float64)[row],
+    }, np.append(store_start, len(store_id))
+
+
+_WORKER = {}
+
+
+def _init_worker(index_spec, table_spec, pack, objective, ranked=False):
+    index_block = SharedArrays.attach(index_spec)
+    table_block = SharedArrays.attach(table_spec)
+    index = CandidateIndex(index_block.arrays)
+    _WORKER.update(blocks=(index_block, table_block), index=index, table=table_block.arrays, ranked=ranked,
+                   category_names=np.array(index.categories),
+                   filler=GapFiller(index, objective) if pack else None)
+
+
+def _optimize_shard(bounds):
+    start, end = bounds
+    table = _WORKER['table']
+    performance_data = pd.DataFrame({name: column[start:end] for name, column in table.items()})
+    performance_data['category'] = _WORKER['category_names'][performance_data['category'].to_numpy()]
+
+    deletes = find_delete_candidates(performance_data)
+    # Peer ranking and shelf space span stores/shelves, so the parent resolves the merged deletes
+    replacements = None if _WORKER['ranked'] else find_replacements(deletes, _WORKER['index'])
+    fills = _WORKER['filler'].solve_many(deletes) if _WORKER['filler'] is not None else None
+    return deletes, replacements, fills
+
+
+@traced('optimize.parallel_batch', rows=len)
+def run_parallel_batch(store_sales, df_plano, df_products, workers, index=None, pack=False, objective='revenue',
+                       rank='price', df_stores=None, shelves=None):
+    """run_batch sharded across `workers` processes; returns the same table."""
+    if index is None:
+        with stage('optimize.candidate_index'):
+            index = CandidateIndex.load_or_build(df_products, df_plano)
+    table, store_ptr = performance_arrays(store_sales, df_plano, df_products, index)
+
+    n_stores = len(store_ptr) - 1
+    cuts = np.unique(np.linspace(0, n_stores, min(n_stores, workers * SHARDS_PER_WORKER) + 1).astype(np.int64))
+    shards = [(int(store_ptr[a]), int(store_ptr[b])) for a, b in zip(cuts[:-1], cuts[1:])]
+
+    with SharedArrays.create(index.arrays) as index_block, SharedArrays.create(table) as table_block:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(index_block.spec, table_block.spec, pack and shelves is None, objective,
+                                           rank != 'price' or shelves is not None)) as pool:
+            with stage('optimize.shards', workers=workers, shards=len(shards)):
+                results = list(pool.map(_optimize_shard, shards))
+
+    # Shards are contiguous store ranges, so concatenating keeps run_batch's order
+    deletes = pd.concat([r[0] for r in results], ignore_index=True)
+    if rank != 'price' or shelves is not None:
+        ranker = None
+        if rank != 'price':
+            ranker = peer_scores(rank, index, table, df_stores if df_stores is not None else data_loader.load_stores())
+        gaps, replacements = resolve_replacements(deletes, index, ranker, shelves)
+    else:
+        gaps, replacements = deletes, pd.concat([r[1] for r in results], ignore_index=True)
+    recommendations = build_recommendations(gaps, replacements, df_products)
+    if pack and shelves is not None:
+        # Shelf-space gaps are only known after the merge, so they are packed here
+        with stage('optimize.pack', rows=len(gaps)):
+            fills = GapFiller(index, objective).solve_many(searched_gaps(gaps))
+        recommendations = recommendations.merge(fills, on=['store_id', 'category'], how='left')
+    elif pack:
+        fills = pd.concat([r[2] for r in results], ignore_index=True)
+        recommendations = recommendations.merge(fills, on=['store_id', 'category'], how='left')
+    return recommendations
+
+# ==========================================
+# 6. SINGLE-STORE REPORT
+# ==========================================
+
+def run_single_store(store_sales, df_plano, df_products, target_store=TARGET_STORE):
+    performance_data = compute_performance(store_sales, df_plano, df_products)
+    store_data = performance_data[performance_data['store_id'] == target_store].copy()
+    if store_data.empty:
+        raise ValueError(f"Store {target_store} has no planogram rows")
+
+    # Sort by SPLI (Low to High) to find the worst performers
+    worst_performer = store_data.sort_values(by='SPLI').iloc[0]
+
+    print(f"--- DELETE RECOMMENDATION ---")
+    print(f"Store: {target_store}")
+    print(f"Delete Candidate: {worst_performer['product_name']}")
+    print(f"Reason: Lowest Sales Per Linear Inch (${round(worst_performer['SPLI'], 2)})")
+    print(f"Gap Created: {worst_performer['total_linear_width']} inches")
+    print(f"Category: {worst_performer['category']}")
+    print("-" * 30)
+
+    # Step A: Define the Constraint
+    gap_width = worst_performer['total_linear_width']
+    target_category = worst_performer['category']
+
+    # Step B: Look up Candidates in the prebuilt index
+    # (same category, not currently in store, FITS IN THE HOLE)
+    # Step C: Rank Candidates by 'Unit Price' (the index score)
+    index = CandidateIndex.load_or_build(df_products, df_plano)
+    position = index.best_replacements([target_store], [target_category], [gap_width])[0]
+    candidates = df_products[df_products['sku_id'] == index.sku_id[position]] if position >= 0 else df_products.iloc[0:0]
+
+    if not candidates.empty:
+        best_replacement = candidates.iloc[0]
+
+        # Calculate fit
+        facings_fit = int(gap_width // best_replacement['width_inches'])
+
+        print(f"--- ADD RECOMMENDATION ---")
+        print(f"Proposed Item: {best_replacement['product_name']}")
+        print(f"Why: Top available item fitting the {gap_width}\" gap.")
+        print(f"Item Width: {best_replacement['width_inches']}\"")
+        print(f"Suggested Facings: {facings_fit}")
+        print(f"New Linear Width: {best_replacement['width_inches'] * facings_fit}\"")
+        print(f"Potential Revenue Upside: Higher price point item (${best_replacement['unit_price']})")
+    else:
+        print("No valid replacement found that fits dimensions.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find delete/replace recommendations by Sales Per Linear Inch.")
+    parser.add_argument('--batch', action='store_true', help="Recommend a swap for every store and category")
+    parser.add_argument('--store', type=int, default=TARGET_STORE, help="Store for the single-store report")
+    parser.add_argument('--output', default=RECOMMENDATIONS_FILE, help="Where --batch writes its table")
+    parser.add_argument('--pack', action='store_true', help="Also pack each gap with the knapsack gap filler")
+    parser.add_argument('--objective', choices=['revenue', 'margin'], default='revenue', help="What --pack maximizes")
+    parser.add_argument('--window', type=int, help="Use only the trailing N days of sales (via the incremental aggregates)")
+    parser.add_argument('--spli', choices=['flat', 'seasonal'], default='flat',
+                        help=f"SPLI from raw revenue, or from day-of-week adjusted revenue over --window "
+                             f"(default {SEASONAL_WINDOW}) days")
+    parser.add_argument('--workers', type=int, default=1, help="Processes for --batch (stores are sharded across them)")
+    parser.add_argument('--rank', choices=['price', 'peers', 'knn'], default='price',
+                        help="Rank --batch replacements by unit price, or by SPLI in same-segment / most similar stores")
+    parser.add_argument('--shelf-space', action='store_true',
+                        help="Let --batch replacements also use the free inches on the deleted item's shelf")
+    parser.add_argument('--sql', action='store_true',
+                        help="Compute --batch SPLI and delete candidates inside the SQLite warehouse")
+    parser.add_argument('--db', default=data_warehouse.DB_PATH, help="Warehouse used by --sql")
+    args = parser.parse_args()
+    if args.sql and (not args.batch or args.workers > 1 or args.rank != 'price' or args.spli != 'flat'):
+        parser.error("--sql runs a single-process --batch with --rank price and --spli flat")
+
+    df_plano, df_products, df_stores = load_master_data()
+    if not args.batch and not (df_plano['store_id'] == args.store).any():
+        parser.error(f"--store {args.store} has no planogram rows")
+    if args.sql:
+        store_sales = None  # Sales stay in the warehouse
+        spli_days = data_warehouse.sales_days(args.db, args.window)
+    elif args.spli == 'seasonal':
+        store_sales = seasonal_store_sales(args.window or SEASONAL_WINDOW)
+    elif args.window:
+        store_sales = windowed_store_sales(args.window)
+    else:
+        store_sales = aggregate_store_sales(data_loader.load_sales())
+    if store_sales is not None:
+        spli_days = store_sales.attrs['days']
+
+    if args.batch:
+        start = time.perf_counter()
+        shelves = ShelfModel.from_planogram(df_plano, df_products) if args.shelf_space else None
+        if args.sql:
+            recommendations = run_sql_batch(df_plano, df_products, args.db, args.window, pack=args.pack,
+                                            objective=args.objective, shelves=shelves)
+        elif args.workers > 1:
+            recommendations = run_parallel_batch(store_sales, df_plano, df_products, args.workers, pack=args.pack,
+                                                 objective=args.objective, rank=args.rank, df_stores=df_stores,
+                                                 shelves=shelves)
+        else:
+            recommendations = run_batch(store_sales, df_plano, df_products, pack=args.pack, objective=args.objective,
+                                        rank=args.rank, df_stores=df_stores, shelves=shelves)
+        elapsed = time.perf_counter() - start
+        # The days delete_spli was scored over, so readers can turn it into weekly figures
+        recommendations['spli_days'] = spli_days
 
-# Step A: Define the Constraint
-gap_width = worst_performer['total_linear_width']
-target_category = worst_performer['category']
-existing_skus = store_data['sku_id'].unique()
-
-# Step B: Filter the Master Catalog for Candidates
-candidates = df_products[
-    (df_products['category'] == target_category) &      # Same Category
-    (~df_products['sku_id'].isin(existing_skus)) &      # Not currently in store
-    (df_products['width_inches'] <= gap_width)          # FITS IN THE HOLE
-].copy()
-
-# Step C: Rank Candidates
-# In a real scenario, we'd use "Market Trend" data. 
-# Here, we will use 'Unit Price' as a proxy for "Premium Up-sell Opportunity"
-candidates = candidates.sort_values(by='unit_price', ascending=False)
-
-if not candidates.empty:
-    best_replacement = candidates.iloc[0]
-    
-    # Calculate fit
-    facings_fit = int(gap_width // best_replacement['width_inches'])
-    
-    print(f"--- ADD RECOMMENDATION ---")
-    print(f"Proposed Item: {best_replacement['product_name']}")
-    print(f"Why: Top available item fitting the {gap_width}\" gap.")
-    print(f"Item Width: {best_replacement['width_inches']}\"")
-    print(f"Suggested Facings: {facings_fit}")
-    print(f"New Linear Width: {best_replacement['width_inches'] * facings_fit}\"")
-    print(f"Potential Revenue Upside: Higher price point item (${best_replacement['unit_price']})")
-else:
-    print("No valid replacement found that fits dimensions.")
\ No newline at end of file
+        with stage('optimize.write_csv', rows=len(recommendations)):
+            recommendations.to_csv(args.output, index=False)
+        print(f"{len(recommendations)} recommendations across {recommendations['store_id'].nunique()} stores "
+              f"in {elapsed:.3f}s -> {args.output}")
+        if shelves is not None:
+            swaps = recommendations.dropna(subset=['add_sku_id'])
+            _, reset = shelves.what_if(swaps['store_id'], swaps['delete_sku_id'], swaps['add_sku_id'],
+                                       swaps['add_width'], swaps['add_facings'])
+            print(f"Shelf check: {reset['applied']:,} of {reset['swaps']:,} swaps fit their shelves, "
+                  f"{reset['inches_added']:+,.1f} inches of product added chain-wide")
+    else:
+        run_single_store(store_sales, df_plano, df_products, args.store)
@@ -0,0 +1,65 @@
+import json
+import time
+import random
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from communication_agent import get_ai_response
+
+# ==========================================
+# LOCAL MOCK LLM SERVER
+# ==========================================
+# Stands in for the LLM API so the communication pipeline can be load-tested
+# offline. POST {"prompt": ...} -> {"text": ...} with the canned responses,
+# after an optional simulated latency; a fraction of requests can be failed
+# with 503 to exercise the client's retries.
+
+PORT = 8765
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.0        # Mean seconds per response
+    failure_rate = 0.0   # Share of requests answered with 503
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+        if random.random() < self.failure_rate:
+            self.send_error(503, "Simulated overload")
+            return
+
+        payload = json.dumps({'text': get_ai_response(body.get('prompt', '')) or ''}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # Keep the console quiet under load
+
+
+def serve(port=PORT, latency=0.0, failure_rate=0.0):
+    MockLLMHandler.latency = latency
+    MockLLMHandler.failure_rate = failure_rate
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockLLMHandler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve canned LLM responses over HTTP for offline testing.")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--latency', type=float, default=0.0, help="Mean response latency in seconds")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of requests failed with 503")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.failure_rate)
+    print(f"Mock LLM listening on http://127.0.0.1:{args.port} "
+          f"(latency {args.latency}s, failure rate {args.failure_rate:.0%}). Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,131 @@
+import os
+import json
+import glob
+import pandas as pd
+from datetime import datetime, timedelta
+
+# ==========================================
+# DATE-PARTITIONED SALES STORAGE
+# ==========================================
+# Sales are written one partition at a time (a day or a week of rows) into
+# Parquet files, plus a small manifest describing the date range of each file.
+# Readers use the manifest to open only the partitions a date window needs.
+
+PARTITION_DIR = 'sales_partitions'
+MANIFEST_FILE = 'manifest.json'
+
+
+def _partition_start(date, freq):
+    if freq == 'day':
+        return date
+    if freq == 'week':
+        return date - timedelta(days=date.weekday())  # Weeks start on Monday
+    raise ValueError(f"Unknown partition frequency: {freq}")
+
+
+class PartitionedSalesWriter:
+    """
+    Streams daily sales frames into date-partitioned Parquet files.
+    Only the partition currently being filled is held in memory.
+    """
+
+    def __init__(self, root=PARTITION_DIR, freq='day'):
+        self.root = root
+        self.freq = freq
+        self.partitions = []
+        self._buffer = []
+        self._buffer_key = None
+
+        # Start from a clean directory so stale partitions never leak into reads
+        os.makedirs(root, exist_ok=True)
+        for path in glob.glob(os.path.join(root, '*.parquet')) + [os.path.join(root, MANIFEST_FILE)]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def write(self, date, df_day):
+        key = _partition_start(date, self.freq)
+        if self._buffer_key is not None and key != self._buffer_key:
+            self._flush()
+        self._buffer_key = key
+        self._buffer.append((date, df_day))
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        df = pd.concat([frame for _, frame in self._buffer], ignore_index=True)
+        file_name = f"{self.freq}={self._buffer_key.strftime('%Y-%m-%d')}.parquet"
+        df.to_parquet(os.path.join(self.root, file_name), index=False)
+
+        self.partitions.append({
+            'file': file_name,
+            'start_date': self._buffer[0][0].strftime('%Y-%m-%d'),
+            'end_date': self._buffer[-1][0].strftime('%Y-%m-%d'),
+            'rows': len(df)
+        })
+        self._buffer = []
+        self._buffer_key = None
+
+    def close(self):
+        self._flush()
+        manifest = {
+            'freq': self.freq,
+            'rows': sum(p['rows'] for p in self.partitions),
+            'partitions': self.partitions
+        }
+        with open(os.path.join(self.root, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def read_manifest(root=PARTITION_DIR):
+    with open(os.path.join(root, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def select_partitions(manifest, start_date=None, end_date=None):
+    """Returns the manifest entries overlapping [start_date, end_date] (ISO strings, inclusive)."""
+    selected = []
+    for part in manifest['partitions']:
+        if start_date is not None and part['end_date'] < start_date:
+            continue
+        if end_date is not None and part['start_date'] > end_date:
+            continue
+        selected.append(part)
+    return selected
+
+
+def read_sales_partitions(root=PARTITION_DIR, start_date=None, end_date=None, columns=None):
+    """
+    Loads sales rows between start_date and end_date (inclusive, 'YYYY-MM-DD'),
+    opening only the partitions that overlap the window.
+    """
+    if isinstance(start_date, datetime):
+        start_date = start_date.strftime('%Y-%m-%d')
+    if isinstance(end_date, datetime):
+        end_date = end_date.strftime('%Y-%m-%d')
+
+    manifest = read_manifest(root)
+    parts = select_partitions(manifest, start_date, end_date)
+    read_columns = None if columns is None else sorted(set(columns) | {'date'})
+
+    frames = []
+    for part in parts:
+        df = pd.read_parquet(os.path.join(root, part['file']), columns=read_columns)
+        # Week partitions can straddle the window edges
+        if start_date is not None and part['start_date'] < start_date:
+            df = df[df['date'] >= start_date]
+        if end_date is not None and part['end_date'] > end_date:
+            df = df[df['date'] <= end_date]
+        frames.append(df)
+
+    if not frames:
+        return pd.DataFrame(columns=read_columns)
+    df = pd.concat(frames, ignore_index=True)
+    return df if columns is None else df[list(columns)]
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from instrumentation import traced
+
+# ==========================================
+# STORE x SKU PERFORMANCE MATRIX
+# ==========================================
+# Ranks replacement candidates by how they sell in comparable stores instead
+# of by unit price:
+#   * X is a sparse (CSR) store x SKU matrix of SPLI, laid out on the
+#     CandidateIndex axes (its store_ids rows, sku_universe columns).
+#   * Peers are either the other stores of the same format + traffic profile,
+#     or each store's K nearest neighbours by cosine similarity over X.
+#   * Peer scores are one sparse product: P = W @ X. For segments W is never
+#     formed; every store in a segment shares one row of summed SPLI.
+#   * Every gap is ranked in one pass per category: the nonzeros of the store's
+#     score row, cut to the SKUs that fit the gap and filtered through the
+#     assortment bitmap.
+# Gaps with no peer evidence fall back to the index's price ranking.
+
+KNN_NEIGHBORS = 10
+SIMILARITY_BLOCK = 1024  # Stores per block of the store x store similarity product
+
+
+@traced('peers.matrix', rows=lambda matrix: matrix.nnz)
+def spli_matrix(performance_data, index):
+    """CSR store x SKU SPLI from compute_performance output (or performance_arrays' table)."""
+    rows = index.store_rows(performance_data['store_id'])
+    cols = np.searchsorted(index.sku_universe, np.asarray(performance_data['sku_id'], dtype=np.int64))
+    spli = np.asarray(performance_data['SPLI'], dtype=np.float64)
+    keep = (rows >= 0) & (spli > 0)
+    return sparse.csr_matrix((spli[keep], (rows[keep], cols[keep])),
+                             shape=(len(index.store_ids), len(index.sku_universe)))
+
+
+class PeerScores:
+    """
+    Peer-weighted SPLI for every store x SKU: `scores` rows are shared by all
+    stores mapped to them through `score_row` (one per index store row).
+    """
+
+    def __init__(self, index, scores, score_row):
+        self.index = index
+        self.scores = scores.tocsr()
+        self.score_row = score_row
+
+    @classmethod
+    @traced('peers.segments')
+    def by_segment(cls, index, matrix, df_stores, keys=('format', 'traffic_profile')):
+        """Peers are the other stores with the same format and traffic profile."""
+        stores = df_stores.set_index('store_id').reindex(index.store_ids)
+        segment, _ = pd.factorize(pd.MultiIndex.from_frame(stores[list(keys)].astype(str)))
+        members = sparse.csr_matrix((np.ones(len(segment)), (segment, np.arange(len(segment)))))
+
+        # Segment sums. A store's own SPLI only lands on SKUs it carries, which
+        # the bitmap excludes anyway, so the shared sum ranks exactly like the
+        # sum over its peers alone.
+        peer_count = np.maximum(np.bincount(segment) - 1, 1)
+        scores = sparse.diags(1.0 / peer_count) @ (members @ matrix)
+        return cls(index, scores, segment)
+
+    @classmethod
+    @traced('peers.knn')
+    def by_neighbors(cls, index, matrix, k=KNN_NEIGHBORS):
+        """Peers are the k most similar stores by cosine similarity of their SPLI rows."""
+        n = matrix.shape[0]
+        k = min(k, n - 1)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        unit = sparse.diags(1.0 / np.where(norms > 0, norms, 1.0)) @ matrix
+
+        # Top-k per row, one block of rows at a time to bound the dense product
+        neighbor_rows, neighbor_cols, neighbor_weights = [], [], []
+        for start in range(0, n, SIMILARITY_BLOCK):
+            stop = min(start + SIMILARITY_BLOCK, n)
+            similarity = (unit[start:stop] @ unit.T).toarray()
+            similarity[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+            nearest = np.argpartition(-similarity, k - 1, axis=1)[:, :k] if k > 0 else np.empty((stop - start, 0), int)
+            weight = np.take_along_axis(similarity, nearest, axis=1).clip(min=0)
+            weight /= np.maximum(weight.sum(axis=1, keepdims=True), 1e-12)
+            neighbor_rows.append(np.repeat(np.arange(start, stop), nearest.shape[1]))
+            neighbor_cols.append(nearest.ravel())
+            neighbor_weights.append(weight.ravel())
+
+        weights = sparse.csr_matrix((np.concatenate(neighbor_weights),
+                                     (np.concatenate(neighbor_rows), np.concatenate(neighbor_cols))), shape=(n, n))
+        weights.eliminate_zeros()
+        return cls(index, weights @ matrix, np.arange(n))
+
+    def best_replacements(self, store_ids, categories, gap_widths):
+        """
+        Same contract as CandidateIndex.best_replacements: the highest peer score
+        SKU that fits each gap and isn't stocked (ties by sku_id), as catalog
+        positions; gaps without peer evidence use the index's own ranking.
+        """
+        index = self.index
+        store_ids = np.asarray(store_ids)
+        categories = np.asarray(categories).astype(str)
+        gap_widths = np.asarray(gap_widths, dtype=np.float64)
+        result = np.full(len(store_ids), -1, dtype=np.int64)
+        rows = index.store_rows(store_ids)
+
+        for category in np.unique(categories):
+            if category not in index._category_pos:
+                continue
+            c = index._category_pos[category]
+            lo, hi = index.cat_ptr[c], index.cat_ptr[c + 1]
+            gaps = np.flatnonzero((categories == category) & (rows >= 0))
+
+            # Score columns in catalog order (width-sorted), so "fits" is a column prefix
+            block = self.scores[:, index.sku_col[lo:hi]].tocsr()
+            fit_end = np.searchsorted(index.width[lo:hi], gap_widths[gaps], side='right')
+
+            # Every (gap, scored SKU) pair of the category in one flat array
+            score_rows = self.score_row[rows[gaps]]
+            starts = block.indptr[score_rows]
+            lengths = block.indptr[score_rows + 1] - starts
+            owner = np.repeat(np.arange(len(gaps)), lengths)
+            flat = np.arange(len(owner)) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+            position = lo + block.indices[flat]
+            score = block.data[flat]
+
+            ok = (block.indices[flat] < fit_end[owner]) & (score > 0)
+            owner, position, score = owner[ok], position[ok], score[ok]
+            ok = ~index.in_store(rows[gaps][owner], position)
+            owner, position, score = owner[ok], position[ok], score[ok]
+
+            order = np.lexsort((index.sku_id[position], -score, owner))
+            first = np.unique(owner[order], return_index=True)[1]
+            result[gaps[owner[order][first]]] = position[order][first]
+
+        missing = np.flatnonzero(result < 0)
+        if len(missing):
+            result[missing] = index.best_replacements(store_ids[missing], categories[missing], gap_widths[missing])
+        return result
+
+
+def peer_scores(rank, index, performance_data, df_stores, k=KNN_NEIGHBORS):
+    """The ranker for logic_engine --rank: 'peers' (segments) or 'knn'."""
+    matrix = spli_matrix(performance_data, index)
+    if rank == 'peers':
+        return PeerScores.by_segment(index, matrix, df_stores)
+    return PeerScores.by_neighbors(index, matrix, k)
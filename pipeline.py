@@ -0,0 +1,348 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from partitioned_sales import PARTITION_DIR
+
+# ==========================================
+# MOE PIPELINE (DAG Runner with a Content-Hashed Stage Cache)
+# ==========================================
+# generate -> load (warehouse), optimize -> simulate -> communicate; optimize -> dashboard
+#
+# Every stage declares its inputs, outputs, parameters and the code it runs.
+# Its cache key is a hash of all of them. A stage whose key and outputs match
+# the last successful run is skipped. Stages whose dependencies are done run
+# concurrently, each in its own process. The optimize stage is itself split
+# into store groups cached one by one, so editing one store's planogram only
+# re-optimizes that store's group.
+#
+# The generate stage is the data source: it only runs when its outputs are
+# missing (or with --regenerate), so edited CSVs are never overwritten.
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = '.moe_cache'
+GROUP_SIZE = 100  # Stores per cached optimize partition
+JOBS = 4          # Stages run at once
+
+MASTER_FILES = ['stores_regional.csv', 'products_regional.csv', 'plano_regional.csv']
+SALES_SOURCES = ['sales_regional.csv', PARTITION_DIR]
+
+# ==========================================
+# 1. FINGERPRINTS
+# ==========================================
+# Content hashes of files and directories, memoized on (size, mtime) so an
+# unchanged multi-GB input isn't re-read on every run.
+
+_fingerprint_lock = threading.Lock()
+_fingerprint_memo = None
+
+
+def _memo_path():
+    return os.path.join(CACHE_DIR, 'fingerprints.json')
+
+
+def _file_fingerprint(path):
+    global _fingerprint_memo
+    stat = os.stat(path)
+    with _fingerprint_lock:
+        if _fingerprint_memo is None:
+            _fingerprint_memo = {}
+            if os.path.exists(_memo_path()):
+                with open(_memo_path()) as f:
+                    _fingerprint_memo = json.load(f)
+        cached = _fingerprint_memo.get(os.path.abspath(path))
+    if cached and cached[:2] == [stat.st_size, stat.st_mtime]:
+        return cached[2]
+
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    with _fingerprint_lock:
+        _fingerprint_memo[os.path.abspath(path)] = [stat.st_size, stat.st_mtime, h.hexdigest()]
+    return h.hexdigest()
+
+
+def fingerprint(path):
+    """Content hash of a file or a whole directory tree ('' if it doesn't exist)."""
+    if os.path.isfile(path):
+        return _file_fingerprint(path)
+    if not os.path.isdir(path):
+        return ''
+    h = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            h.update(os.path.relpath(full, path).encode())
+            h.update(_file_fingerprint(full).encode())
+    return h.hexdigest()
+
+
+def save_fingerprints():
+    with _fingerprint_lock:
+        if _fingerprint_memo is not None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # The optimize stage's own process saves the memo too; replace the file atomically
+            tmp = f"{_memo_path()}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(_fingerprint_memo, f)
+            os.replace(tmp, _memo_path())
+
+
+def code_fingerprint(modules):
+    return hashlib.sha1(''.join(fingerprint(os.path.join(CODE_DIR, m)) for m in modules).encode()).hexdigest()
+
+# ==========================================
+# 2. STAGES
+# ==========================================
+
+class Stage:
+
+    def __init__(self, name, command, inputs=(), outputs=(), deps=(), params=None, code=(), source=False):
+        self.name = name
+        self.command = command
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.params = params or {}
+        self.code = list(code)
+        self.source = source  # Never re-run while its outputs exist
+
+    def key(self):
+        h = hashlib.sha1(json.dumps({'stage': self.name, 'params': self.params, 'command': self.command[2:]},
+                                    sort_keys=True).encode())
+        h.update(code_fingerprint(self.code).encode())
+        for path in self.inputs:
+            h.update(f"{path}:{fingerprint(path)}".encode())
+        return h.hexdigest()
+
+    def _stamp_path(self):
+        return os.path.join(CACHE_DIR, 'stamps', f"{self.name}.json")
+
+    def is_fresh(self, key):
+        if not all(os.path.exists(path) for path in self.outputs):
+            return False
+        if self.source:
+            return True
+        if not os.path.exists(self._stamp_path()):
+            return False
+        with open(self._stamp_path()) as f:
+            stamp = json.load(f)
+        # Outputs edited or replaced since the stamp was written also force a re-run
+        return stamp['key'] == key and stamp['outputs'] == {p: fingerprint(p) for p in self.outputs}
+
+    def stamp(self, key):
+        os.makedirs(os.path.dirname(self._stamp_path()), exist_ok=True)
+        with open(self._stamp_path(), 'w') as f:
+            json.dump({'key': key, 'outputs': {p: fingerprint(p) for p in self.outputs}}, f)
+
+    def run(self):
+        proc = subprocess.run(self.command, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{self.name} failed:\n{proc.stderr[-2000:]}")
+        return proc.stdout
+
+
+def sales_inputs():
+    return [path for path in SALES_SOURCES if os.path.exists(path)]
+
+
+def build_stages(args):
+    python = sys.executable
+
+    def script(name, *extra):
+        return [python, os.path.join(CODE_DIR, name), *map(str, extra)]
+
+    data = MASTER_FILES + sales_inputs()
+    optimize_params = {'pack': args.pack, 'objective': args.objective, 'rank': args.rank, 'workers': args.workers,
+                       'group_size': args.group_size}
+    return {
+        'generate': Stage(
+            'generate', script('data_generation.py', '--stores', args.stores, '--products', args.products,
+                               '--days', args.days, '--seed', args.seed),
+            outputs=MASTER_FILES + (sales_inputs() or SALES_SOURCES)[:1], source=True),
+        'load': Stage(
+            'load', script('data_warehouse.py'), inputs=data, outputs=['walmart_assortment.db'], deps=['generate'],
+            code=['data_warehouse.py', 'data_loader.py']),
+        'optimize': Stage(
+            'optimize', script('pipeline.py', '--run-optimize', '--pack' if args.pack else '--no-pack',
+                               '--objective', args.objective, '--rank', args.rank, '--workers', args.workers,
+                               '--group-size', args.group_size),
+            inputs=data, outputs=['recommendations.csv'], deps=['generate'], params=optimize_params,
+            code=['logic_engine.py', 'candidate_index.py', 'gap_filler.py', 'performance_matrix.py', 'data_loader.py',
+                  'pipeline.py']),
+        'simulate': Stage(
+            'simulate', script('impact_simulator.py', '--recommendations', 'recommendations.csv'),
+            inputs=['recommendations.csv', 'stores_regional.csv', 'products_regional.csv'],
+            outputs=['impact_swaps.csv', 'impact_stores.csv'], deps=['optimize'],
+            code=['impact_simulator.py', 'data_generation.py']),
+        'communicate': Stage(
+            'communicate', script('communication_agent.py', '--recommendations', 'recommendations.csv',
+                                  '--impact', 'impact_swaps.csv'),
+            inputs=['recommendations.csv', 'impact_swaps.csv', 'stores_regional.csv'], outputs=['comms.jsonl'],
+            deps=['simulate'], code=['communication_agent.py']),
+        'dashboard': Stage(
+            'dashboard', script('assortment_dashboard.py', '--batch-dir', 'charts', '--by', 'category'),
+            inputs=['recommendations.csv'] + data, outputs=['charts'], deps=['optimize'],
+            code=['assortment_dashboard.py', 'data_loader.py']),
+    }
+
+# ==========================================
+# 3. PARTITIONED OPTIMIZE
+# ==========================================
+
+def optimize_partitioned(group_size=GROUP_SIZE, pack=False, objective='revenue', workers=1, rank='price',
+                         output='recommendations.csv'):
+    """
+    logic_engine batch, cached per group of stores. A group's key covers its
+    own planogram rows, the catalog, the sales data and the parameters, so
+    only groups whose inputs changed are recomputed. Peer ranking reads every
+    store's assortment, so with rank='peers'/'knn' any planogram or store
+    change invalidates all groups.
+    """
+    import pandas as pd
+    import data_loader
+    import logic_engine
+    from candidate_index import CandidateIndex, frame_signature
+
+    df_plano, df_products, df_stores = logic_engine.load_master_data()
+    shared = hashlib.sha1(json.dumps([pack, objective, rank]).encode())
+    shared.update(frame_signature(df_products).encode())
+    if rank != 'price':
+        shared.update(frame_signature(df_plano, df_stores).encode())
+    shared.update(''.join(fingerprint(p) for p in sales_inputs()).encode())
+    shared.update(code_fingerprint(['logic_engine.py', 'candidate_index.py', 'gap_filler.py',
+                                    'performance_matrix.py']).encode())
+
+    stores = sorted(df_plano['store_id'].unique())
+    groups = [stores[i:i + group_size] for i in range(0, len(stores), group_size)]
+    plano_by_store = df_plano.groupby('store_id')
+    keys = [frame_signature(pd.concat([plano_by_store.get_group(s) for s in g]), extra=shared.hexdigest())
+            for g in groups]
+
+    group_dir = os.path.join(CACHE_DIR, 'optimize')
+    os.makedirs(group_dir, exist_ok=True)
+    paths = [os.path.join(group_dir, f"{key}.parquet") for key in keys]
+    stale = [g for g, path in zip(groups, paths) if not os.path.exists(path)]
+
+    if stale:
+        # Peer scores need every store's sales, so ranked runs recompute the whole chain
+        stale_stores = [s for g in stale for s in g] if rank == 'price' else stores
+        store_sales = logic_engine.aggregate_store_sales(data_loader.load_sales())
+        store_sales = store_sales[store_sales['store_id'].isin(stale_stores)]
+        plano = df_plano[df_plano['store_id'].isin(stale_stores)]
+        # The index covers the whole chain's planogram, exactly as a full run sees it
+        index = CandidateIndex.load_or_build(df_products, df_plano)
+        if workers > 1:
+            recs = logic_engine.run_parallel_batch(store_sales, plano, df_products, workers, index, pack, objective,
+                                                   rank, df_stores)
+        else:
+            recs = logic_engine.run_batch(store_sales, plano, df_products, index, pack, objective, rank, df_stores)
+        recs['spli_days'] = store_sales.attrs['days']
+        for g, path in zip(groups, paths):
+            if not os.path.exists(path):
+                recs[recs['store_id'].isin(g)].to_parquet(path, index=False)
+
+    recommendations = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+    recommendations.to_csv(output, index=False)
+    print(f"optimize: {len(groups) - len(stale)}/{len(groups)} store groups cached, "
+          f"{len(stale)} recomputed, {len(recommendations)} recommendations")
+    save_fingerprints()
+
+# ==========================================
+# 4. DAG RUNNER
+# ==========================================
+
+def run_pipeline(stages, targets=None, jobs=JOBS, force=(), regenerate=False, dry_run=False):
+    """Runs `targets` (default: every stage) and their dependencies; returns {stage: status}."""
+    wanted, pending = set(), list(targets or stages)
+    while pending:
+        name = pending.pop()
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(stages[name].deps)
+
+    status = {}
+    running = {}
+    start = time.perf_counter()
+
+    def execute(stage):
+        key = stage.key()
+        fresh = stage.is_fresh(key) and stage.name not in force and not (stage.source and regenerate)
+        if fresh or dry_run:
+            return 'cached' if fresh else 'would run', 0.0, ''
+        began = time.perf_counter()
+        output = stage.run()
+        if not stage.source:
+            stage.stamp(key)
+        return 'ran', time.perf_counter() - began, output
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while len(status) < len(wanted):
+            for name in sorted(wanted):
+                if name in status or name in running.values():
+                    continue
+                deps = stages[name].deps
+                if any(status.get(d) == 'failed' or status.get(d, '').startswith('skipped') for d in deps):
+                    status[name] = 'skipped (dependency failed)'
+                elif all(d in status for d in deps):
+                    running[pool.submit(execute, stages[name])] = name
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    state, seconds, output = future.result()
+                    status[name] = state
+                    detail = f" in {seconds:.1f}s" if state == 'ran' else ''
+                    print(f"[{name}] {state}{detail}")
+                    for line in output.strip().splitlines()[-2:]:
+                        print(f"    {line}")
+                except Exception as e:
+                    status[name] = 'failed'
+                    print(f"[{name}] FAILED: {e}")
+
+    save_fingerprints()
+    print(f"Pipeline finished in {time.perf_counter() - start:.1f}s")
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the MOE pipeline, re-running only stages whose inputs changed.")
+    parser.add_argument('targets', nargs='*', help="Stages to bring up to date (default: all)")
+    parser.add_argument('--stores', type=int, default=20)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--pack', action='store_true', default=False)
+    parser.add_argument('--no-pack', dest='pack', action='store_false')
+    parser.add_argument('--objective', choices=['revenue', 'margin'], default='revenue')
+    parser.add_argument('--rank', choices=['price', 'peers', 'knn'], default='price')
+    parser.add_argument('--workers', type=int, default=1, help="Processes for the optimize stage")
+    parser.add_argument('--group-size', type=int, default=GROUP_SIZE, help="Stores per cached optimize partition")
+    parser.add_argument('--jobs', type=int, default=JOBS, help="Stages run concurrently")
+    parser.add_argument('--force', nargs='+', default=[], help="Re-run these stages even if cached")
+    parser.add_argument('--regenerate', action='store_true', help="Regenerate the synthetic data (overwrites CSVs)")
+    parser.add_argument('--dry-run', action='store_true', help="Only report which stages would run")
+    parser.add_argument('--run-optimize', action='store_true', help=argparse.SUPPRESS)  # Internal: the optimize stage
+    args = parser.parse_args()
+
+    if args.run_optimize:
+        optimize_partitioned(args.group_size, args.pack, args.objective, args.workers, args.rank)
+        sys.exit(0)
+
+    stages = build_stages(args)
+    unknown = set(args.targets) - set(stages)
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+    status = run_pipeline(stages, args.targets or None, args.jobs, set(args.force), args.regenerate, args.dry_run)
+    sys.exit(1 if 'failed' in status.values() else 0)
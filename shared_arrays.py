@@ -0,0 +1,61 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+# ==========================================
+# SHARED-MEMORY ARRAY BUNDLES
+# ==========================================
+# A dict of NumPy arrays copied once into a single shared-memory block.
+# Worker processes attach by the block's spec (name, dtypes, shapes, offsets)
+# and get zero-copy views, so large read-only inputs are never pickled per task.
+
+ALIGNMENT = 64
+
+
+class SharedArrays:
+
+    def __init__(self, shm, spec, owner):
+        self.shm = shm
+        self.spec = spec
+        self.owner = owner
+        self.arrays = {
+            name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            for name, dtype, shape, offset in spec['arrays']
+        }
+
+    @classmethod
+    def create(cls, arrays):
+        """Copies the arrays into a new shared-memory block (owned by the caller)."""
+        layout, offset = [], 0
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            layout.append((name, arr.dtype.str, arr.shape, offset))
+            # Every array gets at least one aligned slot, so empty arrays stay in bounds
+            offset += max(-(-arr.nbytes // ALIGNMENT), 1) * ALIGNMENT
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        spec = {'name': shm.name, 'arrays': layout}
+        shared = cls(shm, spec, owner=True)
+        for name, arr in arrays.items():
+            shared.arrays[name][...] = arr
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        """Views onto a block created by another process."""
+        return cls(shared_memory.SharedMemory(name=spec['name']), spec, owner=False)
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    def close(self):
+        self.arrays = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
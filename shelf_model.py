@@ -0,0 +1,223 @@
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+
+from data_generation import SHELF_WIDTH_INCHES
+
+# ==========================================
+# SHELF MODEL
+# ==========================================
+# The planogram as flat arrays, store -> shelf -> ordered SKU segments
+# (CSR-style pointers), with the used inches of every shelf kept current:
+#   * Shelves are sorted by (store, free inches) in one composite key, so
+#     "shelves with at least X inches free" is a binary search per store.
+#   * Swaps run inside a transaction that journals every segment it touches;
+#     thousands of swaps are applied as array ops and undone the same way, so
+#     a chain-wide reset can be evaluated and rolled back without copying
+#     DataFrames.
+# A swap is accepted when its shelf stays within SHELF_WIDTH_INCHES (or, for a
+# shelf the generator already filled past 48", doesn't get any fuller).
+
+
+def _pair_keys(store_ids, other_ids):
+    return (np.asarray(store_ids).astype(np.int64) << 32) | np.asarray(other_ids).astype(np.int64)
+
+
+class ShelfModel:
+
+    def __init__(self, store_ids, store_ptr, shelf_id, shelf_ptr, capacity, seg_sku, seg_width, seg_facings):
+        self.store_ids = store_ids      # Sorted store ids
+        self.store_ptr = store_ptr      # Store row -> its shelves [ptr[i], ptr[i + 1])
+        self.shelf_id = shelf_id
+        self.shelf_ptr = shelf_ptr      # Shelf -> its segments, in planogram order
+        self.capacity = capacity
+        self.seg_sku = seg_sku
+        self.seg_width = seg_width      # Inches per facing
+        self.seg_facings = seg_facings
+
+        self.shelf_store = np.repeat(np.arange(len(store_ids)), np.diff(store_ptr))
+        self.seg_shelf = np.repeat(np.arange(len(shelf_id)), np.diff(shelf_ptr))
+        self._shelf_keys = _pair_keys(store_ids[self.shelf_store], shelf_id)
+        self.used = np.bincount(self.seg_shelf, weights=seg_width * seg_facings, minlength=len(shelf_id))
+        self._sku_index = None
+        self._free_index = None
+        self._free_bound = 0.0
+        self._journal = None
+
+    @classmethod
+    def from_planogram(cls, df_plano, df_products, shelf_width=SHELF_WIDTH_INCHES):
+        plano = df_plano.sort_values(['store_id', 'shelf_id'], kind='stable')
+        store = plano['store_id'].to_numpy().astype(np.int64)
+        shelf = plano['shelf_id'].to_numpy().astype(np.int64)
+        sku = plano['sku_id'].to_numpy().astype(np.int64)
+
+        products = df_products.sort_values('sku_id')
+        width = products['width_inches'].to_numpy(dtype=np.float64)[
+            np.searchsorted(products['sku_id'].to_numpy().astype(np.int64), sku)]
+
+        # A new shelf starts wherever (store, shelf) changes; a new store wherever store does
+        new_shelf = np.ones(len(plano), dtype=bool)
+        new_shelf[1:] = (store[1:] != store[:-1]) | (shelf[1:] != shelf[:-1])
+        shelf_start = np.flatnonzero(new_shelf)
+        store_ids, store_start = np.unique(store[shelf_start], return_index=True)
+
+        return cls(store_ids, np.append(store_start, len(shelf_start)).astype(np.int64),
+                   shelf[shelf_start], np.append(shelf_start, len(plano)).astype(np.int64),
+                   np.full(len(shelf_start), float(shelf_width)), sku, width,
+                   plano['facings'].to_numpy().astype(np.int64))
+
+    # ------------------------------------------
+    # Lookups
+    # ------------------------------------------
+    @property
+    def free(self):
+        return self.capacity - self.used
+
+    def store_rows(self, store_ids):
+        store_ids = np.asarray(store_ids, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.store_ids, store_ids), len(self.store_ids) - 1)
+        return np.where(self.store_ids[rows] == store_ids, rows, -1)
+
+    def shelves(self, store_ids, shelf_ids):
+        """Shelf positions for (store, shelf) pairs (-1 where the shelf doesn't exist)."""
+        keys = _pair_keys(store_ids, shelf_ids)
+        pos = np.minimum(np.searchsorted(self._shelf_keys, keys), len(self._shelf_keys) - 1)
+        return np.where(self._shelf_keys[pos] == keys, pos, -1)
+
+    def segments(self, store_ids, sku_ids):
+        """Segment positions holding each (store, sku) (-1 where the store doesn't carry it)."""
+        if self._sku_index is None:
+            keys = _pair_keys(self.store_ids[self.shelf_store[self.seg_shelf]], self.seg_sku)
+            order = np.argsort(keys, kind='stable')
+            self._sku_index = (keys[order], order)
+        sorted_keys, order = self._sku_index
+        keys = _pair_keys(store_ids, sku_ids)
+        pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        return np.where(sorted_keys[pos] == keys, order[pos], -1)
+
+    def free_inches(self, store_ids, shelf_ids):
+        """Free inches on each (store, shelf); negative for over-filled shelves, NaN if unknown."""
+        shelves = self.shelves(store_ids, shelf_ids)
+        shelves_or_0 = np.maximum(shelves, 0)
+        return np.where(shelves >= 0, self.capacity[shelves_or_0] - self.used[shelves_or_0], np.nan)
+
+    # ------------------------------------------
+    # Free-space queries
+    # ------------------------------------------
+    def _free_key(self, rows, free):
+        # Store row in the high part, free inches (clipped, shifted non-negative) in the low part
+        bound = self._free_bound
+        return rows * (4 * bound) + np.clip(free, -bound, bound) + bound
+
+    def _ensure_free_index(self):
+        if self._free_index is None:
+            self._free_bound = 2.0 ** np.ceil(np.log2(np.abs(self.free).max(initial=0) + 2))
+            keys = self._free_key(self.shelf_store, self.free)
+            order = np.argsort(keys, kind='stable')
+            self._free_index = (keys[order], order)
+
+    def shelves_with_free(self, store_id, min_inches):
+        """(shelf_ids, free inches) of the store's shelves with at least min_inches free, tightest first."""
+        self._ensure_free_index()
+        sorted_keys, order = self._free_index
+        row = self.store_rows([store_id])[0]
+        if row < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        lo = np.searchsorted(sorted_keys, self._free_key(row, min_inches))
+        hi = np.searchsorted(sorted_keys, self._free_key(row + 1, -np.inf))
+        shelves = order[lo:hi]
+        return self.shelf_id[shelves], self.capacity[shelves] - self.used[shelves]
+
+    def count_with_free(self, store_ids, min_inches):
+        """How many shelves in each store have at least min_inches free (vectorized)."""
+        self._ensure_free_index()
+        sorted_keys = self._free_index[0]
+        rows = self.store_rows(store_ids)
+        lo = np.searchsorted(sorted_keys, self._free_key(rows, np.broadcast_to(min_inches, rows.shape)))
+        hi = np.searchsorted(sorted_keys, self._free_key(rows + 1, -np.inf))
+        return np.where(rows >= 0, hi - lo, 0)
+
+    # ------------------------------------------
+    # Transactions
+    # ------------------------------------------
+    @contextmanager
+    def transaction(self):
+        """
+        Swaps made inside the block are kept if it exits normally and undone if
+        it raises (or if the block calls rollback()).
+        """
+        if self._journal is not None:
+            raise ValueError("A shelf transaction is already open")
+        self._journal = []
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        finally:
+            self._journal = None
+
+    def swap(self, store_ids, delete_skus, add_skus, add_widths, add_facings):
+        """
+        Replaces each store's delete SKU segment with add_facings of the add SKU,
+        in place. Swaps that would over-fill their shelf (counting the earlier
+        swaps in the same call), name a SKU the store doesn't carry, or repeat
+        a segment are skipped. Returns the mask of swaps applied.
+        """
+        if self._journal is None:
+            raise ValueError("swap() must run inside a transaction()")
+        seg = self.segments(store_ids, delete_skus)
+        add_widths = np.asarray(add_widths, dtype=np.float64)
+        add_facings = np.asarray(add_facings, dtype=np.float64)
+        valid = (seg >= 0) & ~np.isnan(add_widths * add_facings)
+        valid[valid] &= ~pd.Series(seg[valid]).duplicated().to_numpy()
+
+        old = np.maximum(seg, 0)
+        shelf = self.seg_shelf[old]
+        delta = np.where(valid, add_widths * add_facings - self.seg_width[old] * self.seg_facings[old], 0.0)
+
+        # Space-freeing swaps always fit; the rest are accepted in order while
+        # the shelf's growth (after every freed inch) stays within its room
+        shrink = valid & (delta <= 0)
+        room = np.maximum(self.capacity - self.used, 0) - np.bincount(
+            shelf[shrink], weights=delta[shrink], minlength=len(self.shelf_id))
+        grow = np.flatnonzero(valid & (delta > 0))
+        growth = pd.Series(delta[grow]).groupby(shelf[grow]).cumsum().to_numpy()
+        accepted = shrink.copy()
+        accepted[grow] = growth <= room[shelf[grow]] + 1e-9
+
+        applied = np.flatnonzero(accepted)
+        seg, shelf, delta = seg[applied], shelf[applied], delta[applied]
+        self._journal.append((seg, self.seg_sku[seg].copy(), self.seg_width[seg].copy(),
+                              self.seg_facings[seg].copy(), shelf, delta))
+        self.seg_sku[seg] = np.asarray(add_skus, dtype=np.int64)[applied]
+        self.seg_width[seg] = add_widths[applied]
+        self.seg_facings[seg] = add_facings[applied].astype(np.int64)
+        np.add.at(self.used, shelf, delta)
+        self._sku_index = self._free_index = None
+        return accepted
+
+    def rollback(self):
+        """Undoes every swap of the open transaction, newest first."""
+        for seg, sku, width, facings, shelf, delta in reversed(self._journal or []):
+            self.seg_sku[seg] = sku
+            self.seg_width[seg] = width
+            self.seg_facings[seg] = facings
+            np.subtract.at(self.used, shelf, delta)
+        if self._journal:
+            self._journal.clear()
+        self._sku_index = self._free_index = None
+
+    def what_if(self, store_ids, delete_skus, add_skus, add_widths, add_facings):
+        """Applies a batch of swaps, measures the result and rolls it back. Returns (applied mask, summary)."""
+        before = self.used.sum()
+        with self.transaction():
+            applied = self.swap(store_ids, delete_skus, add_skus, add_widths, add_facings)
+            summary = {
+                'swaps': len(applied),
+                'applied': int(applied.sum()),
+                'inches_added': round(float(self.used.sum() - before), 2),
+                'overfilled_shelves': int((self.used > self.capacity + 1e-9).sum()),
+            }
+            self.rollback()
+        return applied, summary
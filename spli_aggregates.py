@@ -0,0 +1,386 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+import data_loader
+import partitioned_sales
+
+# ==========================================
+# INCREMENTAL SALES AGGREGATES
+# ==========================================
+# Per-(store, sku) running totals plus the per-day deltas behind them (one
+# entry per pair sold that day, CSR-style: day_ptr[d] .. day_ptr[d + 1]),
+# persisted between runs. Folding in a new day touches only that day's rows,
+# and storage grows with rows sold rather than days x pairs.
+# Every CHECKPOINT_DAYS the running totals (and per-pair entry counts) are
+# also snapshotted as a dense prefix row. The prefix at any day is its
+# checkpoint plus at most CHECKPOINT_DAYS - 1 days of entries, so a trailing
+# window is prefix[end] - prefix[start] at a cost that doesn't grow with the
+# window; short windows just sum their own entries when that is cheaper.
+# The file records a signature of the sales it was folded from; if those
+# change (e.g. the data is regenerated over the same dates) it is rebuilt.
+
+AGGREGATES_FILE = 'spli_aggregates.npz'
+METRICS = ('revenue', 'units_sold', 'margin')
+CHECKPOINT_DAYS = 28  # Days between dense prefix rows (~1/28 of a dense days x pairs array)
+
+
+def _pair_keys(store_ids, sku_ids):
+    return (np.asarray(store_ids).astype(np.int64) << 32) | np.asarray(sku_ids).astype(np.int64)
+
+
+def _csv_line_at(f, pos, data_start):
+    # (offset, text) of the first line starting at or after pos
+    if pos > data_start:
+        f.seek(pos - 1)
+        f.readline()
+    else:
+        f.seek(data_start)
+    return f.tell(), f.readline()
+
+
+def _csv_prefix_length(path, through):
+    """
+    Bytes of the date-sorted sales CSV (as data_generation appends it) up to
+    the last row dated on or before `through`: a binary search on the date
+    column, so only a few lines are read.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline().strip().decode()
+        column = header.split(',').index('date')
+        data_start = f.tell()
+        lo, hi = data_start, os.fstat(f.fileno()).st_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            _, line = _csv_line_at(f, mid, data_start)
+            if not line.strip() or line.split(b',')[column].strip(b'"\r\n ').decode() > through:
+                hi = mid
+            else:
+                lo = mid + 1
+        return _csv_line_at(f, lo, data_start)[0]
+
+
+def _prefix_hash(path, length, block_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while length > 0:
+            block = f.read(min(block_size, length))
+            if not block:
+                break
+            h.update(block)
+            length -= len(block)
+    return h.hexdigest()
+
+
+def source_signature(through_date, root=partitioned_sales.PARTITION_DIR, sales_path=data_loader.SOURCES['sales']):
+    """
+    Identity of the sales folded in up to through_date: the manifest entry,
+    size and mtime of every partition starting on or before it, or the byte
+    length and SHA-1 of the sales CSV's rows up to it. Days published or
+    appended later don't change it; they are still to be folded in.
+    """
+    if through_date is None:
+        return ''
+    if os.path.exists(os.path.join(root, partitioned_sales.MANIFEST_FILE)):
+        through = through_date.strftime('%Y-%m-%d')
+        h = hashlib.sha1()
+        for part in partitioned_sales.read_manifest(root)['partitions']:
+            if part['start_date'] <= through:
+                path = os.path.join(root, part['file'])
+                stat = (os.stat(path).st_size, os.stat(path).st_mtime_ns) if os.path.exists(path) else None
+                h.update(f"{part['file']}:{part['start_date']}:{part['end_date']}:{part['rows']}:{stat}\n".encode())
+        return f"partitions:{h.hexdigest()}"
+    if os.path.exists(sales_path):
+        length = _csv_prefix_length(sales_path, through_date.strftime('%Y-%m-%d'))
+        return f"csv:{length}:{_prefix_hash(sales_path, length)}"
+    return ''
+
+
+class SalesAggregates:
+
+    def __init__(self):
+        self.start_date = None
+        self.n_days = 0
+        self.pair_store = np.empty(0, dtype=np.int64)
+        self.pair_sku = np.empty(0, dtype=np.int64)
+        self._sorted_keys = np.empty(0, dtype=np.int64)
+        self._sorted_pos = np.empty(0, dtype=np.int64)
+        # Entries of day d are [day_ptr[d], day_ptr[d + 1]); arrays past n_entries are spare capacity
+        self.day_ptr = np.zeros(1, dtype=np.int64)
+        self.n_entries = 0
+        self.entry_pair = np.empty(0, dtype=np.int32)
+        self.values = {m: np.empty(0) for m in METRICS}
+        self.totals = {m: np.zeros(0) for m in METRICS}
+        self.counts = np.zeros(0, dtype=np.int64)
+        # Checkpoint c holds the totals over days [0, c * CHECKPOINT_DAYS), as long as the pairs known then
+        self.checkpoints = {m: [np.zeros(0)] for m in METRICS}
+        self.checkpoint_counts = [np.zeros(0, dtype=np.int64)]
+
+    @property
+    def n_pairs(self):
+        return len(self.pair_store)
+
+    @property
+    def last_date(self):
+        if self.start_date is None or self.n_days == 0:
+            return None
+        return self.start_date + timedelta(days=self.n_days - 1)
+
+    # ------------------------------------------
+    # Folding in new sales
+    # ------------------------------------------
+    def _pair_positions(self, store_ids, sku_ids):
+        """Column of each (store, sku), registering pairs seen for the first time."""
+        keys = _pair_keys(store_ids, sku_ids)
+        if len(self._sorted_keys):
+            found = np.minimum(np.searchsorted(self._sorted_keys, keys), len(self._sorted_keys) - 1)
+            known = self._sorted_keys[found] == keys
+        else:
+            known = np.zeros(len(keys), dtype=bool)
+
+        if not np.all(known):
+            new_keys = np.unique(keys[~known])
+            first = self.n_pairs
+            self.pair_store = np.append(self.pair_store, new_keys >> 32)
+            self.pair_sku = np.append(self.pair_sku, new_keys & 0xFFFFFFFF)
+            all_keys = np.append(self._sorted_keys, new_keys)
+            all_pos = np.append(self._sorted_pos, np.arange(first, first + len(new_keys)))
+            order = np.argsort(all_keys, kind='stable')
+            self._sorted_keys, self._sorted_pos = all_keys[order], all_pos[order]
+            self._reserve(self.n_entries, self.n_pairs)
+
+        return self._sorted_pos[np.searchsorted(self._sorted_keys, keys)]
+
+    def _reserve(self, entries, pairs):
+        # Grow the entry and totals arrays geometrically so appends stay amortized O(new rows)
+        capacity = len(self.entry_pair)
+        if entries > capacity:
+            new_capacity = max(capacity, 1)
+            while new_capacity < entries:
+                new_capacity *= 2
+            self.entry_pair = np.concatenate([self.entry_pair, np.empty(new_capacity - capacity, dtype=np.int32)])
+            for m in METRICS:
+                self.values[m] = np.concatenate([self.values[m], np.empty(new_capacity - capacity)])
+        capacity = len(self.totals[METRICS[0]])
+        if pairs > capacity:
+            new_capacity = max(capacity, 1)
+            while new_capacity < pairs:
+                new_capacity *= 2
+            for m in METRICS:
+                self.totals[m] = np.concatenate([self.totals[m], np.zeros(new_capacity - capacity)])
+            self.counts = np.concatenate([self.counts, np.zeros(new_capacity - capacity, dtype=np.int64)])
+
+    def _checkpoint(self):
+        # Snapshot the running totals at every CHECKPOINT_DAYS boundary reached so far
+        while len(self.checkpoint_counts) * CHECKPOINT_DAYS <= self.n_days:
+            for m in METRICS:
+                self.checkpoints[m].append(self.totals[m][:self.n_pairs].copy())
+            self.checkpoint_counts.append(self.counts[:self.n_pairs].copy())
+
+    def append_day(self, date, df_day):
+        """Folds one day of sales (store_id, sku_id, revenue, units_sold, margin) into the aggregates."""
+        date = pd.Timestamp(date).to_pydatetime().replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.start_date is None:
+            self.start_date = date
+        expected = self.start_date + timedelta(days=self.n_days)
+        if date < expected:
+            raise ValueError(f"{date:%Y-%m-%d} is already folded into the aggregates (next day is {expected:%Y-%m-%d})")
+
+        # Days with no sales file are empty entry ranges
+        skipped = (date - expected).days
+        if skipped:
+            self.day_ptr = np.append(self.day_ptr, np.full(skipped, self.n_entries))
+            self.n_days += skipped
+            self._checkpoint()
+
+        positions = self._pair_positions(df_day['store_id'].to_numpy(), df_day['sku_id'].to_numpy())
+        pairs, inverse = np.unique(positions, return_inverse=True)
+        lo, hi = self.n_entries, self.n_entries + len(pairs)
+        self._reserve(hi, self.n_pairs)
+        self.entry_pair[lo:hi] = pairs
+        for m in METRICS:
+            values = np.bincount(inverse, weights=df_day[m].to_numpy(dtype=np.float64), minlength=len(pairs))
+            self.values[m][lo:hi] = values
+            self.totals[m][pairs] += values
+        self.counts[pairs] += 1
+        self.n_entries = hi
+        self.day_ptr = np.append(self.day_ptr, hi)
+        self.n_days += 1
+        self._checkpoint()
+
+    def append_sales(self, df_sales):
+        """
+        Folds in every day of df_sales newer than what is already aggregated.
+        Accepts raw sales ('date' strings) or compact data_loader sales ('day' offsets).
+        """
+        last = self.last_date
+        key = 'date' if 'date' in df_sales.columns else 'day'
+        for value, df_day in df_sales.groupby(key, sort=True, observed=True):
+            if key == 'date':
+                date = pd.Timestamp(value).to_pydatetime()
+            else:
+                date = data_loader.DATE_EPOCH + timedelta(days=int(value))
+            if last is None or date > last:
+                self.append_day(date, df_day)
+        return self
+
+    def append_partitions(self, root=partitioned_sales.PARTITION_DIR):
+        """Folds in only the sales partitions written since the last update."""
+        last = self.last_date
+        start = None if last is None else (last + timedelta(days=1)).strftime('%Y-%m-%d')
+        df_new = partitioned_sales.read_sales_partitions(root, start_date=start)
+        if len(df_new):
+            self.append_sales(df_new)
+        return self
+
+    # ------------------------------------------
+    # Queries
+    # ------------------------------------------
+    def window_bounds(self, days=None, end_date=None):
+        end = self.n_days
+        if end_date is not None:
+            end = (pd.Timestamp(end_date).to_pydatetime() - self.start_date).days + 1
+            end = min(max(end, 0), self.n_days)
+        start = 0 if days is None else max(end - days, 0)
+        return start, end
+
+    def entries(self, metric='revenue', days=None, end_date=None):
+        """(day offset, pair, value) of every entry in the trailing window, day by day."""
+        start, end = self.window_bounds(days, end_date)
+        lo, hi = self.day_ptr[start], self.day_ptr[end]
+        day = np.repeat(np.arange(start, end), np.diff(self.day_ptr[start:end + 1]))
+        return day, self.entry_pair[lo:hi], self.values[metric][lo:hi]
+
+    def _since_checkpoint(self, day):
+        # Entry range between the checkpoint at or before `day` and `day`
+        c = day // CHECKPOINT_DAYS
+        return c, self.day_ptr[c * CHECKPOINT_DAYS], self.day_ptr[day]
+
+    def _direct(self, start, end):
+        # Summing the window's own entries beats two checkpoint prefixes (two bincounts
+        # over the entries since each checkpoint, plus a few passes over the pairs)
+        lo, hi = self.day_ptr[start], self.day_ptr[end]
+        checkpointed = [b - a for _, a, b in (self._since_checkpoint(start), self._since_checkpoint(end))]
+        return hi - lo <= 2 * sum(checkpointed) + 3 * self.n_pairs
+
+    def _prefix(self, metric, day):
+        """Per-pair (total, entry count) over days [0, day): its checkpoint plus the entries since."""
+        c, lo, hi = self._since_checkpoint(day)
+        total = np.bincount(self.entry_pair[lo:hi], weights=self.values[metric][lo:hi], minlength=self.n_pairs)
+        count = np.bincount(self.entry_pair[lo:hi], minlength=self.n_pairs)
+        base = self.checkpoints[metric][c]
+        total[:len(base)] += base
+        count[:len(base)] += self.checkpoint_counts[c]
+        return total, count
+
+    def window_metric(self, metric='revenue', days=None, end_date=None):
+        """Per-pair total of one metric over the trailing window (pair order)."""
+        start, end = self.window_bounds(days, end_date)
+        if start == 0 and end == self.n_days:
+            return self.totals[metric][:self.n_pairs].copy()
+        if self._direct(start, end):
+            lo, hi = self.day_ptr[start], self.day_ptr[end]
+            return np.bincount(self.entry_pair[lo:hi], weights=self.values[metric][lo:hi], minlength=self.n_pairs)
+        end_total, end_count = self._prefix(metric, end)
+        start_total, start_count = self._prefix(metric, start)
+        # Float prefixes don't cancel exactly: pairs with no entries in the window are exactly 0
+        return np.where(end_count > start_count, end_total - start_total, 0.0)
+
+    def window_totals(self, days=None, end_date=None):
+        """
+        Per-(store, sku) totals for the trailing `days` ending at end_date
+        (default: the whole history up to the latest day).
+        """
+        data = {'store_id': self.pair_store, 'sku_id': self.pair_sku}
+        for m in METRICS:
+            data[m] = self.window_metric(m, days, end_date)
+        return pd.DataFrame(data)
+
+    def _pair_prefix(self, metric, p, day):
+        c, lo, hi = self._since_checkpoint(day)
+        hits = self.entry_pair[lo:hi] == p
+        base = self.checkpoints[metric][c]
+        if p >= len(base):
+            return self.values[metric][lo:hi][hits].sum(), int(hits.sum())
+        return base[p] + self.values[metric][lo:hi][hits].sum(), int(self.checkpoint_counts[c][p] + hits.sum())
+
+    def pair_total(self, store_id, sku_id, metric='revenue', days=None, end_date=None):
+        """
+        Single (store, sku) window total after the key lookup: two checkpoint
+        reads plus the entries since each, or the window's own entries if fewer.
+        """
+        key = _pair_keys([store_id], [sku_id])[0]
+        i = np.searchsorted(self._sorted_keys, key)
+        if i == len(self._sorted_keys) or self._sorted_keys[i] != key:
+            return 0.0
+        p = self._sorted_pos[i]
+        start, end = self.window_bounds(days, end_date)
+        if self._direct(start, end):
+            lo, hi = self.day_ptr[start], self.day_ptr[end]
+            return float(self.values[metric][lo:hi][self.entry_pair[lo:hi] == p].sum())
+        end_total, end_count = self._pair_prefix(metric, p, end)
+        start_total, start_count = self._pair_prefix(metric, p, start)
+        return float(end_total - start_total) if end_count > start_count else 0.0
+
+    # ------------------------------------------
+    # Persistence
+    # ------------------------------------------
+    def save(self, path=AGGREGATES_FILE):
+        n, e = self.n_pairs, self.n_entries
+        arrays = {
+            'source': np.array(source_signature(self.last_date)),
+            'start_date': np.array('' if self.start_date is None else self.start_date.strftime('%Y-%m-%d')),
+            'pair_store': self.pair_store,
+            'pair_sku': self.pair_sku,
+            'day_ptr': self.day_ptr,
+            'entry_pair': self.entry_pair[:e],
+        }
+        arrays['counts'] = self.counts[:n]
+        # Checkpoints are ragged (pairs keep appearing): stored concatenated, CSR-style
+        arrays['checkpoint_ptr'] = np.cumsum([0] + [len(c) for c in self.checkpoint_counts])
+        arrays['checkpoint_counts'] = np.concatenate(self.checkpoint_counts)
+        for m in METRICS:
+            arrays[f'values_{m}'] = self.values[m][:e]
+            arrays[f'totals_{m}'] = self.totals[m][:n]
+            arrays[f'checkpoints_{m}'] = np.concatenate(self.checkpoints[m])
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path=AGGREGATES_FILE):
+        agg = cls()
+        with np.load(path) as data:
+            start = str(data['start_date'])
+            agg.start_date = datetime.strptime(start, '%Y-%m-%d') if start else None
+            agg.pair_store = data['pair_store']
+            agg.pair_sku = data['pair_sku']
+            agg.day_ptr = data['day_ptr']
+            agg.entry_pair = data['entry_pair']
+            agg.counts = data['counts']
+            cuts = data['checkpoint_ptr'][1:-1]
+            agg.checkpoint_counts = np.split(data['checkpoint_counts'], cuts)
+            for m in METRICS:
+                agg.values[m] = data[f'values_{m}']
+                agg.totals[m] = data[f'totals_{m}']
+                agg.checkpoints[m] = np.split(data[f'checkpoints_{m}'], cuts)
+        agg.n_days = len(agg.day_ptr) - 1
+        agg.n_entries = len(agg.entry_pair)
+        keys = _pair_keys(agg.pair_store, agg.pair_sku)
+        agg._sorted_pos = np.argsort(keys, kind='stable')
+        agg._sorted_keys = keys[agg._sorted_pos]
+        return agg
+
+    @classmethod
+    def load_or_create(cls, path=AGGREGATES_FILE):
+        """Reuses the aggregates on disk unless the sales they were folded from have changed since."""
+        if not path or not os.path.exists(path):
+            return cls()
+        with np.load(path) as data:
+            if not {'day_ptr', 'checkpoint_ptr', 'source'} <= set(data.files):
+                return cls()  # Written by an older layout: rebuild
+            cached = str(data['source'])
+        agg = cls.load(path)
+        if cached != source_signature(agg.last_date):
+            return cls()
+        return agg
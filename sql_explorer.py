@@ -1,31 +1,203 @@
+import os
 import sqlite3
+import time
 import pandas as pd
+from collections import OrderedDict
+
+DB_PATH = 'walmart_assortment.db'
+PAGE_SIZE = 50            # Rows fetched from the cursor per page
+CACHE_ENTRIES = 32        # Distinct queries kept in the result cache
+CACHE_MAX_ROWS = 100_000  # Bigger results are streamed but never cached
+
+HELP = """Commands:
+  :more [N]    Fetch the next page (or the next N rows) of the current result
+  :page N      Set the page size (currently {page_size})
+  :explain     Toggle EXPLAIN QUERY PLAN before each query (currently {explain})
+  :cache       Show cache stats   (:cache clear to empty it)
+  :help        Show this help
+  exit / quit  Leave the shell"""
+
+
+def db_version(db_path):
+    # WAL mode writes land in the -wal file first, so its mtime matters too
+    # (an empty -wal is just a reader having opened the database)
+    wal = db_path + '-wal'
+    wal_mtime = os.path.getmtime(wal) if os.path.exists(wal) and os.path.getsize(wal) else 0
+    return os.path.getmtime(db_path), wal_mtime
+
+
+class ResultCache:
+    """LRU of fully-read results keyed on (query text, database mtime)."""
+
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, columns, rows):
+        self.entries[key] = (columns, rows)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class QuerySession:
+    """
+    Streams a query's rows from the cursor one page at a time, timing every
+    page, and caches results that were read to the end.
+    """
+
+    def __init__(self, conn, db_path=DB_PATH):
+        self.conn = conn
+        self.db_path = db_path
+        self.page_size = PAGE_SIZE
+        self.explain = False
+        self.cache = ResultCache()
+        self._reset()
+
+    def _reset(self):
+        self.cursor = None
+        self.columns = None
+        self.rows = None          # Rows kept for the cache (None once over the limit)
+        self.cached_rows = None   # Set when paging through a cached result
+        self.position = 0
+        self.elapsed = 0.0
+        self.cache_key = None
+
+    def run(self, query):
+        self._reset()
+        query = query.strip().rstrip(';')
+
+        if self.explain:
+            plan = self.conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+            print("\n--- Query Plan ---")
+            for row in plan:
+                print(f"  {row[-1]}")
+
+        self.cache_key = (query, db_version(self.db_path))
+        cached = self.cache.get(self.cache_key)
+        if cached is not None:
+            self.columns, self.cached_rows = cached
+            print(f"(cached result, {len(self.cached_rows):,} rows)")
+            self.more()
+            return
+
+        start = time.perf_counter()
+        cursor = self.conn.execute(query)
+        self.elapsed = time.perf_counter() - start
+
+        if cursor.description is None:
+            self.conn.commit()
+            print(f"✅ Query executed successfully ({cursor.rowcount} rows affected, {self.elapsed * 1000:.1f} ms).")
+            return
+
+        self.cursor = cursor
+        self.columns = [d[0] for d in cursor.description]
+        self.rows = []
+        self.more()
+
+    def more(self, n=None):
+        n = n or self.page_size
+        if self.cached_rows is not None:
+            page = self.cached_rows[self.position:self.position + n]
+            self._print_page(page, done=self.position + len(page) >= len(self.cached_rows))
+            return
+        if self.cursor is None:
+            print("No active result. Run a query first.")
+            return
+
+        start = time.perf_counter()
+        page = self.cursor.fetchmany(n)
+        self.elapsed += time.perf_counter() - start
+        done = len(page) < n
+
+        if self.rows is not None:
+            self.rows.extend(page)
+            if len(self.rows) > CACHE_MAX_ROWS:
+                self.rows = None
+        self._print_page(page, done)
+
+        if done:
+            if self.rows is not None:
+                self.cache.put(self.cache_key, self.columns, self.rows)
+            self.cursor = None
+
+    def _print_page(self, page, done):
+        first = self.position + 1
+        self.position += len(page)
+
+        if self.position == 0:
+            print("✅ Query executed successfully, but returned no results.")
+        elif page:
+            print(f"\n--- Rows {first:,}-{self.position:,} ---")
+            print(pd.DataFrame(page, columns=self.columns).to_string(index=False))
+
+        if self.cached_rows is None and self.position:
+            rate = self.position / max(self.elapsed, 1e-9)
+            print(f"({self.position:,} rows in {self.elapsed * 1000:.1f} ms, {rate:,.0f} rows/sec)")
+        if done and self.position:
+            print(f"--- End of result ({self.position:,} rows) ---")
+        elif page:
+            print("Type :more for the next page.")
+
+    def command(self, line):
+        parts = line.split()
+        name, args = parts[0].lower(), parts[1:]
+
+        if name in (':more', ':m'):
+            self.more(int(args[0]) if args else None)
+        elif name == ':page' and args:
+            self.page_size = max(int(args[0]), 1)
+            print(f"Page size: {self.page_size}")
+        elif name == ':explain':
+            self.explain = not self.explain
+            print(f"EXPLAIN QUERY PLAN: {'on' if self.explain else 'off'}")
+        elif name == ':cache':
+            if args and args[0] == 'clear':
+                self.cache.clear()
+                print("Cache cleared.")
+            else:
+                print(f"Cache: {len(self.cache.entries)} results, {self.cache.hits} hits, {self.cache.misses} misses")
+        else:
+            print(HELP.format(page_size=self.page_size, explain='on' if self.explain else 'off'))
+
 
 def run_shell():
-    db_path = 'walmart_assortment.db'
+    db_path = DB_PATH
     conn = sqlite3.connect(db_path)
-    
+    session = QuerySession(conn, db_path)
+
     print("="*60)
     print("🛒 WALMART ASSORTMENT DATA SHELL")
-    print("Type your SQL query below. Type 'exit' to quit.")
+    print("Type your SQL query below. Type 'exit' to quit, ':help' for commands.")
     print("="*60)
-    
+
     while True:
         print("\nSQL > ", end="")
         query = input()
-        
+
         if query.lower() in ['exit', 'quit']:
             break
-            
+        if not query.strip():
+            continue
+
         try:
-            # We use pandas to make the output look like a nice Excel table
-            df = pd.read_sql(query, conn)
-            if df.empty:
-                print("✅ Query executed successfully, but returned no results.")
+            if query.startswith(':'):
+                session.command(query)
             else:
-                print(f"\n--- Result ({len(df)} rows) ---")
-                print(df.to_string(index=False)) # Prints a pretty table
-                
+                session.run(query)
         except Exception as e:
             print(f"❌ Error: {e}")
 
@@ -33,4 +205,4 @@ def run_shell():
     print("Database connection closed.")
 
 if __name__ == "__main__":
-    run_shell()
\ No newline at end of file
+    run_shell()
@@ -0,0 +1,20 @@
+import os
+import sys
+import pytest
+
+# The modules are flat top-level scripts; make them importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_generation import generate_dataset
+
+
+@pytest.fixture
+def regional_data(tmp_path, monkeypatch):
+    """A small generated chain written as the regional CSVs in a scratch working directory."""
+    monkeypatch.chdir(tmp_path)
+    df_stores, df_products, df_plano, df_sales = generate_dataset(num_stores=4, num_products=200, days_history=14)
+    df_stores.to_csv('stores_regional.csv', index=False)
+    df_products.to_csv('products_regional.csv', index=False)
+    df_plano.to_csv('plano_regional.csv', index=False)
+    df_sales.to_csv('sales_regional.csv', index=False)
+    return tmp_path
@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+from assortment_dashboard import impact_frame
+
+
+def make_inputs(**rec):
+    cube = pd.DataFrame({'store_id': [3000], 'category': ['Grocery'], 'revenue': [1000.0], 'margin': [100.0],
+                         'spli': [70.0]})
+    cube.attrs['weeks'] = 10.0  # 70 days of history
+    products = pd.DataFrame({'sku_id': [50001, 50002], 'unit_price': [10.0, 20.0], 'unit_cost': [6.0, 10.0]})
+    recs = pd.DataFrame([{'store_id': 3000, 'category': 'Grocery', 'delete_sku_id': 50001, 'delete_spli': 14.0,
+                          'gap_width': 5.0, 'add_sku_id': 50002, 'add_linear_width': 5.0, **rec}])
+    return recs, cube, products
+
+
+def test_old_side_uses_the_scored_period_and_sku_margin():
+    frame = impact_frame(*make_inputs(spli_days=14)).set_index('Metric')
+    old, new = frame.iloc[:, 0], frame.iloc[:, 1]
+
+    # 14.0 SPLI x 5" over 2 weeks; the deleted SKU keeps 40% of its price
+    assert old['Weekly Revenue'] == pytest.approx(35.0)
+    assert old['Weekly Margin'] == pytest.approx(14.0)
+    # 70.0 SPLI x 5" over the cube's 10 weeks, at the category's 10% margin
+    assert new['Weekly Revenue'] == pytest.approx(35.0)
+    assert new['Weekly Margin'] == pytest.approx(3.5)
+
+
+def test_recs_without_spli_days_use_the_cube_history():
+    frame = impact_frame(*make_inputs()).set_index('Metric')
+
+    assert frame.iloc[:, 0]['Weekly Revenue'] == pytest.approx(7.0)
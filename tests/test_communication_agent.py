@@ -0,0 +1,37 @@
+import pandas as pd
+
+from communication_agent import get_ai_response, recommendation_prompts
+
+
+def make_rec(gap_width, add_linear_width, **extra):
+    return {'store_id': 3004, 'category': 'Grocery', 'shelf_id': 30,
+            'delete_sku_id': 50086, 'delete_product_name': 'Grocery Item 86', 'delete_spli': 11.68,
+            'delete_facings': 1, 'gap_width': gap_width, 'gap_height': 8.0,
+            'add_sku_id': 50134, 'add_product_name': 'Grocery Item 134', 'add_width': 3.0,
+            'add_facings': int(add_linear_width // 3), 'add_linear_width': add_linear_width, 'add_unit_price': 69.5,
+            **extra}
+
+
+def responses(rec):
+    prompts = {role: prompt for _, role, prompt in recommendation_prompts(pd.DataFrame([rec]))}
+    return prompts, {role: get_ai_response(prompt) for role, prompt in prompts.items()}
+
+
+def test_shelf_space_rec_quotes_the_real_gap():
+    prompts, replies = responses(make_rec(3.0, 6.0, shelf_space_width=7.0))
+
+    assert 'Matches 3.0" gap plus 3" of free space on the same shelf' in prompts['merchant']
+    assert 'empty 3" gap plus 3" of free space on the same shelf' in prompts['ops']
+    assert 'allocating 3 inches of shelf space' in replies['merchant']
+    assert '6 inches' not in replies['merchant'] and 'exact' not in replies['merchant']
+    assert 'plus 3" of free space' in replies['merchant']
+    assert 'Fits exactly' not in replies['ops'] and '3 inches of free space' in replies['ops']
+
+
+def test_plain_rec_matches_its_gap():
+    prompts, replies = responses(make_rec(6.0, 6.0))
+
+    assert 'Matches 6.0" gap).' in prompts['merchant']
+    assert 'free space' not in prompts['merchant'] + prompts['ops']
+    assert 'Matches the exact 6" gap' in replies['merchant']
+    assert 'Fits exactly' in replies['ops']
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_loader
+import data_warehouse
+from data_warehouse import connect, load_warehouse
+from logic_engine import (load_master_data, aggregate_store_sales, compute_performance, find_delete_candidates,
+                          run_sql_batch)
+
+ROLLUPS = ['rollup_store_sku', 'rollup_store_category_week', 'rollup_spli',
+           'rollup_store_category', 'rollup_category_format', 'rollup_category_traffic']
+
+
+def drop_rollups(db_path):
+    conn = connect(db_path)
+    for table in ROLLUPS:
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.commit()
+    conn.close()
+
+
+def rollup_totals(db_path):
+    conn = connect(db_path)
+    totals = {
+        'sales': conn.execute("SELECT COUNT(*), ROUND(SUM(revenue), 2) FROM sales").fetchone(),
+        'store_sku': conn.execute("SELECT COUNT(*), ROUND(SUM(revenue), 2) FROM rollup_store_sku").fetchone(),
+        'week': conn.execute("SELECT ROUND(SUM(revenue), 2) FROM rollup_store_category_week").fetchone()[0],
+        'spli': conn.execute("SELECT ROUND(SUM(revenue), 2) FROM rollup_spli").fetchone()[0],
+        'traffic': conn.execute("SELECT SUM(total_units) FROM rollup_category_traffic").fetchone()[0],
+        'units': conn.execute("SELECT SUM(units_sold) FROM sales").fetchone()[0],
+    }
+    conn.close()
+    return totals
+
+
+def test_rerun_builds_missing_rollups(regional_data):
+    db_path = str(regional_data / 'warehouse.db')
+    load_warehouse(db_path)
+    built = rollup_totals(db_path)
+
+    # A warehouse from before the rollups existed: sales loaded, no rollup tables
+    drop_rollups(db_path)
+    _, rows = load_warehouse(db_path)
+    assert rows == 0
+
+    upgraded = rollup_totals(db_path)
+    assert upgraded == built
+    assert upgraded['store_sku'][0] > 0
+    assert upgraded['store_sku'][1] == upgraded['sales'][1] == upgraded['week']
+    assert upgraded['traffic'] == upgraded['units']
+
+
+def test_empty_rollups_are_rebuilt(regional_data):
+    db_path = str(regional_data / 'warehouse.db')
+    load_warehouse(db_path)
+    conn = connect(db_path)
+    conn.execute("DELETE FROM rollup_store_sku")
+    conn.commit()
+    data_warehouse.refresh_rollups(conn, after_date=conn.execute("SELECT MAX(date) FROM sales").fetchone()[0])
+    conn.close()
+    totals = rollup_totals(db_path)
+    assert totals['store_sku'][1] == totals['sales'][1]
+
+
+def sql_deletes(db_path, window_days=None):
+    return pd.concat(list(data_warehouse.iter_delete_candidates(db_path, window_days)), ignore_index=True)
+
+
+def test_sql_delete_candidates_match_in_memory(regional_data):
+    db_path = str(regional_data / 'warehouse.db')
+    load_warehouse(db_path)
+    df_plano, df_products, _ = load_master_data()
+    store_sales = aggregate_store_sales(data_loader.load_sales())
+    expected = find_delete_candidates(compute_performance(store_sales, df_plano, df_products))
+
+    got = sql_deletes(db_path)
+    assert got[['store_id', 'sku_id']].astype('int64').equals(expected[['store_id', 'sku_id']].astype('int64'))
+    assert np.allclose(got['SPLI'], expected['SPLI'])
+
+
+def test_sql_refuses_rollups_without_metadata(regional_data):
+    db_path = str(regional_data / 'warehouse.db')
+    load_warehouse(db_path)
+    conn = connect(db_path)
+    conn.execute("DROP TABLE rollup_meta")
+    conn.commit()
+    conn.close()
+    with pytest.raises(RuntimeError, match="data_warehouse.py"):
+        sql_deletes(db_path)
+
+
+def test_sql_refuses_stale_rollups(regional_data):
+    db_path = str(regional_data / 'warehouse.db')
+    load_warehouse(db_path)
+    conn = connect(db_path)
+    # A sales day that arrived without a rollup refresh
+    conn.execute("INSERT INTO sales SELECT date(date, '+1 day'), store_id, sku_id, units_sold, revenue, margin "
+                 "FROM sales WHERE date = (SELECT MAX(date) FROM sales)")
+    conn.commit()
+    conn.close()
+    with pytest.raises(RuntimeError, match="data_warehouse.py"):
+        sql_deletes(db_path)
+    assert len(sql_deletes(db_path, window_days=7))  # Windows read the sales rows, not the rollups
+
+    load_warehouse(db_path)
+    assert len(sql_deletes(db_path))
+    totals = rollup_totals(db_path)
+    assert totals['store_sku'][1] == totals['sales'][1]
+
+
+def test_sql_refuses_rollups_of_an_old_warehouse(regional_data):
+    db_path = str(regional_data / 'warehouse.db')
+    load_warehouse(db_path)
+    conn = connect(db_path)
+    conn.execute("DELETE FROM rollup_store_sku")
+    conn.commit()
+    conn.close()
+    with pytest.raises(RuntimeError, match="data_warehouse.py"):
+        sql_deletes(db_path)
+
+
+def test_sql_batch_with_no_candidates(regional_data):
+    db_path = str(regional_data / 'warehouse.db')
+    load_warehouse(db_path)
+    conn = connect(db_path)
+    conn.execute("DELETE FROM planogram")
+    conn.commit()
+    data_warehouse.refresh_rollups(conn)
+    conn.close()
+
+    df_plano, df_products, _ = load_master_data()
+    for window_days in (None, 7):
+        for pack in (False, True):
+            recs = run_sql_batch(df_plano, df_products, db_path, window_days, pack=pack)
+            assert recs.empty
+            assert {'store_id', 'category', 'delete_sku_id', 'gap_width', 'add_sku_id'} <= set(recs.columns)
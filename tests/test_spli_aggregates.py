@@ -0,0 +1,150 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+
+from logic_engine import refreshed_aggregates
+from partitioned_sales import PartitionedSalesWriter, PARTITION_DIR, MANIFEST_FILE, read_manifest
+from spli_aggregates import SalesAggregates
+
+
+def make_sales(days=10, stores=3, skus=4, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [(date.strftime('%Y-%m-%d'), store, sku)
+            for date in pd.date_range('2024-01-01', periods=days)
+            for store in range(1, stores + 1) for sku in range(1, skus + 1) if rng.random() < 0.7]
+    df = pd.DataFrame(rows, columns=['date', 'store_id', 'sku_id'])
+    df['units_sold'] = rng.integers(1, 5, len(df))
+    df['revenue'] = (df['units_sold'] * rng.uniform(1, 10, len(df))).round(2)
+    df['margin'] = (df['revenue'] * 0.3).round(2)
+    return df
+
+
+def expected_totals(df, days):
+    dates = pd.to_datetime(df['date'])
+    window = df[dates > dates.max() - pd.Timedelta(days=days)]
+    return window.groupby(['store_id', 'sku_id'])['revenue'].sum()
+
+
+def window_revenue(aggregates, days):
+    totals = aggregates.window_totals(days)
+    return totals.set_index(['store_id', 'sku_id'])['revenue']
+
+
+def write_partitions(df):
+    with PartitionedSalesWriter() as writer:
+        for date, df_day in df.groupby('date'):
+            writer.write(pd.Timestamp(date).to_pydatetime(), df_day)
+
+
+def test_window_totals_match_raw_sales(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = make_sales()
+    df.to_csv('sales_regional.csv', index=False)
+
+    aggregates = refreshed_aggregates()
+    for days in (3, 7, None):
+        got = window_revenue(aggregates, days)
+        want = expected_totals(df, days or 10)
+        pd.testing.assert_series_equal(got[got > 0].sort_index(), want.sort_index(), check_names=False)
+
+
+def test_long_windows_read_checkpoints(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = make_sales(days=100)
+    late = pd.DataFrame([{'date': '2024-03-15', 'store_id': 9, 'sku_id': 99, 'units_sold': 1, 'revenue': 5.0,
+                          'margin': 1.5}])  # A pair first sold after a few checkpoints
+    df = pd.concat([df, late], ignore_index=True).sort_values('date', kind='stable')
+    df.to_csv('sales_regional.csv', index=False)
+    refreshed_aggregates()
+    aggregates = SalesAggregates.load_or_create()
+    assert len(aggregates.checkpoint_counts) == 100 // 28 + 1
+    assert not aggregates._direct(*aggregates.window_bounds(90))
+
+    dates = pd.to_datetime(df['date'])
+    for days, end_date in [(90, None), (60, '2024-03-20'), (29, '2024-02-28'), (5, None)]:
+        end = pd.Timestamp(end_date) if end_date else dates.max()
+        window = df[(dates > end - pd.Timedelta(days=days)) & (dates <= end)]
+        want = window.groupby(['store_id', 'sku_id'])['revenue'].sum()
+        got = aggregates.window_totals(days, end_date).set_index(['store_id', 'sku_id'])['revenue']
+        pd.testing.assert_series_equal(got[got != 0].sort_index(), want.sort_index(), check_names=False)
+        assert aggregates.pair_total(9, 99, days=days, end_date=end_date) == pytest.approx(want.get((9, 99), 0.0))
+
+
+def test_skipped_days_are_empty(tmp_path):
+    df = make_sales(days=3)
+    aggregates = SalesAggregates()
+    aggregates.append_day('2024-01-01', df[df['date'] == '2024-01-01'])
+    aggregates.append_day('2024-01-04', df[df['date'] == '2024-01-03'])
+    assert aggregates.n_days == 4
+    assert window_revenue(aggregates, 2).sum() == df.loc[df['date'] == '2024-01-03', 'revenue'].sum()
+    assert window_revenue(aggregates, 3).sum() == window_revenue(aggregates, 2).sum()
+
+
+def test_rebuilds_when_csv_changes_over_same_dates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = make_sales()
+    df.to_csv('sales_regional.csv', index=False)
+    refreshed_aggregates()
+
+    changed = df.assign(revenue=df['revenue'] * 2)
+    changed.to_csv('sales_regional.csv', index=False)
+    got = window_revenue(refreshed_aggregates(), 7)
+    pd.testing.assert_series_equal(got[got > 0].sort_index(), expected_totals(changed, 7).sort_index(),
+                                   check_names=False)
+
+
+def test_days_appended_to_csv_fold_in_incrementally(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = make_sales()
+    first = df['date'] <= '2024-01-07'
+    df[first].to_csv('sales_regional.csv', index=False)
+    refreshed_aggregates()
+
+    df[~first].to_csv('sales_regional.csv', mode='a', header=False, index=False)
+    assert SalesAggregates.load_or_create().n_days == 7  # Folded rows unchanged: reused
+    aggregates = refreshed_aggregates()
+    assert aggregates.n_days == 10
+    got = window_revenue(aggregates, None)
+    pd.testing.assert_series_equal(got[got > 0].sort_index(), expected_totals(df, 10).sort_index(),
+                                   check_names=False)
+
+
+def test_rebuilds_when_partitions_change_over_same_dates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = make_sales()
+    write_partitions(df)
+    refreshed_aggregates()
+
+    changed = df.assign(revenue=df['revenue'] + 1)
+    write_partitions(changed)
+    got = window_revenue(refreshed_aggregates(), 7)
+    pd.testing.assert_series_equal(got[got > 0].sort_index(), expected_totals(changed, 7).sort_index(),
+                                   check_names=False)
+
+
+def test_new_partitions_fold_in_incrementally(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = make_sales()
+    write_partitions(df)
+    manifest = read_manifest()
+    os.rename(PARTITION_DIR, 'all_partitions')
+
+    # Publish the first 7 days, then the rest, the way a daily feed lands
+    os.makedirs(PARTITION_DIR)
+    for count in (7, 10):
+        for part in manifest['partitions'][:count]:
+            if not os.path.exists(os.path.join(PARTITION_DIR, part['file'])):
+                shutil.copy2(os.path.join('all_partitions', part['file']), PARTITION_DIR)
+        with open(os.path.join(PARTITION_DIR, MANIFEST_FILE), 'w') as f:
+            json.dump({**manifest, 'partitions': manifest['partitions'][:count]}, f)
+        if count == 10:
+            assert SalesAggregates.load_or_create().n_days == 7  # Folded days unchanged: reused
+        aggregates = refreshed_aggregates()
+        assert aggregates.n_days == count
+
+    got = window_revenue(aggregates, None)
+    pd.testing.assert_series_equal(got[got > 0].sort_index(), expected_totals(df, 10).sort_index(),
+                                   check_names=False)